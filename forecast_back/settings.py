@@ -52,11 +52,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "main.compression.CompressionMiddleware",  # brotli / gzip, sees the final body
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "main.language_negotiation.LanguageNegotiationMiddleware",  # Accept-Language, once per request
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "main.middleware.RateLimitMiddleware",  # Rate limiting
@@ -93,6 +95,71 @@ DATABASES = {
     }
 }
 
+# SQLite production profile (default when DEBUG is off): WAL journal so readers
+# never block the writer, BEGIN IMMEDIATE so writers queue on the busy timeout
+# instead of failing with "database is locked", and persistent connections.
+SQLITE_PRODUCTION = config('SQLITE_PRODUCTION', default=str(not DEBUG), cast=str_to_bool)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=128 * 1024 * 1024, cast=int),  # bytes
+    'cache_size': -config('SQLITE_CACHE_SIZE_KB', default=20000, cast=int),  # negative = KiB
+    'temp_store': 'MEMORY',
+}
+SQLITE_BUSY_TIMEOUT = config('SQLITE_BUSY_TIMEOUT', default=20, cast=int)  # seconds
+
+# 'sqlite' (default) or 'postgres'
+DATABASE_ENGINE = config('DATABASE_ENGINE', default='sqlite')
+
+if DATABASE_ENGINE == 'sqlite' and SQLITE_PRODUCTION:
+    DATABASES["default"].update({
+        "CONN_MAX_AGE": config('DB_CONN_MAX_AGE', default=600, cast=int),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "transaction_mode": "IMMEDIATE",
+            "timeout": SQLITE_BUSY_TIMEOUT,
+            "init_command": "".join(
+                f"PRAGMA {name}={value};" for name, value in SQLITE_PRAGMAS.items()
+            ),
+        },
+    })
+
+# PostgreSQL profile: primary plus optional read replicas (same credentials).
+# With POSTGRES_POOL on, connections come from a psycopg pool per process;
+# Django requires CONN_MAX_AGE=0 in that case, otherwise connections persist.
+if DATABASE_ENGINE == 'postgres':
+    POSTGRES_POOL = config('POSTGRES_POOL', default='True', cast=str_to_bool)
+    _postgres = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": config('POSTGRES_DB', default='forecast'),
+        "USER": config('POSTGRES_USER', default='forecast'),
+        "PASSWORD": config('POSTGRES_PASSWORD', default=''),
+        "PORT": config('POSTGRES_PORT', default='5432'),
+        "CONN_MAX_AGE": 0 if POSTGRES_POOL else config('DB_CONN_MAX_AGE', default=600, cast=int),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
+    }
+    if POSTGRES_POOL:
+        _postgres["OPTIONS"]["pool"] = {
+            "min_size": config('POSTGRES_POOL_MIN_SIZE', default=2, cast=int),
+            "max_size": config('POSTGRES_POOL_MAX_SIZE', default=10, cast=int),
+            "timeout": config('POSTGRES_POOL_TIMEOUT', default=10, cast=int),
+        }
+    DATABASES = {
+        "default": {**_postgres, "HOST": config('POSTGRES_HOST', default='localhost')},
+    }
+    for _index, _host in enumerate(config('POSTGRES_REPLICA_HOSTS', default='', cast=Csv())):
+        DATABASES[f"replica_{_index}"] = {
+            **_postgres,
+            "HOST": _host,
+            "TEST": {"MIRROR": "default"},
+        }
+
+# Read replicas used by main.db_routers.PrimaryReplicaRouter for views that
+# opt in to replica reads; everything else uses the primary
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+DATABASE_ROUTERS = ['main.db_routers.PrimaryReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -142,8 +209,91 @@ MEDIA_URL = "/media/"
 # Media Root URL for external access
 MEDIA_ROOT_URL = config('MEDIA_ROOT_URL', default='http://localhost:8000')
 
+# Who sends media files (main.media_delivery): 'django' (the worker, via
+# FileResponse/sendfile, with Range support), 'nginx' (X-Accel-Redirect to
+# MEDIA_ACCEL_REDIRECT_PREFIX, an internal location aliasing MEDIA_ROOT) or
+# 'sendfile' (X-Sendfile for Apache mod_xsendfile / lighttpd)
+_media_delivery = config('MEDIA_DELIVERY', default='')
+MEDIA_DELIVERY = _media_delivery or 'django'
+# MEDIA_URL is routed to Django with DEBUG on, or when MEDIA_DELIVERY is set;
+# otherwise the front-end server is expected to serve MEDIA_ROOT itself
+SERVE_MEDIA = DEBUG or bool(_media_delivery)
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+MEDIA_CACHE_MAX_AGE = config('MEDIA_CACHE_MAX_AGE', default=86400, cast=int)  # seconds
+# Tarot card image sizes (WIDTHxHEIGHT) whose resized copies are stored under
+# MEDIA_ROOT/renditions; other sizes are resized per request and not stored
+TAROT_IMAGE_SIZES = config('TAROT_IMAGE_SIZES', default='140x220,280x440,420x660', cast=Csv())
+
+# Where uploads are stored: 'filesystem' (MEDIA_ROOT, default) or 's3' for
+# any S3-compatible service, e.g. MinIO locally (django-storages[s3] and boto3,
+# in requirements.txt).
+# Code only uses the storage API, so switching needs no other change; copy
+# existing files to the bucket first.
+MEDIA_STORAGE = config('MEDIA_STORAGE', default='filesystem')
+
+if MEDIA_STORAGE == 's3':
+    _media_storage = {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            'bucket_name': config('S3_BUCKET_NAME', default='media'),
+            # e.g. http://127.0.0.1:9000 for MinIO; empty for AWS
+            'endpoint_url': config('S3_ENDPOINT_URL', default='') or None,
+            'access_key': config('S3_ACCESS_KEY_ID', default=''),
+            'secret_key': config('S3_SECRET_ACCESS_KEY', default=''),
+            'region_name': config('S3_REGION_NAME', default='') or None,
+            # Public host serving the bucket; signed URLs are used without it
+            'custom_domain': config('S3_CUSTOM_DOMAIN', default='') or None,
+            'querystring_auth': not config('S3_CUSTOM_DOMAIN', default=''),
+            'file_overwrite': False,
+        },
+    }
+else:
+    _media_storage = {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    }
+
+# Uploads are written by a pool of UPLOAD_WRITER_WORKERS threads per process
+# (0 = in the request thread); past UPLOAD_WRITER_QUEUE_SIZE writes in flight
+# the request thread writes itself
+UPLOAD_WRITER_WORKERS = config('UPLOAD_WRITER_WORKERS', default=4, cast=int)
+UPLOAD_WRITER_QUEUE_SIZE = config('UPLOAD_WRITER_QUEUE_SIZE', default=32, cast=int)
+
+# How coffee cup images reach the vision model (main.vision): 'inline' sends
+# them in the request as base64 data URLs, resized to COFFEE_IMAGE_MAX_SIZE px
+# (0 = as uploaded); 'url' sends MEDIA_ROOT_URL links the provider fetches,
+# which needs publicly served media
+COFFEE_IMAGE_DELIVERY = config('COFFEE_IMAGE_DELIVERY', default='inline')
+COFFEE_IMAGE_MAX_SIZE = config('COFFEE_IMAGE_MAX_SIZE', default=1024, cast=int)
+COFFEE_IMAGE_QUALITY = config('COFFEE_IMAGE_QUALITY', default=85, cast=int)
+
+STORAGES = {
+    'default': _media_storage,
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 # REST Framework Configuration
+# JSON for API requests and responses: 'orjson' (main.renderers, faster,
+# same output; needs the orjson package) or 'stdlib' (DRF's json-based classes)
+API_JSON_BACKEND = config('API_JSON_BACKEND', default='orjson')
+if API_JSON_BACKEND == 'orjson':
+    _json_renderer = 'main.renderers.ORJSONRenderer'
+    _json_parser = 'main.renderers.ORJSONParser'
+else:
+    _json_renderer = 'rest_framework.renderers.JSONRenderer'
+    _json_parser = 'rest_framework.parsers.JSONParser'
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        _json_renderer,
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        _json_parser,
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
@@ -175,6 +325,38 @@ if not DEBUG:
     X_FRAME_OPTIONS = 'DENY'
 
 # Logging Configuration
+# File handlers only queue records; a thread per process formats and writes
+# them (main.logging_pipeline), so log I/O stays off the request path.
+# LOG_FORMAT: 'json' (one object per line) or 'verbose' (plain text).
+# LOG_SAMPLING keeps a fraction of the records below WARNING per logger,
+# e.g. 'main=0.2,django.server=0.05' (unlisted loggers keep everything).
+LOG_FORMAT = config('LOG_FORMAT', default='json')
+LOG_MAX_BYTES = config('LOG_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+LOG_BACKUP_COUNT = config('LOG_BACKUP_COUNT', default=5, cast=int)
+LOG_QUEUE_SIZE = config('LOG_QUEUE_SIZE', default=10000, cast=int)
+LOG_SAMPLING = {
+    name.strip(): rate
+    for name, _, rate in (item.rpartition('=') for item in config('LOG_SAMPLING', default='', cast=Csv()))
+}
+
+
+def _queued_file_handler(filename):
+    return {
+        '()': 'main.logging_pipeline.QueueListenerHandler',
+        'level': 'INFO',
+        'formatter': LOG_FORMAT,
+        'filters': ['sampling'],
+        'queue_size': LOG_QUEUE_SIZE,
+        'handler': {
+            'class': 'main.logging_pipeline.SharedRotatingFileHandler',
+            'filename': filename,
+            'maxBytes': LOG_MAX_BYTES,
+            'backupCount': LOG_BACKUP_COUNT,
+            'encoding': 'utf-8',
+        },
+    }
+
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -187,25 +369,22 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'main.logging_pipeline.JSONFormatter',
+        },
     },
     'filters': {
         'require_debug_true': {
             '()': 'django.utils.log.RequireDebugTrue',
         },
+        'sampling': {
+            '()': 'main.logging_pipeline.SamplingFilter',
+            'rates': LOG_SAMPLING,
+        },
     },
     'handlers': {
-        'file': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': 'django.log',
-            'formatter': 'verbose',
-        },
-        'file_error': {
-            'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': 'django_error.log',
-            'formatter': 'verbose',
-        },
+        'file': _queued_file_handler('django.log'),
+        'file_error': _queued_file_handler('django_error.log'),
         'console': {
             'level': 'INFO',
             'filters': ['require_debug_true'],
@@ -253,11 +432,142 @@ SPECTACULAR_SETTINGS = {
 RATE_LIMIT_PER_MINUTE = config('RATE_LIMIT_PER_MINUTE', default=10, cast=int)
 
 # Cache Configuration (for rate limiting)
-CACHES = {
-    'default': {
+# Prompt texts (main/prompts/*.json) are re-read when changed, checked at most
+# every PROMPTS_RELOAD_INTERVAL seconds (0 = never). PROMPTS_WARMUP_LANGUAGES
+# are loaded at startup ('*' = all), the rest on first use.
+PROMPTS_RELOAD_INTERVAL = config('PROMPTS_RELOAD_INTERVAL', default=5, cast=int)
+PROMPTS_WARMUP_LANGUAGES = config('PROMPTS_WARMUP_LANGUAGES', default='en,fa', cast=Csv())
+
+# Cache backend shared by all workers (rate limits, budget counters, payloads):
+# 'sqlite' (on-host file with atomic add/incr, default when DEBUG is off),
+# 'redis' (needs the redis package), 'memcached' (needs pymemcache) or
+# 'locmem' (per process, default in development).
+CACHE_BACKEND = config('CACHE_BACKEND', default='locmem' if DEBUG else 'sqlite')
+CACHE_LOCATION = config('CACHE_LOCATION', default='')
+
+if CACHE_BACKEND == 'redis':
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_LOCATION or 'redis://127.0.0.1:6379/1',
+    }
+elif CACHE_BACKEND == 'memcached':
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_LOCATION or '127.0.0.1:11211',
+    }
+elif CACHE_BACKEND == 'sqlite':
+    _default_cache = {
+        'BACKEND': 'main.cache_backends.SQLiteCache',
+        'LOCATION': CACHE_LOCATION or str(BASE_DIR / 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=100000, cast=int),
+        },
+    }
+else:
+    _default_cache = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
     }
+
+CACHES = {
+    'default': _default_cache,
+}
+
+# In-process L1 in front of the shared cache for hot keys (main.caching)
+CACHE_L1_SIZE = config('CACHE_L1_SIZE', default=1024, cast=int)
+CACHE_L1_TIMEOUT = config('CACHE_L1_TIMEOUT', default=5, cast=int)  # seconds
+# Seconds the serialized tarot deck is cached per language/image size
+TAROT_CARDS_CACHE_TIMEOUT = config('TAROT_CARDS_CACHE_TIMEOUT', default=300, cast=int)
+# Seconds clients may reuse the deck before revalidating it (a 304 when unchanged)
+TAROT_CARDS_MAX_AGE = config('TAROT_CARDS_MAX_AGE', default=300, cast=int)
+
+# Response compression (main.compression): brotli if the brotli package is
+# installed and the client accepts it, otherwise gzip. Smaller responses are
+# sent uncompressed.
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)  # bytes
+COMPRESSION_BROTLI_QUALITY = config('COMPRESSION_BROTLI_QUALITY', default=5, cast=int)  # 0-11
+COMPRESSION_GZIP_LEVEL = config('COMPRESSION_GZIP_LEVEL', default=6, cast=int)  # 1-9
+
+# Single-flight for identical concurrent readings (main.singleflight): how long
+# followers wait for the running call, and how long its result is shared
+SINGLE_FLIGHT_TIMEOUT = config('SINGLE_FLIGHT_TIMEOUT', default=90, cast=int)  # seconds
+SINGLE_FLIGHT_RESULT_TTL = config('SINGLE_FLIGHT_RESULT_TTL', default=10, cast=int)  # seconds
+
+# Token Usage Accounting
+# Usage entries are buffered in memory and flushed in batches
+USAGE_FLUSH_SIZE = config('USAGE_FLUSH_SIZE', default=50, cast=int)
+USAGE_FLUSH_INTERVAL = config('USAGE_FLUSH_INTERVAL', default=10, cast=int)  # seconds
+# Failed flushes before an entry is dropped, and entries buffered at most
+USAGE_FLUSH_MAX_RETRIES = config('USAGE_FLUSH_MAX_RETRIES', default=5, cast=int)
+USAGE_BUFFER_MAX = config('USAGE_BUFFER_MAX', default=10000, cast=int)
+# Default per-user daily token budget (0 = unlimited), overridable per user in admin
+DEFAULT_DAILY_TOKEN_BUDGET = config('DEFAULT_DAILY_TOKEN_BUDGET', default=0, cast=int)
+
+# Prompt Token Budgets
+# Maximum input tokens per endpoint for the per-request user message (text
+# only, the cacheable system prefix is not counted); profile notes and dream
+# text are trimmed to fit
+PROMPT_TOKEN_BUDGETS = {
+    'coffee': config('PROMPT_TOKEN_BUDGET_COFFEE', default=600, cast=int),
+    'horoscope': config('PROMPT_TOKEN_BUDGET_HOROSCOPE', default=700, cast=int),
+    'iching': config('PROMPT_TOKEN_BUDGET_ICHING', default=800, cast=int),
+    'dream': config('PROMPT_TOKEN_BUDGET_DREAM', default=1500, cast=int),
+    'tarot': config('PROMPT_TOKEN_BUDGET_TAROT', default=1800, cast=int),
+}
+
+# Model Routing (see main/llm.py)
+OPENAI_API_KEY = config('OPENAI_API_KEY', default=None)
+# Settings per stage; LLM_ROUTES below override them per endpoint.
+# 'base_url' points a route at any OpenAI-compatible server (e.g. a local model).
+LLM_STAGE_DEFAULTS = {
+    'reading': {
+        'model': config('LLM_READING_MODEL', default='gpt-4o-mini'),
+        'max_tokens': config('LLM_READING_MAX_TOKENS', default=1500, cast=int),
+        'timeout': config('LLM_READING_TIMEOUT', default=60, cast=float),
+        'downgrade_model': config('LLM_READING_DOWNGRADE_MODEL', default='gpt-4.1-nano'),
+    },
+    'questions': {
+        'model': config('LLM_QUESTIONS_MODEL', default='gpt-4.1-nano'),
+        'max_tokens': config('LLM_QUESTIONS_MAX_TOKENS', default=150, cast=int),
+        'timeout': config('LLM_QUESTIONS_TIMEOUT', default=10, cast=float),
+        'base_url': config('LLM_QUESTIONS_BASE_URL', default=''),
+        'api_key': config('LLM_QUESTIONS_API_KEY', default=''),
+    },
+}
+LLM_ROUTES = {
+    'coffee': {
+        'reading': {
+            'model': config('LLM_COFFEE_MODEL', default='gpt-4o-mini'),
+            # Downgrade target must accept images
+            'downgrade_model': config('LLM_COFFEE_DOWNGRADE_MODEL', default='gpt-4o-mini'),
+        },
+    },
+    'horoscope': {'reading': {'model': config('LLM_HOROSCOPE_MODEL', default='gpt-4o-mini')}},
+    'iching': {'reading': {'model': config('LLM_ICHING_MODEL', default='gpt-4o-mini')}},
+    'dream': {'reading': {'model': config('LLM_DREAM_MODEL', default='gpt-4o-mini')}},
+    'tarot': {
+        'reading': {
+            'model': config('LLM_TAROT_MODEL', default='gpt-4o-mini'),
+            'max_tokens': config('LLM_TAROT_MAX_TOKENS', default=2500, cast=int),
+        },
+    },
+}
+# Switch to 'downgrade_model' when this many model calls are in flight in
+# the process (0 = never) ...
+LLM_DOWNGRADE_IN_FLIGHT = config('LLM_DOWNGRADE_IN_FLIGHT', default=8, cast=int)
+# ... or when a user has used this share of their daily token budget
+LLM_DOWNGRADE_BUDGET_RATIO = config('LLM_DOWNGRADE_BUDGET_RATIO', default=0.8, cast=float)
+
+# Continuation Questions (see main/question_generator.py)
+# 'llm' = small model call with the local generator as fallback,
+# 'local' = rule-based generator only (no model call)
+CONTINUATION_QUESTIONS_DEFAULT_MODE = config('CONTINUATION_QUESTIONS_MODE', default='llm')
+CONTINUATION_QUESTIONS_MODE = {
+    'default': CONTINUATION_QUESTIONS_DEFAULT_MODE,
+    'coffee': config('CONTINUATION_QUESTIONS_MODE_COFFEE', default=CONTINUATION_QUESTIONS_DEFAULT_MODE),
+    'horoscope': config('CONTINUATION_QUESTIONS_MODE_HOROSCOPE', default=CONTINUATION_QUESTIONS_DEFAULT_MODE),
+    'iching': config('CONTINUATION_QUESTIONS_MODE_ICHING', default=CONTINUATION_QUESTIONS_DEFAULT_MODE),
+    'dream': config('CONTINUATION_QUESTIONS_MODE_DREAM', default=CONTINUATION_QUESTIONS_DEFAULT_MODE),
 }
 
 # File Cleanup Settings
@@ -16,15 +16,36 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from django.utils.module_loading import import_string
+from main.media_delivery import serve_media
+
+
+def lazy_view(dotted_path, **initkwargs):
+    """Import a class-based view on its first request instead of at startup"""
+    view = None
+
+    def dispatch(request, *args, **kwargs):
+        nonlocal view
+        if view is None:
+            view = import_string(dotted_path).as_view(**initkwargs)
+        return view(request, *args, **kwargs)
+
+    return dispatch
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/v1/", include("main.urls")),
     # API Documentation
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # (drf-spectacular's views are only imported when the docs are requested)
+    path('api/schema/', lazy_view('drf_spectacular.views.SpectacularAPIView'), name='schema'),
+    path('api/docs/', lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='schema'), name='swagger-ui'),
+]
+
+if settings.SERVE_MEDIA:
+    # Uploaded files (sent by the front-end server with MEDIA_DELIVERY = 'nginx' / 'sendfile')
+    urlpatterns.append(
+        re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media')
+    )
@@ -0,0 +1,32 @@
+"""
+Gunicorn configuration.
+
+    gunicorn -c gunicorn.conf.py forecast_back.wsgi:application
+
+Settings come from the environment (or .env), see .env.example.
+"""
+import multiprocessing
+
+from decouple import config
+
+bind = config('GUNICORN_BIND', default='0.0.0.0:8000')
+workers = config('GUNICORN_WORKERS', default=multiprocessing.cpu_count() * 2 + 1, cast=int)
+threads = config('GUNICORN_THREADS', default=1, cast=int)
+# Readings wait up to a minute on the model
+timeout = config('GUNICORN_TIMEOUT', default=120, cast=int)
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound memory growth
+max_requests = config('GUNICORN_MAX_REQUESTS', default=1000, cast=int)
+max_requests_jitter = 100
+
+# Load the app once in the master and fork workers from it: workers start
+# faster and share the loaded code and data copy-on-write
+preload_app = config('GUNICORN_PRELOAD', default=True, cast=bool)
+
+
+def when_ready(server):
+    # Runs in the master before the first workers are forked
+    if preload_app:
+        from main.startup import preload
+        preload()
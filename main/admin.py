@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
 from django.utils.html import format_html
-from .models import CustomUser, File, FortuneProfile, TarotCard
+from .models import CustomUser, File, FortuneProfile, TarotCard, TokenUsage, DailyTokenUsage
 
 
 @admin.register(CustomUser)
@@ -34,6 +34,9 @@ class CustomUserAdmin(BaseUserAdmin):
             'fields': ('is_active', 'is_staff', 'is_superuser', 'is_verified', 
                       'groups', 'user_permissions'),
         }),
+        (_('سقف مصرف'), {
+            'fields': ('daily_token_budget',),
+        }),
         (_('تاریخ‌های مهم'), {
             'fields': ('last_login', 'date_joined', 'created_at', 'updated_at'),
         }),
@@ -125,3 +128,39 @@ class TarotCardAdmin(admin.ModelAdmin):
             )
         return format_html('<span style="color: #999;">بدون عکس</span>')
     image_preview.short_description = 'پیش‌نمایش عکس'
+
+
+@admin.register(TokenUsage)
+class TokenUsageAdmin(admin.ModelAdmin):
+    """Admin interface for per-call token usage ledger"""
+    
+    list_display = ['id', 'endpoint', 'stage', 'language', 'model', 'user',
+                    'prompt_tokens', 'cached_tokens', 'completion_tokens', 'total_tokens', 'created_at']
+    list_filter = ['endpoint', 'stage', 'model', 'language', 'created_at']
+    search_fields = ['user__username', 'user__email', 'model']
+    readonly_fields = ['user', 'endpoint', 'stage', 'language', 'model',
+                       'prompt_tokens', 'cached_tokens', 'completion_tokens', 'created_at']
+    date_hierarchy = 'created_at'
+    raw_id_fields = ['user']
+    list_select_related = ['user']
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(DailyTokenUsage)
+class DailyTokenUsageAdmin(admin.ModelAdmin):
+    """Admin interface for daily aggregated token usage"""
+    
+    list_display = ['day', 'endpoint', 'stage', 'language', 'model', 'user',
+                    'requests', 'prompt_tokens', 'cached_tokens', 'completion_tokens', 'total_tokens']
+    list_filter = ['day', 'endpoint', 'stage', 'model', 'language']
+    search_fields = ['user__username', 'user__email', 'model']
+    readonly_fields = ['day', 'user', 'endpoint', 'stage', 'language', 'model',
+                       'requests', 'prompt_tokens', 'cached_tokens', 'completion_tokens']
+    date_hierarchy = 'day'
+    raw_id_fields = ['user']
+    list_select_related = ['user']
+    
+    def has_add_permission(self, request):
+        return False
@@ -8,5 +8,8 @@ class MainConfig(AppConfig):
 
     def ready(self):
         """Called when Django starts"""
-        # Import signal handlers if you add them later
-        pass
+        # Signal handlers
+        from . import deck, usage  # noqa: F401
+        # Load the configured prompt languages before the first request
+        from .prompt_registry import registry
+        registry.warmup()
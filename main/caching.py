@@ -0,0 +1,167 @@
+"""
+Two-level cache for hot keys.
+
+L1 is a small in-process LRU with a short TTL (CACHE_L1_SIZE, CACHE_L1_TIMEOUT),
+so repeated reads in one worker never leave the process. L2 is the shared
+Django cache (see CACHES), so all workers agree and a miss is computed once.
+
+``get_or_set`` protects a key against stampedes: within a process one thread
+computes while the others wait on a per-key lock, and across workers the
+first process to ``add`` a lock key computes while the others poll L2 for the
+result.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+logger = logging.getLogger('main')
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            if entry[1] <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache:
+    """
+    L1 (in-process LRU) in front of L2 (a shared Django cache).
+
+    Args:
+        alias: CACHES alias used as L2
+        l1_size: Maximum number of L1 entries
+        l1_timeout: Seconds an entry lives in L1; bounds how long a worker can
+            serve a value another worker has already replaced
+        lock_timeout: Seconds the cross-worker compute lock is held at most
+    """
+
+    def __init__(self, alias='default', l1_size=None, l1_timeout=None, lock_timeout=30):
+        self.alias = alias
+        self.l1 = LocalLRU(
+            l1_size or getattr(settings, 'CACHE_L1_SIZE', 1024),
+            l1_timeout if l1_timeout is not None else getattr(settings, 'CACHE_L1_TIMEOUT', 5),
+        )
+        self.lock_timeout = lock_timeout
+        # Striped per-key locks: bounded memory, rare false sharing
+        self._key_locks = [threading.Lock() for _ in range(64)]
+
+    @property
+    def l2(self):
+        return caches[self.alias]
+
+    def get(self, key, default=None):
+        value = self.l1.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = self.l2.get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        self.l1.set(key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.l2.set(key, value, timeout)
+        self.l1.set(key, value, None if timeout in (DEFAULT_TIMEOUT, None) else timeout)
+
+    def delete(self, key):
+        self.l1.delete(key)
+        self.l2.delete(key)
+
+    def _key_lock(self, key):
+        return self._key_locks[hash(key) % len(self._key_locks)]
+
+    def get_or_set(self, key, compute, timeout=DEFAULT_TIMEOUT):
+        """
+        Get a value, computing and storing it once on a miss.
+
+        Args:
+            key: Cache key
+            compute: Callable returning the value (None is not cached)
+            timeout: L2 timeout in seconds (defaults to the cache's TIMEOUT)
+
+        Returns:
+            The cached or freshly computed value
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._key_lock(key):
+            # Another thread may have filled it while we waited
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+            lock_key = f'{key}:lock'
+            token = uuid.uuid4().hex
+            if not self.l2.add(lock_key, token, self.lock_timeout):
+                value = self._wait_for(key, lock_key)
+                if value is not _MISSING:
+                    return value
+                logger.warning("Gave up waiting for %s, computing it here", key)
+            try:
+                value = compute()
+                if value is not None:
+                    self.set(key, value, timeout)
+            finally:
+                if self.l2.get(lock_key) == token:
+                    self.l2.delete(lock_key)
+            return value
+
+    def _wait_for(self, key, lock_key):
+        """Poll L2 until another worker stores the value or drops its lock"""
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            value = self.l2.get(key, _MISSING)
+            if value is not _MISSING:
+                self.l1.set(key, value)
+                return value
+            if not self.l2.has_key(lock_key):
+                break
+            delay = min(delay * 2, 0.2)
+        return _MISSING
+
+
+# Shared instance for hot keys (deck payloads, glossaries)
+hot_cache = TieredCache()
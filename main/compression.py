@@ -0,0 +1,182 @@
+"""
+Response compression.
+
+``CompressionMiddleware`` compresses text responses (JSON, HTML, ...) of at
+least COMPRESSION_MIN_SIZE bytes with brotli when the client accepts it and
+the ``brotli`` package is installed, otherwise with gzip. Smaller responses
+gain nothing (they fit in a packet either way) and are sent as-is.
+
+Payloads served many times, such as the serialized tarot deck, are cached as
+a ``CompressedPayload``: the rendered body together with its brotli and gzip
+encodings at maximum quality, compressed once when the cache is filled. The
+middleware leaves responses that already have a Content-Encoding alone.
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BROTLI = 'br'
+GZIP = 'gzip'
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'application/vnd.oai.openapi',
+    'image/svg+xml',
+    'text/',
+)
+
+_ACCEPT_RE = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+def available_encodings():
+    """Encodings this process can produce, preferred first"""
+    return (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+
+def choose_encoding(accept_encoding):
+    """
+    Pick the response encoding for an ``Accept-Encoding`` header.
+
+    Args:
+        accept_encoding: Header value, e.g. 'gzip, deflate, br;q=0.9'
+
+    Returns:
+        str: 'br' or 'gzip', or None to send the body uncompressed
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.lower().split(','):
+        match = _ACCEPT_RE.match(part)
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        accepted[match.group(1)] = quality
+    wildcard = accepted.get('*', 0)
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(content, encoding, level=None):
+    """
+    Compress bytes.
+
+    Args:
+        content: Bytes to compress
+        encoding: 'br' or 'gzip'
+        level: brotli quality (0-11) or gzip level (1-9); defaults to
+            COMPRESSION_BROTLI_QUALITY / COMPRESSION_GZIP_LEVEL
+
+    Returns:
+        bytes
+    """
+    if encoding == BROTLI:
+        if level is None:
+            level = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+        return brotli.compress(content, quality=level)
+    if level is None:
+        level = getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(content, compresslevel=level, mtime=0)
+
+
+def is_compressible(content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) or content_type.endswith('+json')
+
+
+def _weaken_etag(response):
+    # The compressed body differs byte-for-byte from the uncompressed one
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+
+
+class CompressedPayload:
+    """
+    A rendered body with its compressed encodings, for caching.
+
+    Args:
+        content: Rendered body (bytes)
+        content_type: Content-Type of the body
+    """
+
+    __slots__ = ('content', 'content_type', 'encodings')
+
+    def __init__(self, content, content_type):
+        self.content = content
+        self.content_type = content_type
+        self.encodings = {}
+        if len(content) >= getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+            # Compressed once per cache fill, so use the best ratio
+            for encoding in available_encodings():
+                self.encodings[encoding] = compress(content, encoding, level=11 if encoding == BROTLI else 9)
+
+    def response(self, request, status=200):
+        """
+        Build a response with the best stored encoding the client accepts.
+
+        Returns:
+            HttpResponse
+        """
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        body = self.encodings.get(encoding)
+        response = HttpResponse(body or self.content, content_type=self.content_type, status=status)
+        if body is not None:
+            response['Content-Encoding'] = encoding
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Compress text responses with brotli or gzip.
+
+    Place it near the top of MIDDLEWARE, so it sees the final response body.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding'):
+            _weaken_etag(response)
+            return response
+        if response.streaming or not is_compressible(response.get('Content-Type')):
+            # Streamed responses are files (images), which are already compressed
+            return response
+        if 'no-transform' in response.get('Cache-Control', ''):
+            return response
+
+        # A cache must not give a compressed copy to a client that cannot read it
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None or len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        _weaken_etag(response)
+        return response
@@ -0,0 +1,86 @@
+"""
+Conditional GET for read endpoints.
+
+Views compute a cheap validator before doing the expensive part (queries,
+serialization): an ETag from the inputs the payload depends on (versions,
+``updated_at`` values, counts, the request path) and, where there is one, a
+Last-Modified time. ``conditional_response()`` answers ``If-None-Match`` /
+``If-Modified-Since`` with a 304 without calling ``build``, and sets ETag,
+Last-Modified, Cache-Control and Vary on both the 200 and the 304 (a 304
+must carry the headers the 200 would have).
+
+Cache-Control policies used by the API:
+
+- ``PRIVATE_REVALIDATE``: per-user data; clients keep a copy and revalidate
+  on every use (a 304 is a few hundred bytes)
+- ``public_max_age(n)`` / ``private_max_age(n)``: shared data (the deck),
+  reused for n seconds before revalidating
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+PRIVATE_REVALIDATE = 'private, no-cache'
+
+# Requests are authenticated by token or session cookie
+AUTH_VARY = ('Authorization', 'Cookie')
+
+
+def public_max_age(seconds):
+    return f'public, max-age={seconds}'
+
+
+def private_max_age(seconds):
+    return f'private, max-age={seconds}'
+
+
+def make_etag(*parts):
+    """
+    Strong ETag from the values a payload depends on.
+
+    Args:
+        *parts: Values with a stable str() (ids, versions, datetimes, paths)
+
+    Returns:
+        str: Quoted ETag
+    """
+    digest = hashlib.sha1('\x1f'.join(map(str, parts)).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def conditional_response(request, build, etag=None, last_modified=None, cache_control=None, vary=()):
+    """
+    Return a 304 if the client's copy is current, otherwise ``build()``.
+
+    Args:
+        request: Django or DRF request
+        build: Callable returning the full response
+        etag: Quoted ETag (see make_etag)
+        last_modified: Aware datetime of the newest data, or None
+        cache_control: Cache-Control value
+        vary: Request headers the response depends on
+
+    Returns:
+        HttpResponse: 304 (or 412 for a failed If-Match), or build()'s response
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = None
+    if request.method in ('GET', 'HEAD'):
+        response = get_conditional_response(
+            getattr(request, '_request', request), etag=etag, last_modified=timestamp
+        )
+    if response is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+
+    if etag:
+        response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    if cache_control:
+        response['Cache-Control'] = cache_control
+    if vary:
+        patch_vary_headers(response, vary)
+    return response
@@ -0,0 +1,76 @@
+"""
+Database routing between the primary and read replicas.
+
+Writes always go to the primary ('default'). Reads go to a replica only inside
+``replica_reads()``, which read-only views enable through ``ReplicaReadMixin``
+(class-based views) or ``read_from_replica`` (function views). Everything
+else keeps reading from the primary, so request handlers that write and then
+read never see replication lag.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+DEFAULT_DB_ALIAS = 'default'
+
+# HTTP methods that may be served from a replica
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """Route reads in this block (thread / task) to a replica, if any are configured"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """Send writes and migrations to the primary, opted-in reads to a random replica"""
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if replicas and _replica_reads.get():
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaReadMixin:
+    """
+    For DRF views: serve safe (read-only) requests from a replica.
+    Authentication runs inside dispatch, so the user lookup is routed too.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+def read_from_replica(view_func):
+    """Decorator for function views: serve safe requests from a replica"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return view_func(request, *args, **kwargs)
+        with replica_reads():
+            return view_func(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,180 @@
+"""
+In-memory index of the tarot deck.
+
+The deck changes only when an admin edits cards, yet every tarot request used
+to query it (sometimes three times). ``get_deck()`` returns an immutable
+snapshot loaded once per process:
+
+- ``Deck.cards``: CardRecords in deck order (order, suit, number, id)
+- ``Deck.by_id``: read-only id -> CardRecord mapping
+- ``Deck.languages``: language code -> index into ``CardRecord.names``
+
+Saving or deleting a TarotCard replaces the shared deck version in the cache,
+so every worker reloads its snapshot on the next request (within
+CACHE_L1_TIMEOUT seconds for other workers). Cached payloads derived from the
+deck include ``Deck.version`` in their keys.
+"""
+import logging
+import threading
+import uuid
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import hot_cache
+from .language_utils import SUPPORTED_LANGUAGES
+from .models import TarotCard
+
+logger = logging.getLogger('main')
+
+DECK_VERSION_KEY = 'tarot_deck_version'
+
+_deck = None
+_deck_lock = threading.Lock()
+
+
+@dataclass(frozen=True, slots=True)
+class CardRecord:
+    """
+    Compact read-only copy of a TarotCard.
+
+    ``names`` holds the card name for every deck language, indexed by
+    ``Deck.language_index``; the last entry is the fallback (English name,
+    then default name), as in ``TarotCard.get_name``.
+    """
+    id: int
+    name: str
+    name_en: str
+    suit: str
+    suit_display: str
+    number: int
+    order: int
+    meaning: str
+    reversed_meaning: str
+    emoji: str
+    image: str  # Storage URL of the uploaded image, None without one
+    names_translations: dict  # Shared, do not modify
+    names: tuple
+
+    @classmethod
+    def from_model(cls, card, languages):
+        translations = card.names_translations or {}
+        fallback = card.name_en or card.name
+        try:
+            image = card.image.url if card.image else None
+        except ValueError:
+            image = None
+        return cls(
+            id=card.id,
+            name=card.name,
+            name_en=card.name_en,
+            suit=card.suit,
+            suit_display=card.get_suit_display(),
+            number=card.number,
+            order=card.order,
+            meaning=card.meaning,
+            reversed_meaning=card.reversed_meaning,
+            emoji=card.emoji,
+            image=image,
+            names_translations=translations,
+            names=tuple(
+                translations[code] if code in translations else fallback
+                for code in languages
+            ) + (fallback,),
+        )
+
+
+class Deck:
+    """Immutable snapshot of the tarot deck"""
+
+    __slots__ = ('cards', 'by_id', 'languages', 'version')
+
+    def __init__(self, cards, version):
+        """
+        Args:
+            cards: TarotCard instances in deck order
+            version: Shared deck version the snapshot belongs to
+        """
+        cards = list(cards)
+        codes = dict.fromkeys(SUPPORTED_LANGUAGES)
+        for card in cards:
+            codes.update(dict.fromkeys(card.names_translations or ()))
+        self.languages = MappingProxyType({code: i for i, code in enumerate(codes)})
+        self.cards = tuple(CardRecord.from_model(card, self.languages) for card in cards)
+        self.by_id = MappingProxyType({card.id: card for card in self.cards})
+        self.version = version
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def language_index(self, language):
+        """Index into ``CardRecord.names`` for a language (fallback for unknown codes)"""
+        return self.languages.get(language, len(self.languages))
+
+    def resolve(self, card_ids):
+        """
+        Look up cards in the caller's order.
+
+        Args:
+            card_ids: Card ids (ints)
+
+        Returns:
+            list: CardRecords, same order as ``card_ids``
+
+        Raises:
+            KeyError: With the list of unknown ids
+        """
+        missing = [card_id for card_id in card_ids if card_id not in self.by_id]
+        if missing:
+            raise KeyError(missing)
+        return [self.by_id[card_id] for card_id in card_ids]
+
+
+def get_version():
+    """Current shared deck version (a random token, created on first use)"""
+    version = hot_cache.get(DECK_VERSION_KEY)
+    if version is None:
+        hot_cache.l2.add(DECK_VERSION_KEY, uuid.uuid4().hex, None)
+        version = hot_cache.get(DECK_VERSION_KEY)
+    return version
+
+
+def get_deck():
+    """
+    Get the deck snapshot, reloading it if the deck has changed.
+
+    Returns:
+        Deck
+    """
+    global _deck
+    version = get_version()
+    deck = _deck
+    if deck is not None and deck.version == version:
+        return deck
+    with _deck_lock:
+        if _deck is None or _deck.version != version:
+            cards = TarotCard.objects.order_by('order', 'suit', 'number', 'id')
+            _deck = Deck(cards, version)
+            logger.info("Loaded tarot deck (%d cards)", len(_deck))
+        return _deck
+
+
+def invalidate():
+    """Drop this process's snapshot and make every worker reload the deck"""
+    global _deck
+    _deck = None
+    hot_cache.set(DECK_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+@receiver(post_save, sender=TarotCard)
+@receiver(post_delete, sender=TarotCard)
+def _card_changed(sender, **kwargs):
+    invalidate()
+    # A snapshot reloaded before the transaction commits may miss the change
+    transaction.on_commit(invalidate)
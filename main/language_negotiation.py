@@ -0,0 +1,117 @@
+"""
+Accept-Language negotiation.
+
+``LanguageNegotiationMiddleware`` resolves the header once per request and
+stores the result on ``request.accepted_language`` (a supported language code,
+or None when nothing in the header is supported). Parsing is memoized on the
+raw header string, since clients send the same few headers over and over.
+
+Ranking follows RFC 9110: tags are ordered by q-value (ties keep header
+order), ``q=0`` means "not acceptable", and a region tag falls back to its
+primary language (``pt-BR`` -> ``pt``).
+"""
+from functools import lru_cache
+
+from .language_utils import SUPPORTED_LANGUAGE_CODES
+
+# Legacy or alternative primary tags for supported languages
+LANGUAGE_ALIASES = {
+    'nb': 'no',
+    'nn': 'no',
+    'iw': 'he',
+    'in': 'id',
+}
+
+# Longer headers are truncated before parsing (real ones are far shorter)
+MAX_HEADER_LENGTH = 512
+
+
+@lru_cache(maxsize=512)
+def parse_accept_language(header):
+    """
+    Parse an Accept-Language header.
+
+    Args:
+        header: Raw header value, e.g. "en-US,en;q=0.9,fa;q=0.8"
+
+    Returns:
+        tuple: Lower-cased language tags, best first, without q=0 entries
+    """
+    ranked = []
+    for position, item in enumerate(header[:MAX_HEADER_LENGTH].split(',')):
+        tag, _, params = item.partition(';')
+        tag = tag.strip().lower()
+        if not tag:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            ranked.append((-quality, position, tag))
+    ranked.sort()
+    return tuple(tag for _, _, tag in ranked)
+
+
+def match_language(tag):
+    """
+    Map a language tag to a supported language code.
+
+    Returns:
+        str: Supported code, or None
+    """
+    if tag in SUPPORTED_LANGUAGE_CODES:
+        return tag
+    primary = tag.split('-', 1)[0].split('_', 1)[0]
+    primary = LANGUAGE_ALIASES.get(primary, primary)
+    if primary in SUPPORTED_LANGUAGE_CODES:
+        return primary
+    return None
+
+
+@lru_cache(maxsize=512)
+def negotiate_language(header):
+    """
+    Pick the best supported language for an Accept-Language header.
+
+    Returns:
+        str: Supported code, or None when nothing acceptable is supported
+    """
+    for tag in parse_accept_language(header):
+        code = match_language(tag)
+        if code:
+            return code
+    return None
+
+
+def get_request_language(request):
+    """
+    Get the negotiated Accept-Language for a request.
+
+    Uses the value stored by LanguageNegotiationMiddleware and negotiates the
+    header directly otherwise (e.g. for requests built in tests).
+
+    Returns:
+        str: Supported code, or None
+    """
+    try:
+        return request.accepted_language
+    except AttributeError:
+        header = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
+        return negotiate_language(header) if header else None
+
+
+class LanguageNegotiationMiddleware:
+    """Attach the negotiated Accept-Language to ``request.accepted_language``"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        header = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
+        request.accepted_language = negotiate_language(header) if header else None
+        return self.get_response(request)
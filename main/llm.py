@@ -0,0 +1,178 @@
+"""
+Model routing for chat completions.
+
+Every view calls ``chat_completion`` instead of talking to the OpenAI client
+directly. The route for an (endpoint, stage) pair comes from settings:
+
+- LLM_STAGE_DEFAULTS: model, max_tokens, timeout, optional base_url/api_key
+  and downgrade_model per stage ('reading', 'questions')
+- LLM_ROUTES: per-endpoint overrides of the stage defaults
+
+A call is switched to the route's ``downgrade_model`` when the process has
+too many calls in flight (LLM_DOWNGRADE_IN_FLIGHT) or when the user has used
+most of their daily token budget (LLM_DOWNGRADE_BUDGET_RATIO).
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .usage import get_daily_budget, get_tokens_used_today, record_completion
+
+logger = logging.getLogger('main')
+
+READING = 'reading'
+QUESTIONS = 'questions'
+
+DEFAULT_ROUTE = {
+    'model': 'gpt-4o-mini',
+    'max_tokens': None,
+    'timeout': None,
+    'base_url': '',
+    'api_key': '',
+    'downgrade_model': '',
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def is_configured():
+    """Check whether an OpenAI API key is available"""
+    return bool(getattr(settings, 'OPENAI_API_KEY', None))
+
+
+def get_client(base_url='', api_key=''):
+    """
+    Get a shared OpenAI client, one per base URL.
+
+    Args:
+        base_url: Optional OpenAI-compatible server URL ('' = OpenAI)
+        api_key: Optional key for that server (defaults to OPENAI_API_KEY)
+
+    Returns:
+        OpenAI
+    """
+    key = (base_url or '', api_key or '')
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            # Imported on first use: the SDK takes longer to import than the
+            # rest of the app (see the startup_benchmark command)
+            from openai import OpenAI
+            kwargs = {'api_key': api_key or getattr(settings, 'OPENAI_API_KEY', None) or 'not-set'}
+            if base_url:
+                kwargs['base_url'] = base_url
+            client = OpenAI(**kwargs)
+            _clients[key] = client
+    return client
+
+
+def get_route(endpoint, stage=READING):
+    """
+    Resolve the route for an endpoint and stage.
+
+    Returns:
+        dict: DEFAULT_ROUTE keys, stage defaults applied first, then the
+        endpoint's overrides
+    """
+    route = dict(DEFAULT_ROUTE)
+    route.update(getattr(settings, 'LLM_STAGE_DEFAULTS', {}).get(stage, {}))
+    route.update(getattr(settings, 'LLM_ROUTES', {}).get(endpoint, {}).get(stage, {}))
+    return route
+
+
+def in_flight():
+    """Number of model calls currently running in this process"""
+    return _in_flight
+
+
+@contextmanager
+def _track_in_flight():
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += 1
+    try:
+        yield
+    finally:
+        with _in_flight_lock:
+            _in_flight -= 1
+
+
+def downgrade_reason(user=None):
+    """
+    Check whether calls should use the cheaper model.
+
+    Returns:
+        str: 'load' or 'budget', or '' when the normal model should be used
+    """
+    limit = getattr(settings, 'LLM_DOWNGRADE_IN_FLIGHT', 0)
+    if limit and in_flight() >= limit:
+        return 'load'
+
+    ratio = getattr(settings, 'LLM_DOWNGRADE_BUDGET_RATIO', 0)
+    if ratio and user is not None and user.is_authenticated:
+        budget = get_daily_budget(user)
+        if budget and get_tokens_used_today(user) >= budget * ratio:
+            return 'budget'
+    return ''
+
+
+def select_model(route, user=None):
+    """
+    Pick the model for a call, downgrading when needed.
+
+    Returns:
+        tuple: (model, downgrade reason or '')
+    """
+    downgrade_model = route.get('downgrade_model')
+    if downgrade_model and downgrade_model != route['model']:
+        reason = downgrade_reason(user)
+        if reason:
+            return downgrade_model, reason
+    return route['model'], ''
+
+
+def chat_completion(endpoint, messages, stage=READING, user=None, language='', **kwargs):
+    """
+    Run a chat completion through the router and record its token usage.
+
+    Args:
+        endpoint: Endpoint name (e.g. 'coffee', 'tarot')
+        messages: Chat messages
+        stage: READING or QUESTIONS
+        user: Authenticated user or None (used for budget-based downgrade)
+        language: Language code, recorded with the usage
+        **kwargs: Extra arguments for ``chat.completions.create``
+            (e.g. response_format, prompt_cache_key)
+
+    Returns:
+        ChatCompletion
+    """
+    route = get_route(endpoint, stage)
+    model, reason = select_model(route, user)
+    if reason:
+        logger.info("Downgrading %s/%s to %s (%s)", endpoint, stage, model, reason)
+
+    params = {'model': model, 'messages': messages}
+    if route.get('max_tokens'):
+        params['max_tokens'] = route['max_tokens']
+    if route.get('timeout'):
+        params['timeout'] = route['timeout']
+    if route.get('base_url'):
+        # Other OpenAI-compatible servers may reject OpenAI-only options
+        kwargs.pop('prompt_cache_key', None)
+    params.update(kwargs)
+
+    client = get_client(route.get('base_url'), route.get('api_key'))
+    with _track_in_flight():
+        completion = client.chat.completions.create(**params)
+
+    record_completion(completion, endpoint, user=user, language=language, stage=stage)
+    return completion
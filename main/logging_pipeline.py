@@ -0,0 +1,253 @@
+"""
+Non-blocking logging pipeline.
+
+Request threads only hand records to an in-memory queue; a listener thread
+per process formats them and writes them to disk:
+
+- ``QueueListenerHandler``: enqueues records and owns the listener thread
+  (started lazily, and again after a fork, so it works with gunicorn's
+  preload_app). When the queue is full, records are dropped and counted
+  rather than blocking the request.
+- ``SharedRotatingFileHandler``: size-based rotation that is safe when every
+  worker writes to the same file.
+- ``JSONFormatter``: one JSON object per line.
+- ``SamplingFilter``: keeps a fraction of the records below WARNING, per logger.
+
+This module is imported while settings are being configured, so it must not
+import models or read settings at import time.
+"""
+import contextlib
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from django.utils.module_loading import import_string
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Used to render tracebacks before a record is queued
+_exception_formatter = logging.Formatter()
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as JSON lines"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'process': record.process,
+            'thread': record.thread,
+            'message': record.getMessage(),
+        }
+        status_code = getattr(record, 'status_code', None)
+        if status_code is not None:
+            entry['status_code'] = status_code
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the low-level records of chatty loggers.
+
+    Args:
+        rates: {logger name: fraction kept (0-1)}, matched on the longest
+            dotted prefix of the record's logger; loggers not listed keep
+            everything
+        level: Records at or above this level are always kept
+    """
+
+    def __init__(self, rates=None, level='WARNING'):
+        super().__init__()
+        self.rates = {name: float(rate) for name, rate in (rates or {}).items()}
+        self.level = level if isinstance(level, int) else logging.getLevelName(level.upper())
+        self._resolved = {}
+
+    def rate(self, name):
+        """Fraction of records kept for a logger name"""
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            prefix = name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition('.')[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= self.level:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler for a file shared by several processes.
+
+    Rotation happens under a lock file, and a process whose file was rotated
+    by another process reopens the new file instead of rotating again (which
+    would overwrite the backups).
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._identity = None
+        super().__init__(*args, **kwargs)
+
+    def _open(self):
+        stream = super()._open()
+        stat = os.fstat(stream.fileno())
+        self._identity = (stat.st_dev, stat.st_ino)
+        return stream
+
+    def _moved(self):
+        if self.stream is None:
+            return False
+        try:
+            stat = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return True
+        return (stat.st_dev, stat.st_ino) != self._identity
+
+    def _reopen(self):
+        self.stream.close()
+        self.stream = self._open()
+
+    def emit(self, record):
+        if self._moved():
+            self._reopen()
+        super().emit(record)
+
+    def doRollover(self):
+        with _file_lock(self.baseFilename + '.lock'):
+            if self._moved():
+                # Another process rotated the file while this one waited
+                self._reopen()
+                return
+            super().doRollover()
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Block until the thread makes room rather than failing on a full queue
+        self.queue.put(self._sentinel)
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Queue records for a background thread that writes them with ``handler``.
+
+    Args:
+        handler: Handler config, {'class': dotted path, **kwargs}, or a Handler
+        queue_size: Records buffered before new ones are dropped
+
+    The formatter set on this handler is applied by the listener thread; only
+    the message itself (``msg % args``) and tracebacks are rendered before a
+    record is queued, so later changes to the arguments cannot alter it.
+    """
+
+    def __init__(self, handler, queue_size=10000):
+        if not isinstance(handler, logging.Handler):
+            config = dict(handler)
+            handler = import_string(config.pop('class'))(**config)
+        super().__init__(queue.Queue(queue_size))
+        self.handler = handler
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._pid = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.handler.setFormatter(fmt)
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A forked worker does not inherit the parent's listener thread
+            self.queue = queue.Queue(self.queue_size)
+            self._listener = _Listener(self.queue, self.handler)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.enqueue(self.prepare(record))
+        except queue.Full:
+            self.dropped += 1
+            return
+        except Exception:
+            self.handleError(record)
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            with contextlib.suppress(queue.Full):
+                self.enqueue(logging.makeLogRecord({
+                    'name': __name__,
+                    'levelno': logging.WARNING,
+                    'levelname': 'WARNING',
+                    'msg': 'Log queue full, dropped %d records',
+                    'args': (dropped,),
+                }))
+
+    def flush(self):
+        """Wait until every queued record has been written"""
+        if self._listener is not None and self._pid == os.getpid():
+            self.queue.join()
+        self.handler.flush()
+
+    def close(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+        self._listener = None
+        self._pid = None
+        self.handler.close()
+        super().close()
@@ -3,7 +3,7 @@ import logging
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
-from main.models import File
+from main.media_maintenance import Checkpoint, OldFileCleanup
 from django.conf import settings
 
 logger = logging.getLogger('main')
@@ -24,77 +24,100 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be deleted without actually deleting',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows read and deleted per query (default: 500)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Threads deleting files from storage (default: 8)',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR, 'cleanup_old_files.checkpoint.json'),
+            help='Progress file used to resume an interrupted run',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the progress of an interrupted run and start over',
+        )
 
     def handle(self, *args, **options):
         days = options['days']
         dry_run = options['dry_run']
-        
+
         # Calculate cutoff date
         cutoff_date = timezone.now() - timedelta(days=days)
-        
-        # Find old files
-        old_files = File.objects.filter(created_at__lt=cutoff_date)
-        count = old_files.count()
-        
-        if count == 0:
-            self.stdout.write(
-                self.style.SUCCESS(f'No files older than {days} days found.')
-            )
-            return
-        
-        self.stdout.write(
-            self.style.WARNING(f'Found {count} file(s) older than {days} days.')
+
+        checkpoint = Checkpoint(options['checkpoint'])
+        if options['restart']:
+            checkpoint.clear()
+        cleanup = OldFileCleanup(
+            cutoff_date,
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            checkpoint=None if dry_run else checkpoint,
         )
-        
+
         if dry_run:
             self.stdout.write(
                 self.style.WARNING('DRY RUN: Files that would be deleted:')
             )
-            for file_obj in old_files:
-                self.stdout.write(f'  - {file_obj.image.name} (ID: {file_obj.id}, Created: {file_obj.created_at})')
+            count = 0
+            for batch in cleanup.batches():
+                count += len(batch)
+                for pk, name in batch:
+                    self.stdout.write(f'  - {name} (ID: {pk})')
+            self.stdout.write(
+                self.style.WARNING(f'Found {count} file(s) older than {days} days.')
+            )
             return
-        
-        # Delete files
-        deleted_count = 0
-        error_count = 0
-        
-        for file_obj in old_files:
-            try:
-                # Delete physical file
-                if file_obj.image:
-                    file_path = file_obj.image.path
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        logger.info(f'Deleted file: {file_path}')
-                
-                # Delete database record
-                file_obj.delete()
-                deleted_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                logger.error(f'Error deleting file {file_obj.id}: {str(e)}')
-                self.stdout.write(
-                    self.style.ERROR(f'Error deleting file {file_obj.id}: {str(e)}')
+
+        if cleanup.resumed:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Resuming interrupted run (cutoff {cleanup.state['cutoff']}, "
+                    f"{cleanup.state['deleted']} already deleted)"
                 )
-        
+            )
+
+        def report(state):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {state['deleted']} deleted, up to ID {state['last_pk']}")
+
+        result = cleanup.run(on_batch=report)
+
+        if result['deleted'] == 0 and result['errors'] == 0:
+            self.stdout.write(
+                self.style.SUCCESS(f'No files older than {days} days found.')
+            )
+            return
+
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully deleted {deleted_count} file(s). '
-                f'Errors: {error_count}'
+                f"Successfully deleted {result['deleted']} file(s). "
+                f"Errors: {result['errors']}"
             )
         )
-        
+        self.stdout.write(
+            f"{result['seconds']:.1f}s, {result['rate']:.0f} rows/s"
+        )
+
         # Clean up empty directories
         self._cleanup_empty_directories()
 
     def _cleanup_empty_directories(self):
         """Remove empty directories in media/coffee"""
         media_path = os.path.join(settings.MEDIA_ROOT, 'coffee')
-        
+
         if not os.path.exists(media_path):
             return
-        
+
         try:
             # Walk through directories and remove empty ones
             for root, dirs, files in os.walk(media_path, topdown=False):
@@ -103,9 +126,8 @@ class Command(BaseCommand):
                     try:
                         if not os.listdir(dir_path):  # Directory is empty
                             os.rmdir(dir_path)
-                            logger.info(f'Removed empty directory: {dir_path}')
+                            logger.info('Removed empty directory: %s', dir_path)
                     except OSError:
                         pass  # Directory not empty or other error
         except Exception as e:
-            logger.error(f'Error cleaning up directories: {str(e)}')
-
+            logger.error('Error cleaning up directories: %s', e)
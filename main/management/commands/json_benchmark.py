@@ -0,0 +1,145 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from main.compression import available_encodings, compress
+from main.deck import Deck, get_deck
+from main.models import TarotCard
+from main.renderers import ORJSONRenderer, orjson
+from main.serializers import serialize_tarot_cards
+
+# One paragraph of a reading per script; readings are several paragraphs
+SAMPLE_TEXT = {
+    'fa': (
+        'در فنجان شما نقش پرنده‌ای در حال پرواز دیده می‌شود که نشانه خبری خوش از راه دور است. '
+        'کوهی در کنار دسته فنجان نشان می‌دهد که مانعی پیش رو دارید، اما با صبر از آن عبور می‌کنید. '
+        'ماهی در ته فنجان نشانه روزی و فراوانی است و به زودی گشایشی در کارهای مالی شما رخ می‌دهد.'
+    ),
+    'ar': (
+        'يظهر في فنجانك طائر يحلق، وهو علامة على خبر سار قادم من بعيد. '
+        'الجبل بجانب مقبض الفنجان يدل على عقبة أمامك، لكنك ستتجاوزها بالصبر. '
+        'السمكة في قاع الفنجان علامة رزق ووفرة، وقريباً سيحدث انفراج في أمورك المالية.'
+    ),
+    'zh': (
+        '你的杯中出现一只飞翔的鸟，预示着远方将传来好消息。'
+        '杯柄旁的山形表示你面前有一个障碍，但你会以耐心跨越它。'
+        '杯底的鱼象征着财富与丰盛，你的财务状况很快会有转机。'
+    ),
+}
+
+RENDERERS = (
+    # JsonResponse / json.dumps defaults: every non-ASCII character as \uXXXX
+    ('json ascii', lambda data: json.dumps(data, separators=(',', ':')).encode()),
+    ('drf', JSONRenderer().render),
+    ('orjson', ORJSONRenderer().render),
+)
+
+
+def sample_deck():
+    """The deck from the database, or a 78-card stand-in when it is empty"""
+    if TarotCard.objects.exists():
+        return get_deck(), 'database'
+    cards = [
+        TarotCard(
+            id=i + 1, name=f'Card {i}', name_en=f'Card {i}', suit='major' if i < 22 else 'cups',
+            number=i % 22, order=i, emoji='🃏',
+            meaning=SAMPLE_TEXT['fa'][:120], reversed_meaning=SAMPLE_TEXT['fa'][120:240],
+            names_translations={'fa': f'کارت {i}', 'ar': f'بطاقة {i}', 'zh': f'第{i}张牌', 'en': f'Card {i}'},
+        )
+        for i in range(78)
+    ]
+    return Deck(cards, 'benchmark'), 'synthetic'
+
+
+def sample_payloads(deck, paragraphs=6):
+    """
+    Response bodies as the API returns them.
+
+    Returns:
+        dict: name -> data
+    """
+    payloads = {'tarot deck (fa)': {'cards': serialize_tarot_cards(deck, deck.cards, 'fa')}}
+    cards = serialize_tarot_cards(deck, deck.cards[:3], 'fa')
+    for language, paragraph in SAMPLE_TEXT.items():
+        reading = '\n\n'.join([paragraph] * paragraphs)
+        payloads[f'coffee reading ({language})'] = {
+            'content': reading,
+            'questions': [paragraph[:80]] * 5,
+        }
+        payloads[f'tarot reading ({language})'] = {
+            'cards': cards,
+            'individual_interpretations': [
+                {'card_id': card['id'], 'interpretation': '\n\n'.join([paragraph] * 2)} for card in cards
+            ],
+            'overall_reading': reading,
+        }
+    return payloads
+
+
+def measure(render, data, iterations):
+    """
+    Time a renderer.
+
+    Returns:
+        tuple: (microseconds per render, rendered bytes)
+    """
+    body = render(data)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        render(data)
+    return (time.perf_counter() - start) / iterations * 1e6, body
+
+
+def run_benchmark(payloads, iterations):
+    """
+    Render every payload with every renderer.
+
+    Returns:
+        list: dicts with payload, renderer, us, bytes, and one size per
+        available encoding
+    """
+    rows = []
+    for name, data in payloads.items():
+        for label, render in RENDERERS:
+            micros, body = measure(render, data, iterations)
+            row = {'payload': name, 'renderer': label, 'us': micros, 'bytes': len(body)}
+            for encoding in available_encodings():
+                row[encoding] = len(compress(body, encoding))
+            rows.append(row)
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Benchmark JSON rendering of tarot and coffee responses: time and bytes on the wire'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Renders per payload and renderer (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson is not installed: "orjson" rows use DRF\'s renderer'))
+        deck, source = sample_deck()
+        self.stdout.write(f'{len(deck)} cards ({source} deck), {options["iterations"]} renders each')
+        encodings = available_encodings()
+        self.stdout.write(
+            f'{"payload":<22} {"renderer":<11} {"us/render":>10} {"bytes":>8}'
+            + ''.join(f' {encoding:>8}' for encoding in encodings)
+        )
+        rows = run_benchmark(sample_payloads(deck), options['iterations'])
+        baseline = {row['payload']: row['us'] for row in rows if row['renderer'] == 'drf'}
+        for row in rows:
+            line = (
+                f"{row['payload']:<22} {row['renderer']:<11} {row['us']:>10.1f} {row['bytes']:>8}"
+                + ''.join(f" {row[encoding]:>8}" for encoding in encodings)
+            )
+            if row['renderer'] == 'orjson':
+                line += f"  {baseline[row['payload']] / row['us']:.1f}x vs drf"
+                line = self.style.SUCCESS(line)
+            self.stdout.write(line)
@@ -0,0 +1,95 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+
+from main.media_maintenance import MediaReconciler
+from main.models import File
+
+
+class Command(BaseCommand):
+    help = 'Find uploaded files without a database record (and records without a file)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--delete',
+            action='store_true',
+            help='Delete orphaned files (default: only report them)',
+        )
+        parser.add_argument(
+            '--quarantine',
+            metavar='DIR',
+            help='Move orphaned files to DIR instead of deleting them',
+        )
+        parser.add_argument(
+            '--delete-missing-rows',
+            action='store_true',
+            help='Delete records whose file is missing',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60,
+            help='Ignore files and records younger than this many minutes (default: 60)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Names looked up per query (default: 1000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Directories scanned in parallel (default: 4)',
+        )
+
+    def handle(self, *args, **options):
+        if options['delete'] and options['quarantine']:
+            raise CommandError('Use either --delete or --quarantine')
+        if not isinstance(File._meta.get_field('image').storage, FileSystemStorage):
+            raise CommandError('reconcile_media needs uploads on the local file system')
+
+        if options['quarantine']:
+            action = 'quarantine'
+        elif options['delete']:
+            action = 'delete'
+        else:
+            action = 'report'
+        reconciler = MediaReconciler(
+            settings.MEDIA_ROOT,
+            directory=File._meta.get_field('image').upload_to.prefix,
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            min_age=options['min_age'] * 60,
+            action=action,
+            quarantine_dir=os.path.abspath(options['quarantine']) if options['quarantine'] else None,
+        )
+        verbose = options['verbosity'] > 1
+
+        def on_orphan(name, size):
+            if verbose:
+                self.stdout.write(f'  - {name} ({size} bytes)')
+
+        def on_missing(pk, name):
+            if verbose:
+                self.stdout.write(f'  - ID {pk}: {name} is missing')
+
+        files = reconciler.reconcile_files(on_orphan=on_orphan)
+        verb = {'report': 'Found', 'delete': 'Deleted', 'quarantine': 'Quarantined'}[action]
+        self.stdout.write(
+            self.style.WARNING(
+                f"{verb} {files['orphans']} orphaned file(s) ({files['bytes'] / 1024 / 1024:.1f} MB) "
+                f"out of {files['scanned']} scanned. Errors: {files['errors']}"
+            )
+        )
+
+        rows = reconciler.reconcile_rows(delete=options['delete_missing_rows'], on_missing=on_missing)
+        verb = 'Deleted' if options['delete_missing_rows'] else 'Found'
+        self.stdout.write(
+            self.style.WARNING(
+                f"{verb} {rows['missing']} record(s) without a file out of {rows['checked']} checked."
+            )
+        )
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from main.media_maintenance import ShardMigration
+
+
+class Command(BaseCommand):
+    help = 'Move uploaded files from the flat coffee/ directory to the sharded layout'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Rows moved per batch (default: 200)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Threads copying files (default: 4)',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.0,
+            help='Seconds to wait between batches, to limit load on a live server (default: 0)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the files that still need to be moved',
+        )
+
+    def handle(self, *args, **options):
+        migration = ShardMigration(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            pause=options['pause'],
+        )
+
+        if options['dry_run']:
+            count = migration.queryset().count()
+            self.stdout.write(self.style.WARNING(f'{count} file(s) to move.'))
+            return
+
+        def report(totals):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {totals['moved']} moved")
+
+        result = migration.run(on_batch=report)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Moved {result['moved']} file(s). Missing: {result['missing']}, "
+                f"errors: {result['errors']} ({result['seconds']:.1f}s, {result['rate']:.0f} files/s)"
+            )
+        )
@@ -0,0 +1,134 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Django's own sqlite3 defaults: rollback journal, FULL sync, deferred
+# transactions, 5 second busy timeout
+DEFAULT_PROFILE = {
+    'pragmas': {},
+    'begin': 'BEGIN',
+    'timeout': 5,
+}
+
+
+def production_profile():
+    return {
+        'pragmas': dict(settings.SQLITE_PRAGMAS),
+        'begin': 'BEGIN IMMEDIATE',
+        'timeout': settings.SQLITE_BUSY_TIMEOUT,
+    }
+
+
+def _worker(path, profile, transactions, results):
+    """Run read-then-write transactions like a request that checks and inserts a row"""
+    conn = sqlite3.connect(path, timeout=profile['timeout'], isolation_level=None)
+    for name, value in profile['pragmas'].items():
+        conn.execute(f'PRAGMA {name}={value}')
+    done = errors = 0
+    latencies = []
+    for i in range(transactions):
+        start = time.perf_counter()
+        try:
+            conn.execute(profile['begin'])
+            conn.execute('SELECT COUNT(*) FROM bench WHERE worker = ?', (os.getpid(),)).fetchone()
+            conn.execute(
+                'INSERT INTO bench (worker, image, created_at) VALUES (?, ?, ?)',
+                (os.getpid(), f'coffee/{os.getpid()}_{i}.jpg', time.time()),
+            )
+            conn.execute('COMMIT')
+            done += 1
+        except sqlite3.OperationalError:
+            # "database is locked"
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    results.put((done, errors, latencies))
+
+
+def run_profile(path, profile, workers, transactions):
+    """
+    Run one benchmark round against a fresh database file.
+
+    Returns:
+        dict: committed, errors, seconds, throughput, p95 latency (ms)
+    """
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE bench (id INTEGER PRIMARY KEY, worker INTEGER, image TEXT, created_at REAL)'
+    )
+    conn.execute('CREATE INDEX bench_worker ON bench (worker)')
+    conn.commit()
+    conn.close()
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=_worker, args=(path, profile, transactions, results))
+        for _ in range(workers)
+    ]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    committed = sum(r[0] for r in collected)
+    latencies = sorted(latency for r in collected for latency in r[2])
+    return {
+        'committed': committed,
+        'errors': sum(r[1] for r in collected),
+        'seconds': elapsed,
+        'throughput': committed / elapsed if elapsed else 0,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent SQLite writes with default settings vs the production profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Number of concurrent writer processes (default: 8)',
+        )
+        parser.add_argument(
+            '--transactions',
+            type=int,
+            default=200,
+            help='Transactions per worker (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        transactions = options['transactions']
+        tmp_dir = tempfile.mkdtemp(prefix='sqlite-bench-')
+        path = os.path.join(tmp_dir, 'bench.sqlite3')
+
+        self.stdout.write(
+            f'{workers} workers x {transactions} read-then-write transactions'
+        )
+        try:
+            for label, profile in (('default', DEFAULT_PROFILE), ('production', production_profile())):
+                stats = run_profile(path, profile, workers, transactions)
+                style = self.style.SUCCESS if not stats['errors'] else self.style.WARNING
+                self.stdout.write(style(
+                    f"{label:>10}: {stats['throughput']:8.1f} commits/s, "
+                    f"{stats['committed']} committed, {stats['errors']} locked errors, "
+                    f"p95 {stats['p95_ms']:.2f} ms, {stats['seconds']:.2f} s"
+                ))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,106 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Imported on first use only; loading any of them at boot is a regression
+DEFERRED_MODULES = ('openai', 'PIL', 'drf_spectacular.views', 'tiktoken')
+
+# Runs in a fresh interpreter: boot the WSGI app the way a gunicorn worker
+# does, then serve one request that needs no database (I Ching validation)
+BOOT_SCRIPT = r'''
+import io, json, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+booted = time.perf_counter()
+
+body = b'{}'
+environ = {
+    'REQUEST_METHOD': 'POST', 'PATH_INFO': '/api/v1/iching', 'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+    'REMOTE_ADDR': '127.0.0.1', 'CONTENT_TYPE': 'application/json',
+    'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body),
+    'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http', 'wsgi.version': (1, 0),
+    'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+}
+statuses = []
+response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+b''.join(response)
+done = time.perf_counter()
+print(json.dumps({
+    'boot_ms': (booted - start) * 1000,
+    'first_request_ms': (done - booted) * 1000,
+    'status': int(statuses[0].split()[0]),
+}))
+'''
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def profile_startup():
+    """
+    Boot the app in a fresh interpreter under ``-X importtime``.
+
+    Returns:
+        dict: boot_ms, first_request_ms, status, and modules
+        ({name: (self_us, cumulative_us)} for every module imported)
+    """
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'forecast_back.settings')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    stats = json.loads(result.stdout.strip().splitlines()[-1])
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    stats['modules'] = modules
+    return stats
+
+
+def by_package(modules):
+    """Sum self import time (µs) per top-level package"""
+    totals = defaultdict(int)
+    for name, (self_us, _) in modules.items():
+        totals[name.split('.')[0]] += self_us
+    return dict(totals)
+
+
+class Command(BaseCommand):
+    help = 'Measure worker boot: import cost per package and time to first request'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Number of packages to list (default: 15)',
+        )
+
+    def handle(self, *args, **options):
+        stats = profile_startup()
+        modules = stats['modules']
+
+        self.stdout.write(
+            f"Boot {stats['boot_ms']:.0f} ms, first request {stats['first_request_ms']:.0f} ms "
+            f"(status {stats['status']}), {len(modules)} modules imported"
+        )
+        self.stdout.write('Import time by package (self, ms):')
+        packages = sorted(by_package(modules).items(), key=lambda item: item[1], reverse=True)
+        for name, self_us in packages[:options['top']]:
+            self.stdout.write(f'  {name:<30} {self_us / 1000:8.1f}')
+
+        eager = [name for name in DEFERRED_MODULES if name in modules]
+        if eager:
+            self.stdout.write(self.style.WARNING(f"Imported at boot: {', '.join(eager)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Deferred until first use: {', '.join(DEFERRED_MODULES)}"))
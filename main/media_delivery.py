@@ -0,0 +1,183 @@
+"""
+Sending files from local disk.
+
+``serve_file()`` answers conditional requests itself (ETag and Last-Modified
+from the file's stat; 304 without opening the file) and leaves the bytes to
+whatever MEDIA_DELIVERY names:
+
+- 'nginx': an empty response with ``X-Accel-Redirect``; nginx sends the file
+  from an ``internal`` location that aliases MEDIA_ROOT
+  (MEDIA_ACCEL_REDIRECT_PREFIX)
+- 'sendfile': an empty response with ``X-Sendfile`` (Apache mod_xsendfile,
+  lighttpd); the server sends the file by absolute path
+- 'django' (default): the worker sends it, with ``FileResponse`` (gunicorn
+  passes it to sendfile(2), so the bytes are not copied through Python) and
+  single ``Range`` requests (206 / 416)
+
+The front-end server handles ranges itself for the header modes. Headers set
+here (Cache-Control, ETag, Last-Modified) are passed on by nginx and Apache.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+DJANGO = 'django'
+NGINX = 'nginx'
+SENDFILE = 'sendfile'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def get_delivery_mode():
+    return getattr(settings, 'MEDIA_DELIVERY', DJANGO)
+
+
+def file_etag(file_stat):
+    """Validator from the file's mtime and size (no need to read the file)"""
+    return f'"{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header.
+
+    Args:
+        header: e.g. 'bytes=0-499', 'bytes=500-', 'bytes=-500'
+        size: File size
+
+    Returns:
+        tuple: (start, end) inclusive, None to send the whole file (missing,
+        malformed or multi-range header), or False if unsatisfiable
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _range_matches(request, etag, mtime):
+    """Honour ``If-Range``: only serve a range of the version the client has"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and int(mtime) <= date
+
+
+def _iter_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, path, content_type=None, cache_control=None):
+    """
+    Respond with a file on local disk.
+
+    Args:
+        request: HttpRequest
+        path: Absolute path of the file
+        content_type: Defaults to a guess from the file name
+        cache_control: Cache-Control value (default: public, MEDIA_CACHE_MAX_AGE)
+
+    Returns:
+        HttpResponse
+
+    Raises:
+        Http404: The file does not exist or is not a regular file
+    """
+    try:
+        file_stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('File not found')
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404('File not found')
+
+    etag = file_etag(file_stat)
+    if cache_control is None:
+        cache_control = f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 86400)}"
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(file_stat.st_mtime),
+        'Cache-Control': cache_control,
+    }
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(file_stat.st_mtime))
+    if not_modified is not None:
+        for name, value in headers.items():
+            not_modified[name] = value
+        return not_modified
+
+    content_type = content_type or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    mode = get_delivery_mode()
+    media_root = os.path.join(os.path.abspath(settings.MEDIA_ROOT), '')
+    if mode == NGINX and path.startswith(media_root):
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = prefix + quote(path[len(media_root):])
+    elif mode == SENDFILE:
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        response = _django_response(request, path, file_stat, etag, content_type)
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def _django_response(request, path, file_stat, etag, content_type):
+    size = file_stat.st_size
+    byte_range = None
+    if request.method == 'GET' and _range_matches(request, etag, file_stat.st_mtime):
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is not None and byte_range != (0, size - 1):
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(_iter_range(path, start, length), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve_media(request, path):
+    """View serving MEDIA_ROOT files (replaces django.views.static.serve)"""
+    try:
+        full_path = safe_join(os.path.abspath(settings.MEDIA_ROOT), path)
+    except SuspiciousFileOperation:
+        raise Http404('File not found')
+    return serve_file(request, full_path)
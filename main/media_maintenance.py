@@ -0,0 +1,525 @@
+"""
+Batch maintenance of uploaded files (File rows and their stored images).
+
+Rows are read in primary-key order, one bounded batch at a time (keyset
+pagination: ``pk > last ORDER BY pk LIMIT n``), so memory stays flat and no
+long-running cursor is held open while rows are deleted. For each batch the
+stored files are deleted in a thread pool, then the rows whose file is gone
+are removed with a single ``DELETE ... WHERE id IN (...)``. Deleting files
+before rows means an interrupted run never leaves files that no row points to.
+
+Progress is written to a JSON checkpoint after every batch, so a run that is
+interrupted resumes where it stopped with the same cutoff and totals.
+
+``MediaReconciler`` finds stored files without a row (orphans) and rows
+without a stored file; ``ShardMigration`` moves files uploaded before the
+sharded layout (main.storage) into it. See their docstrings.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import File
+from .storage import SHARD_DEPTH, content_digest, shard_name
+
+logger = logging.getLogger('main')
+
+
+def discard_files(file_objs):
+    """
+    Delete File rows together with their stored images.
+
+    ``Model.delete()`` leaves the image in storage; use this to undo uploads
+    of a failed request.
+    """
+    for file_obj in file_objs:
+        try:
+            if file_obj.image:
+                file_obj.image.delete(save=False)
+            file_obj.delete()
+        except Exception as e:
+            logger.warning("Failed to discard file %s: %s", file_obj.pk, e)
+
+
+def iter_batches(queryset, batch_size, start_after=0, fields=('image',)):
+    """
+    Stream (pk, image name) pairs in primary-key batches.
+
+    Args:
+        queryset: File queryset (filters only; ordering is replaced)
+        batch_size: Rows per batch
+        start_after: Only rows with a larger pk
+        fields: Fields returned after the pk
+
+    Yields:
+        list: (pk, name) tuples (or (pk, *fields)), ascending pk
+    """
+    last_pk = start_after
+    while True:
+        batch = list(
+            queryset.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', *fields)[:batch_size]
+        )
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1][0]
+
+
+def delete_stored_files(storage, names, executor):
+    """
+    Delete files from storage in parallel.
+
+    Missing files count as deleted (a previous run may have removed them).
+
+    Args:
+        storage: Django storage holding the files
+        names: Storage names
+        executor: ThreadPoolExecutor running the deletes
+
+    Returns:
+        dict: {name: exception} for the files that could not be deleted
+    """
+    def delete(name):
+        try:
+            storage.delete(name)
+        except Exception as e:
+            return e
+        return None
+
+    errors = {}
+    for name, error in zip(names, executor.map(delete, names)):
+        if error is not None:
+            errors[name] = error
+    return errors
+
+
+class Checkpoint:
+    """Progress of a batch job, saved as JSON so the job can resume"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Saved state, or None if there is none"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, state):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class OldFileCleanup:
+    """
+    Delete File rows created before a cutoff, and their stored images.
+
+    Args:
+        cutoff: Rows created before this datetime are deleted
+        batch_size: Rows per batch (one SELECT and one DELETE each)
+        workers: Threads deleting stored files
+        checkpoint: Checkpoint to resume from and save to, or None
+    """
+
+    def __init__(self, cutoff, batch_size=500, workers=8, checkpoint=None):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.checkpoint = checkpoint
+        self.state = {
+            'cutoff': cutoff.isoformat(),
+            'last_pk': 0,
+            'deleted': 0,
+            'errors': 0,
+            'seconds': 0.0,
+        }
+        self.resumed = False
+        saved = checkpoint.load() if checkpoint is not None else None
+        if saved is not None:
+            self.state.update(saved)
+            self.resumed = True
+
+    @property
+    def cutoff(self):
+        return parse_datetime(self.state['cutoff'])
+
+    def queryset(self):
+        return File.objects.filter(created_at__lt=self.cutoff)
+
+    def batches(self):
+        """Batches still to process, as (pk, name) lists"""
+        return iter_batches(self.queryset(), self.batch_size, self.state['last_pk'])
+
+    def run(self, on_batch=None):
+        """
+        Delete everything older than the cutoff.
+
+        Args:
+            on_batch: Called with the state after each batch
+
+        Returns:
+            dict: Final state: deleted, errors, seconds, rate (rows/s)
+        """
+        storage = File._meta.get_field('image').storage
+        start = time.perf_counter() - self.state['seconds']
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch in self.batches():
+                names = [name for _, name in batch if name]
+                errors = delete_stored_files(storage, names, executor)
+                for name, error in errors.items():
+                    logger.error("Error deleting file %s: %s", name, error)
+                # Rows whose file could not be deleted are kept for a later run
+                pks = [pk for pk, name in batch if name not in errors]
+                if pks:
+                    File.objects.filter(pk__in=pks).delete()
+
+                self.state['last_pk'] = batch[-1][0]
+                self.state['deleted'] += len(pks)
+                self.state['errors'] += len(batch) - len(pks)
+                self.state['seconds'] = time.perf_counter() - start
+                if self.checkpoint is not None:
+                    self.checkpoint.save(self.state)
+                if on_batch is not None:
+                    on_batch(self.state)
+
+        if self.checkpoint is not None:
+            self.checkpoint.clear()
+        seconds = self.state['seconds']
+        return dict(self.state, rate=self.state['deleted'] / seconds if seconds else 0.0)
+
+
+def scan_files(root, relative_dir, recursive=True):
+    """
+    Stream the files under a directory with ``os.scandir``.
+
+    Args:
+        root: Storage root (MEDIA_ROOT)
+        relative_dir: Directory to scan, relative to ``root``
+        recursive: Descend into subdirectories
+
+    Yields:
+        tuple: (storage name, os.DirEntry)
+    """
+    pending = [relative_dir]
+    while pending:
+        current = pending.pop()
+        try:
+            entries = os.scandir(os.path.join(root, current))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f'{current}/{entry.name}' if current else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        pending.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class MediaReconciler:
+    """
+    Reconcile uploaded files on disk with File rows.
+
+    Orphans (files no row points to) are found by streaming each directory
+    and looking up the names a batch at a time
+    (``WHERE image IN (...)``), so memory is bounded by the batch size, not
+    by the directory size. The directories ``shard_depth`` levels down
+    (YYYY/MM/ab in the sharded layout) are scanned in parallel.
+
+    Rows whose file is missing are found by checking the stored names of all
+    rows in primary-key batches.
+
+    Files and rows younger than ``min_age`` are skipped: an upload writes the
+    file before its row is committed.
+
+    Args:
+        root: Storage root (MEDIA_ROOT)
+        directory: Upload directory, relative to ``root``
+        batch_size: Names looked up per query
+        workers: Directories scanned / files checked in parallel
+        shard_depth: Directory levels below ``directory`` to split the scan at
+        min_age: Seconds a file or row must exist before it is considered
+        action: 'report', 'delete' or 'quarantine' orphans
+        quarantine_dir: Where quarantined orphans are moved (keeping their
+            relative path)
+    """
+
+    ACTIONS = ('report', 'delete', 'quarantine')
+
+    def __init__(self, root, directory='coffee', batch_size=1000, workers=4,
+                 min_age=3600, action='report', quarantine_dir=None, shard_depth=SHARD_DEPTH):
+        if action not in self.ACTIONS:
+            raise ValueError(f'Unknown action: {action}')
+        if action == 'quarantine' and not quarantine_dir:
+            raise ValueError('quarantine_dir is required to quarantine orphans')
+        self.root = str(root)
+        self.directory = directory
+        self.batch_size = batch_size
+        self.workers = workers
+        self.min_age = min_age
+        self.action = action
+        self.quarantine_dir = quarantine_dir
+        self.shard_depth = shard_depth
+
+    def shards(self):
+        """
+        (directory, recursive) units scanned in parallel.
+
+        Directories ``shard_depth`` levels down are scanned with everything
+        below them; the directories above them only for their own files (such
+        as uploads from before the sharded layout).
+        """
+        if not os.path.isdir(os.path.join(self.root, self.directory)):
+            return []
+        shards = []
+        level = [self.directory]
+        for _ in range(self.shard_depth):
+            shards.extend((directory, False) for directory in level)
+            level = [subdirectory for directory in level for subdirectory in self._subdirectories(directory)]
+        shards.extend((directory, True) for directory in level)
+        return shards
+
+    def _subdirectories(self, directory):
+        try:
+            with os.scandir(os.path.join(self.root, directory)) as entries:
+                return [
+                    f'{directory}/{entry.name}'
+                    for entry in entries if entry.is_dir(follow_symlinks=False)
+                ]
+        except FileNotFoundError:
+            return []
+
+    def _handle_orphan(self, name):
+        path = os.path.join(self.root, name)
+        if self.action == 'delete':
+            os.remove(path)
+        elif self.action == 'quarantine':
+            target = os.path.join(self.quarantine_dir, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(path, target)
+
+    def _scan_shard(self, shard, on_orphan):
+        directory, recursive = shard
+        stats = {'scanned': 0, 'orphans': 0, 'bytes': 0, 'errors': 0}
+        newest = time.time() - self.min_age
+        for chunk in _chunks(scan_files(self.root, directory, recursive), self.batch_size):
+            stats['scanned'] += len(chunk)
+            names = [name for name, _ in chunk]
+            known = set(File.objects.filter(image__in=names).values_list('image', flat=True))
+            for name, entry in chunk:
+                if name in known:
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime > newest:
+                        continue
+                    self._handle_orphan(name)
+                except OSError as e:
+                    stats['errors'] += 1
+                    logger.error("Error reconciling %s: %s", name, e)
+                    continue
+                stats['orphans'] += 1
+                stats['bytes'] += stat.st_size
+                if on_orphan is not None:
+                    on_orphan(name, stat.st_size)
+        return stats
+
+    def reconcile_files(self, on_orphan=None):
+        """
+        Find (and delete or quarantine) files without a row.
+
+        Args:
+            on_orphan: Called with (name, size) for every orphan
+
+        Returns:
+            dict: scanned, orphans, bytes, errors
+        """
+        def scan(shard):
+            try:
+                return self._scan_shard(shard, on_orphan)
+            finally:
+                # Each scanning thread opened its own database connection
+                connection.close()
+
+        totals = {'scanned': 0, 'orphans': 0, 'bytes': 0, 'errors': 0}
+        shards = self.shards()
+        if self.workers > 1 and len(shards) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = list(executor.map(scan, shards))
+        else:
+            results = [self._scan_shard(shard, on_orphan) for shard in shards]
+        for stats in results:
+            for key, value in stats.items():
+                totals[key] += value
+        return totals
+
+    def reconcile_rows(self, delete=False, on_missing=None):
+        """
+        Find (and optionally delete) rows whose file is missing.
+
+        Args:
+            delete: Delete those rows
+            on_missing: Called with (pk, name) for every such row
+
+        Returns:
+            dict: checked, missing
+        """
+        storage = File._meta.get_field('image').storage
+        queryset = File.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=self.min_age))
+        totals = {'checked': 0, 'missing': 0}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch in iter_batches(queryset, self.batch_size):
+                exists = executor.map(lambda row: bool(row[1]) and storage.exists(row[1]), batch)
+                missing = [row for row, found in zip(batch, exists) if not found]
+                totals['checked'] += len(batch)
+                totals['missing'] += len(missing)
+                if on_missing is not None:
+                    for pk, name in missing:
+                        on_missing(pk, name)
+                if delete and missing:
+                    File.objects.filter(pk__in=[pk for pk, _ in missing]).delete()
+        return totals
+
+
+class ShardMigration:
+    """
+    Move files stored under the old flat layout (``coffee/<name>``) to the
+    sharded layout of ``File.image.upload_to``, a batch at a time.
+
+    For each row the file is copied to its new name (hard-linked on a local
+    file system), then the batch's rows are updated in one transaction, then
+    the old files are deleted. An interrupted run leaves at worst a copy
+    without a row, which reconcile_media removes; rows are never pointed at a
+    file that does not exist. Migrated rows no longer match the query, so a
+    new run continues where the last one stopped.
+
+    Args:
+        batch_size: Rows per batch
+        workers: Threads copying and deleting files
+        pause: Seconds to sleep between batches (throttles background runs)
+    """
+
+    def __init__(self, batch_size=200, workers=4, pause=0.0):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.pause = pause
+        self.field = File._meta.get_field('image')
+        self.storage = self.field.storage
+
+    def queryset(self):
+        """Rows whose file is not under the sharded layout yet"""
+        return File.objects.exclude(image='').exclude(image__regex=self.field.upload_to.pattern.pattern)
+
+    def new_name(self, name, content, created_at):
+        digest = content_digest(content)
+        extension = os.path.splitext(name)[1]
+        target = shard_name(self.field.upload_to.prefix, digest, extension, created_at)
+        return self.storage.get_available_name(target, max_length=self.field.max_length)
+
+    def copy(self, name, created_at):
+        """
+        Copy one file to its sharded name.
+
+        Returns:
+            str: New storage name
+        """
+        with self.storage.open(name, 'rb') as content:
+            new_name = self.new_name(name, content, created_at)
+            if isinstance(self.storage, FileSystemStorage):
+                new_path = self.storage.path(new_name)
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                try:
+                    os.link(self.storage.path(name), new_path)
+                    return new_name
+                except OSError:
+                    # No hard links here (other device, file system without them)
+                    pass
+            content.seek(0)
+            return self.storage.save(new_name, content, max_length=self.field.max_length)
+
+    def run(self, on_batch=None):
+        """
+        Migrate every row still using the old layout.
+
+        Args:
+            on_batch: Called with the running totals after each batch
+
+        Returns:
+            dict: moved, missing, errors, seconds, rate (files/s)
+        """
+        totals = {'moved': 0, 'missing': 0, 'errors': 0}
+        start = time.perf_counter()
+
+        def copy(row):
+            pk, name, created_at = row
+            try:
+                return pk, name, self.copy(name, created_at), None
+            except FileNotFoundError as e:
+                return pk, name, None, e
+            except Exception as e:
+                logger.error("Error moving %s: %s", name, e)
+                return pk, name, None, e
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            last_pk = 0
+            while True:
+                batch = next(iter_batches(
+                    self.queryset(), self.batch_size, last_pk, fields=('image', 'created_at')
+                ), None)
+                if batch is None:
+                    break
+                last_pk = batch[-1][0]
+                results = list(executor.map(copy, batch))
+                moved = [File(pk=pk, image=new_name) for pk, _, new_name, _ in results if new_name]
+                with transaction.atomic():
+                    File.objects.bulk_update(moved, ['image'])
+                errors = delete_stored_files(
+                    self.storage, [name for _, name, new_name, _ in results if new_name], executor
+                )
+                for name, error in errors.items():
+                    logger.warning("Moved %s but could not delete it: %s", name, error)
+
+                totals['moved'] += len(moved)
+                totals['missing'] += sum(isinstance(error, FileNotFoundError) for *_, error in results)
+                totals['errors'] += sum(
+                    error is not None and not isinstance(error, FileNotFoundError) for *_, error in results
+                )
+                if on_batch is not None:
+                    on_batch(totals)
+                if self.pause:
+                    time.sleep(self.pause)
+
+        seconds = time.perf_counter() - start
+        return dict(totals, seconds=seconds, rate=totals['moved'] / seconds if seconds else 0.0)
@@ -32,11 +32,18 @@ class RateLimitMiddleware:
             # Create cache key
             cache_key = f'rate_limit_{ip}'
             
-            # Get current request count
-            requests = cache.get(cache_key, 0)
+            # Count this request atomically: add() starts the window once,
+            # incr() is safe across workers sharing the cache
+            cache.add(cache_key, 0, self.rate_limit_window)
+            try:
+                requests = cache.incr(cache_key)
+            except ValueError:
+                # Window expired between add() and incr()
+                cache.set(cache_key, 1, self.rate_limit_window)
+                requests = 1
             
-            if requests >= self.rate_limit:
-                logger.warning(f"Rate limit exceeded for IP: {ip}")
+            if requests > self.rate_limit:
+                logger.warning("Rate limit exceeded for IP: %s", ip)
                 return JsonResponse(
                     {
                         'error': 'Rate limit exceeded. Please try again later.',
@@ -44,9 +51,6 @@ class RateLimitMiddleware:
                     },
                     status=429
                 )
-            
-            # Increment request count
-            cache.set(cache_key, requests + 1, self.rate_limit_window)
         
         response = self.get_response(request)
         return response
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_tarotcard_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='daily_token_budget',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='سقف روزانه توکن'),
+        ),
+        migrations.CreateModel(
+            name='TokenUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=30, verbose_name='سرویس')),
+                ('stage', models.CharField(default='reading', max_length=30, verbose_name='مرحله')),
+                ('language', models.CharField(blank=True, default='', max_length=5, verbose_name='زبان')),
+                ('model', models.CharField(max_length=100, verbose_name='مدل')),
+                ('prompt_tokens', models.PositiveIntegerField(default=0, verbose_name='توکن\u200cهای ورودی')),
+                ('completion_tokens', models.PositiveIntegerField(default=0, verbose_name='توکن\u200cهای خروجی')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='تاریخ ایجاد')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='token_usage', to=settings.AUTH_USER_MODEL, verbose_name='کاربر')),
+            ],
+            options={
+                'verbose_name': 'مصرف توکن',
+                'verbose_name_plural': 'مصرف توکن',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyTokenUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='روز')),
+                ('endpoint', models.CharField(max_length=30, verbose_name='سرویس')),
+                ('stage', models.CharField(default='reading', max_length=30, verbose_name='مرحله')),
+                ('language', models.CharField(blank=True, default='', max_length=5, verbose_name='زبان')),
+                ('model', models.CharField(max_length=100, verbose_name='مدل')),
+                ('requests', models.PositiveIntegerField(default=0, verbose_name='تعداد درخواست')),
+                ('prompt_tokens', models.PositiveBigIntegerField(default=0, verbose_name='توکن\u200cهای ورودی')),
+                ('completion_tokens', models.PositiveBigIntegerField(default=0, verbose_name='توکن\u200cهای خروجی')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_token_usage', to=settings.AUTH_USER_MODEL, verbose_name='کاربر')),
+            ],
+            options={
+                'verbose_name': 'مصرف روزانه توکن',
+                'verbose_name_plural': 'مصرف روزانه توکن',
+                'ordering': ['-day', 'endpoint'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'user', 'endpoint', 'stage', 'language', 'model'), name='unique_daily_token_usage')],
+            },
+        ),
+    ]
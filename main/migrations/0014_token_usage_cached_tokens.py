@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_token_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailytokenusage',
+            name='cached_tokens',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='توکن\u200cهای کش\u200cشده'),
+        ),
+        migrations.AddField(
+            model_name='tokenusage',
+            name='cached_tokens',
+            field=models.PositiveIntegerField(default=0, verbose_name='توکن\u200cهای کش\u200cشده'),
+        ),
+    ]
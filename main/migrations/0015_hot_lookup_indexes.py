@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+from main.db_operations import AddIndexSafely
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY (PostgreSQL) cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('main', '0014_token_usage_cached_tokens'),
+    ]
+
+    operations = [
+        AddIndexSafely(
+            model_name='file',
+            index=models.Index(fields=['created_at'], name='main_file_created_at_idx'),
+        ),
+        AddIndexSafely(
+            model_name='fortuneprofile',
+            index=models.Index(fields=['user', '-created_at'], name='main_profile_user_created_idx'),
+        ),
+    ]
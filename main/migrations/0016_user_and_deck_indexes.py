@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:20
+
+from django.db import migrations, models
+
+from main.db_operations import AddIndexSafely
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY (PostgreSQL) cannot run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('main', '0015_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        AddIndexSafely(
+            model_name='customuser',
+            index=models.Index(fields=['-date_joined'], name='main_user_date_joined_idx'),
+        ),
+        AddIndexSafely(
+            model_name='tarotcard',
+            index=models.Index(fields=['order', 'suit', 'number'], name='main_tarot_deck_order_idx'),
+        ),
+    ]
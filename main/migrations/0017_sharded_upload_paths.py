@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:27
+
+import main.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_user_and_deck_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='image',
+            field=models.ImageField(upload_to=main.storage.ShardedUploadTo('coffee')),
+        ),
+    ]
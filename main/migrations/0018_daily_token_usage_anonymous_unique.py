@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_anonymous_duplicates(apps, schema_editor):
+    """Fold duplicate anonymous rows into one, so the constraint can be added"""
+    DailyTokenUsage = apps.get_model('main', 'DailyTokenUsage')
+    group = ('day', 'endpoint', 'stage', 'language', 'model')
+    duplicates = (
+        DailyTokenUsage.objects.filter(user__isnull=True)
+        .values(*group)
+        .annotate(
+            rows=Count('id'),
+            total_requests=Sum('requests'),
+            total_prompt=Sum('prompt_tokens'),
+            total_completion=Sum('completion_tokens'),
+            total_cached=Sum('cached_tokens'),
+        )
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        rows = DailyTokenUsage.objects.filter(user__isnull=True, **{field: duplicate[field] for field in group})
+        keep = rows.order_by('id').first()
+        rows.exclude(pk=keep.pk).delete()
+        keep.requests = duplicate['total_requests']
+        keep.prompt_tokens = duplicate['total_prompt']
+        keep.completion_tokens = duplicate['total_completion']
+        keep.cached_tokens = duplicate['total_cached']
+        keep.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_sharded_upload_paths'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_anonymous_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='dailytokenusage',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_token_usage', to=settings.AUTH_USER_MODEL, verbose_name='کاربر'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailytokenusage',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('day', 'endpoint', 'stage', 'language', 'model'), name='unique_daily_token_usage_anonymous'),
+        ),
+    ]
@@ -5,6 +5,8 @@ from django.core.validators import RegexValidator
 from datetime import date
 import json
 
+from .storage import ShardedUploadTo
+
 
 # Create your models here.
 
@@ -220,6 +222,13 @@ class CustomUser(AbstractUser):
         verbose_name='تأیید شده'
     )
     
+    # Daily OpenAI token budget (empty = use DEFAULT_DAILY_TOKEN_BUDGET from settings)
+    daily_token_budget = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        verbose_name='سقف روزانه توکن'
+    )
+    
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='تاریخ به‌روزرسانی')
     
@@ -227,6 +236,10 @@ class CustomUser(AbstractUser):
         verbose_name = 'کاربر'
         verbose_name_plural = 'کاربران'
         ordering = ['-date_joined']
+        indexes = [
+            # Default ordering of the user list
+            models.Index(fields=['-date_joined'], name='main_user_date_joined_idx'),
+        ]
     
     def __str__(self):
         return f"{self.username} - {self.get_full_name() or self.email}"
@@ -250,7 +263,8 @@ class CustomUser(AbstractUser):
 
 
 class File(models.Model):
-    image = models.ImageField(upload_to="coffee")
+    # coffee/<year>/<month>/<hash shards>/<hash>.<ext>, see main.storage
+    image = models.ImageField(upload_to=ShardedUploadTo("coffee"))
     user = models.ForeignKey(
         'CustomUser',
         on_delete=models.SET_NULL,
@@ -266,6 +280,10 @@ class File(models.Model):
         ordering = ['-created_at']
         verbose_name = 'File'
         verbose_name_plural = 'Files'
+        indexes = [
+            # cleanup_old_files: created_at__lt=cutoff
+            models.Index(fields=['created_at'], name='main_file_created_at_idx'),
+        ]
 
     def __str__(self):
         return f"File {self.id} - {self.image.name}"
@@ -381,6 +399,10 @@ class FortuneProfile(models.Model):
         verbose_name = 'پروفایل فال'
         verbose_name_plural = 'پروفایل‌های فال'
         ordering = ['-created_at']
+        indexes = [
+            # Profile list: filter(user=...) ordered by -created_at
+            models.Index(fields=['user', '-created_at'], name='main_profile_user_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.user.username if self.user else 'Anonymous'}"
@@ -486,6 +508,10 @@ class TarotCard(models.Model):
         verbose_name_plural = 'کارت‌های تاروت'
         ordering = ['order', 'suit', 'number']
         unique_together = [['suit', 'number', 'name']]
+        indexes = [
+            # Deck fetch and card glossary: ordered by order, suit, number
+            models.Index(fields=['order', 'suit', 'number'], name='main_tarot_deck_order_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.get_suit_display()})"
@@ -507,3 +533,103 @@ class TarotCard(models.Model):
         if self.image and hasattr(self.image, 'url'):
             return self.image.url
         return None
+
+
+class TokenUsage(models.Model):
+    """
+    Ledger row for a single OpenAI call.
+    Rows are written in batches by main.usage.UsageLedger, never from the request thread.
+    """
+    
+    user = models.ForeignKey(
+        'CustomUser',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='token_usage',
+        verbose_name='کاربر'
+    )
+    endpoint = models.CharField(max_length=30, verbose_name='سرویس')
+    stage = models.CharField(max_length=30, default='reading', verbose_name='مرحله')
+    language = models.CharField(max_length=5, blank=True, default='', verbose_name='زبان')
+    model = models.CharField(max_length=100, verbose_name='مدل')
+    prompt_tokens = models.PositiveIntegerField(default=0, verbose_name='توکن‌های ورودی')
+    completion_tokens = models.PositiveIntegerField(default=0, verbose_name='توکن‌های خروجی')
+    cached_tokens = models.PositiveIntegerField(default=0, verbose_name='توکن‌های کش‌شده')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='تاریخ ایجاد')
+    
+    class Meta:
+        verbose_name = 'مصرف توکن'
+        verbose_name_plural = 'مصرف توکن'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.endpoint}/{self.stage} - {self.model} ({self.total_tokens})"
+    
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+    
+    @property
+    def cache_hit_ratio(self):
+        """Share of prompt tokens served from the provider's prompt cache"""
+        if not self.prompt_tokens:
+            return 0.0
+        return self.cached_tokens / self.prompt_tokens
+
+
+class DailyTokenUsage(models.Model):
+    """
+    Daily aggregate of TokenUsage per user, endpoint, stage, language and model.
+    Updated in place (F() increments) when the usage buffer is flushed.
+    Anonymous usage (and that of deleted users) shares one row per group.
+    """
+    
+    day = models.DateField(verbose_name='روز')
+    user = models.ForeignKey(
+        'CustomUser',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='daily_token_usage',
+        verbose_name='کاربر'
+    )
+    endpoint = models.CharField(max_length=30, verbose_name='سرویس')
+    stage = models.CharField(max_length=30, default='reading', verbose_name='مرحله')
+    language = models.CharField(max_length=5, blank=True, default='', verbose_name='زبان')
+    model = models.CharField(max_length=100, verbose_name='مدل')
+    requests = models.PositiveIntegerField(default=0, verbose_name='تعداد درخواست')
+    prompt_tokens = models.PositiveBigIntegerField(default=0, verbose_name='توکن‌های ورودی')
+    completion_tokens = models.PositiveBigIntegerField(default=0, verbose_name='توکن‌های خروجی')
+    cached_tokens = models.PositiveBigIntegerField(default=0, verbose_name='توکن‌های کش‌شده')
+    
+    class Meta:
+        verbose_name = 'مصرف روزانه توکن'
+        verbose_name_plural = 'مصرف روزانه توکن'
+        ordering = ['-day', 'endpoint']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'user', 'endpoint', 'stage', 'language', 'model'],
+                name='unique_daily_token_usage',
+            ),
+            # NULLs are distinct in the constraint above
+            models.UniqueConstraint(
+                fields=['day', 'endpoint', 'stage', 'language', 'model'],
+                condition=models.Q(user__isnull=True),
+                name='unique_daily_token_usage_anonymous',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.endpoint}/{self.stage} - {self.model}"
+    
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+    
+    @property
+    def cache_hit_ratio(self):
+        """Share of prompt tokens served from the provider's prompt cache"""
+        if not self.prompt_tokens:
+            return 0.0
+        return self.cached_tokens / self.prompt_tokens
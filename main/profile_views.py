@@ -2,14 +2,17 @@ import logging
 from rest_framework import status, generics, permissions
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
+from django.db.models import Count, Max
 from django.shortcuts import get_object_or_404
+from .conditional import AUTH_VARY, PRIVATE_REVALIDATE, conditional_response, make_etag
 from .models import FortuneProfile
 from .serializers import FortuneProfileSerializer
+from .db_routers import ReplicaReadMixin
 
 logger = logging.getLogger('main')
 
 
-class FortuneProfileViewSet(ModelViewSet):
+class FortuneProfileViewSet(ReplicaReadMixin, ModelViewSet):
     """
     ViewSet for managing fortune reading profiles.
     
@@ -20,6 +23,8 @@ class FortuneProfileViewSet(ModelViewSet):
     - Delete: DELETE /api/v1/profiles/{id}/ - Delete a profile
     
     Authentication: Optional (profiles can be created without login, but login allows syncing)
+    
+    Read-only requests (list/retrieve) are served from a read replica when configured.
     """
     serializer_class = FortuneProfileSerializer
     permission_classes = [permissions.AllowAny]  # Allow anonymous profiles
@@ -33,13 +38,30 @@ class FortuneProfileViewSet(ModelViewSet):
             return FortuneProfile.objects.filter(user=self.request.user)
         return FortuneProfile.objects.none()
     
+    def list(self, request, *args, **kwargs):
+        """
+        List profiles, answering conditional requests from one aggregate query:
+        any create, update or delete changes the count or the newest updated_at.
+        No Last-Modified: deleting a profile does not make the list newer.
+        """
+        stats = self.get_queryset().aggregate(count=Count('id'), last_modified=Max('updated_at'))
+        return conditional_response(
+            request,
+            lambda: super(FortuneProfileViewSet, self).list(request, *args, **kwargs),
+            etag=make_etag(
+                'profiles', request.user.pk, stats['count'], stats['last_modified'], request.get_full_path()
+            ),
+            cache_control=PRIVATE_REVALIDATE,
+            vary=AUTH_VARY,
+        )
+
     def perform_create(self, serializer):
         """Assign profile to user if authenticated"""
         if self.request.user.is_authenticated:
             serializer.save(user=self.request.user)
         else:
             serializer.save()
-        logger.info(f"Profile created: {serializer.instance.name}")
+        logger.info("Profile created: %s", serializer.instance.name)
     
     def get_object(self):
         """Get profile, ensuring user can only access their own profiles if authenticated"""
@@ -62,5 +84,5 @@ class FortuneProfileViewSet(ModelViewSet):
         """Delete profile"""
         instance = self.get_object()
         self.perform_destroy(instance)
-        logger.info(f"Profile deleted: {instance.name}")
+        logger.info("Profile deleted: %s", instance.name)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,378 @@
+"""
+Prompt construction shared by the reading views.
+
+- Profile blocks only contain the fields that are actually filled in
+- One compact instruction template per endpoint
+- Static text (system, instructions, tarot card glossary) goes in the system
+  message and per-request data in the user message, so every endpoint and
+  language has a byte-stable prefix for the provider's prompt caching
+- Tokens are counted locally (tiktoken when available, estimate otherwise)
+- Each endpoint has an input-token budget (PROMPT_TOKEN_BUDGETS) for the
+  variable part; free-text fields such as profile notes and dream text are
+  trimmed to fit it
+"""
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+
+from .deck import get_deck
+from .language_utils import get_continuation_question_prompt, get_language_prompts
+from .models import CustomUser
+
+logger = logging.getLogger('main')
+
+# Encoding used by the gpt-4o family
+TOKEN_ENCODING = 'o200k_base'
+
+# Input-token budget of an endpoint missing from PROMPT_TOKEN_BUDGETS
+DEFAULT_PROMPT_TOKEN_BUDGET = 1000
+
+# Never trim a free-text field below this many tokens
+MIN_TRIMMED_TOKENS = 32
+
+# (profile key, label) in prompt order
+PROFILE_FIELDS = (
+    ('name', 'Name'),
+    ('age', 'Age'),
+    ('gender', 'Gender'),
+    ('job_status', 'Job Status'),
+    ('relationship_status', 'Relationship Status'),
+    ('city', 'City'),
+    ('country', 'Country'),
+    ('notes', 'Notes'),
+)
+
+READING_SYSTEM_TEMPLATE = (
+    "You are a professional {role}. Write in {language}. "
+    "Be warm, empathetic and give actionable insights."
+)
+
+ENDPOINT_ROLES = {
+    'horoscope': 'astrologer giving personalized horoscope readings',
+    'iching': 'I Ching (Book of Changes) reader',
+    'dream': 'dream interpreter using symbolism, psychology and cultural context',
+    'tarot': 'Tarot card reader who always answers with valid JSON',
+}
+
+# Static instructions, sent in the system message so that the whole prefix
+# (system + instructions + glossary) is byte-identical per endpoint and
+# language and can be served from the provider's prompt cache
+ENDPOINT_INSTRUCTIONS = {
+    'horoscope': (
+        "Give a detailed horoscope reading for the person described in the "
+        "user message, based on their profile."
+    ),
+    'iching': (
+        "The user message gives a profile and the hexagram lines (bottom to top). "
+        "Give a detailed I Ching reading: what the hexagram means, how it relates "
+        "to their situation, and guidance for their future."
+    ),
+    'dream': (
+        "The user message gives a profile and a dream. Interpret the dream for "
+        "this person: explain the symbolism, what it may mean in their life now, "
+        "and give guidance."
+    ),
+    'tarot': (
+        "The user message gives a profile and the cards drawn, in order, with "
+        "their position. Base meanings are in the card glossary below.\n"
+        "Return ONLY valid JSON: {\"individual_interpretations\": [{\"card_id\": int, "
+        "\"card_name\": str, \"is_reversed\": bool, \"interpretation\": str}, ...one per card, "
+        "same order], \"overall_reading\": str}.\n"
+        "Each interpretation: personalize it to the profile, the card's position "
+        "(upright/reversed) and their life situation. "
+        "Overall reading: tie the cards into one story, explain how they relate "
+        "and give advice."
+    ),
+}
+
+# Variable, per-request content only
+USER_TEMPLATES = {
+    'horoscope': "{profile}",
+    'iching': "{profile}\nHexagram lines (bottom to top):\n{hexagram}",
+    'dream': "{profile}\nDream:\n{dream_text}",
+    'tarot': "{profile}\nCards drawn (in order):\n{cards}",
+    'coffee': "{profile}",
+}
+
+# Label placed before the reading in continuation-question prompts
+READING_LABELS = {
+    'coffee': 'Coffee Reading',
+    'horoscope': 'Horoscope Reading',
+    'iching': 'I Ching Reading',
+    'dream': 'Dream Interpretation',
+    'tarot': 'Tarot Reading',
+}
+
+
+@lru_cache(maxsize=1)
+def _get_encoder():
+    """Load the tiktoken encoder once; None if tiktoken or its data is unavailable"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        logger.info("tiktoken unavailable, estimating token counts: %s", e)
+        return None
+
+
+def count_tokens(text):
+    """
+    Count tokens in text.
+
+    Uses tiktoken when installed; otherwise estimates ~4 ASCII characters per
+    token and one token per non-ASCII character (close for Persian, Arabic, CJK).
+    """
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def trim_to_tokens(text, max_tokens):
+    """Cut text down to at most max_tokens tokens, marking the cut with an ellipsis"""
+    if not text or count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 1:
+        return ''
+    # Keep one token for the ellipsis
+    max_tokens -= 1
+    encoder = _get_encoder()
+    if encoder is not None:
+        return encoder.decode(encoder.encode(text)[:max_tokens]).rstrip() + '…'
+    # Shrink proportionally until the estimate fits
+    trimmed = text
+    while trimmed and count_tokens(trimmed) > max_tokens:
+        trimmed = trimmed[:int(len(trimmed) * max_tokens / count_tokens(trimmed)) - 1]
+    return trimmed.rstrip() + '…'
+
+
+def get_token_budget(endpoint):
+    """Get the input-token budget for an endpoint"""
+    budgets = getattr(settings, 'PROMPT_TOKEN_BUDGETS', None) or {}
+    return budgets.get(endpoint, DEFAULT_PROMPT_TOKEN_BUDGET)
+
+
+@lru_cache(maxsize=None)
+def language_name(language_code):
+    """
+    Get the English name of a language code for prompts (e.g. 'fa' -> 'Persian').
+    Falls back to the code itself for unknown languages.
+    """
+    for code, label in CustomUser.LANGUAGE_CHOICES:
+        if code == language_code:
+            if '(' in label:
+                return label[label.rindex('(') + 1:label.rindex(')')]
+            return label
+    return language_code
+
+
+def build_profile_info(profile_data):
+    """
+    Build a compact profile block, skipping empty fields.
+
+    Args:
+        profile_data: dict with keys from PROFILE_FIELDS (missing keys are fine)
+
+    Returns:
+        str: One "Label: value" line per filled field, or '' if nothing is set
+    """
+    if not profile_data:
+        return ''
+    lines = []
+    for key, label in PROFILE_FIELDS:
+        value = profile_data.get(key)
+        if value is None:
+            continue
+        value = str(value).strip()
+        if value:
+            lines.append(f"{label}: {value}")
+    return "\n".join(lines)
+
+
+class Prompt:
+    """
+    A built prompt with its local token counts.
+
+    ``system`` is the static prefix (identical for every request to the same
+    endpoint and language); ``user`` holds the per-request data. ``cache_key``
+    is sent as ``prompt_cache_key`` so requests sharing a prefix are routed to
+    the same provider cache.
+    """
+
+    def __init__(self, endpoint, system, user, budget, trimmed=(), cache_key=None):
+        self.endpoint = endpoint
+        self.system = system
+        self.user = user
+        self.budget = budget
+        self.trimmed = tuple(trimmed)
+        self.cache_key = cache_key or endpoint
+        self.prefix_tokens = count_tokens(system)
+        self.variable_tokens = count_tokens(user)
+        self.tokens = self.prefix_tokens + self.variable_tokens
+
+    def messages(self):
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user},
+        ]
+
+    def report(self):
+        """Log the prompt size so savings are visible per endpoint"""
+        logger.info(
+            "Prompt size for %s: %d static + %d variable tokens (budget %d, trimmed: %s)",
+            self.endpoint, self.prefix_tokens, self.variable_tokens, self.budget,
+            ', '.join(self.trimmed) or 'none',
+        )
+        return self
+
+
+def build_prompt(endpoint, system, template, profile_data=None, trimmable=(),
+                 cache_key=None, **values):
+    """
+    Render a prompt and enforce the endpoint's input-token budget.
+
+    The budget applies to the variable user message only; the static system
+    prefix is left untouched so it stays cacheable.
+
+    Args:
+        endpoint: Endpoint name, used to look up the budget
+        system: Static system prompt text
+        template: str.format template; '{profile}' receives the profile block
+        profile_data: Optional profile dict
+        trimmable: Names of entries in ``values`` that may be shortened
+            (profile notes are always trimmed first)
+        cache_key: Prompt cache routing key (defaults to the endpoint)
+        **values: Other template values
+
+    Returns:
+        Prompt
+    """
+    budget = get_token_budget(endpoint)
+    profile = dict(profile_data or {})
+    values = dict(values)
+
+    def render():
+        return template.format(profile=build_profile_info(profile), **values).strip()
+
+    user = render()
+    trimmed = []
+    for field in ('notes',) + tuple(trimmable):
+        excess = count_tokens(user) - budget
+        if excess <= 0:
+            break
+        container = profile if field == 'notes' else values
+        text = container.get(field)
+        if not text:
+            continue
+        keep = max(count_tokens(text) - excess, MIN_TRIMMED_TOKENS)
+        container[field] = trim_to_tokens(text, keep)
+        trimmed.append(field)
+        user = render()
+
+    return Prompt(endpoint, system, user, budget, trimmed, cache_key=cache_key)
+
+
+def build_reading_system(endpoint, language):
+    """Render the static system prompt (role, language and instructions) for an endpoint"""
+    return "\n\n".join([
+        READING_SYSTEM_TEMPLATE.format(
+            role=ENDPOINT_ROLES[endpoint], language=language_name(language)
+        ),
+        ENDPOINT_INSTRUCTIONS[endpoint],
+    ])
+
+
+def build_reading_prompt(endpoint, language, profile_data=None, trimmable=(), **values):
+    """Build a prompt from the endpoint's static system prompt and its user template"""
+    return build_prompt(
+        endpoint, build_reading_system(endpoint, language), USER_TEMPLATES[endpoint],
+        profile_data=profile_data, trimmable=trimmable,
+        cache_key=f'{endpoint}-{language}', **values
+    ).report()
+
+
+def build_coffee_prompt(language, profile_data=None):
+    """
+    Build the coffee reading prompt. The language's system text and reading
+    instructions form the static prefix; the user message only carries the
+    profile (the images are attached by the view).
+    """
+    prompts = get_language_prompts(language)
+    system = f"{prompts['system']}\n\n{prompts['user']}"
+    return build_prompt(
+        'coffee', system, USER_TEMPLATES['coffee'], profile_data=profile_data,
+        cache_key=f'coffee-{language}'
+    ).report()
+
+
+def build_questions_prompt(endpoint, language, reading, instructions=None):
+    """
+    Build the continuation-questions prompt.
+
+    Args:
+        endpoint: Endpoint the reading came from
+        language: Language code
+        reading: The generated reading text
+        instructions: Optional replacement for the language's question instructions
+
+    Returns:
+        Prompt
+    """
+    prompts = get_continuation_question_prompt(language)
+    system = f"{prompts['system']}\n\n{instructions or prompts['user']}"
+    user = f"{READING_LABELS[endpoint]}:\n{reading}"
+    return Prompt(
+        endpoint, system, user, get_token_budget(endpoint),
+        cache_key=f'questions-{endpoint}-{language}'
+    )
+
+
+_glossary_cache = {}
+
+
+def get_tarot_glossary():
+    """
+    Card glossary for the tarot system prompt: one line per card in the deck
+    with both base meanings. Rebuilt only when the deck changes.
+    """
+    deck = get_deck()
+    cached = _glossary_cache.get('glossary')
+    if cached is not None and cached[0] == deck.version:
+        return cached[1]
+
+    lines = []
+    for card in deck:
+        line = f"[id {card.id}] {card.name} ({card.suit_display})"
+        if card.meaning:
+            line += f" upright: {card.meaning}"
+        if card.reversed_meaning:
+            line += f"; reversed: {card.reversed_meaning}"
+        lines.append(line)
+    glossary = "\n".join(lines)
+    _glossary_cache['glossary'] = (deck.version, glossary)
+    return glossary
+
+
+def build_tarot_cards_info(card_data):
+    """
+    Card list for the tarot user message: one line per drawn card with its
+    position. Meanings live in the glossary of the static prefix.
+    """
+    lines = []
+    for i, card in enumerate(card_data):
+        position = 'reversed' if card['is_reversed'] else 'upright'
+        lines.append(f"{i + 1}. [id {card['id']}] {card['name']}, {position}")
+    return "\n".join(lines)
+
+
+def build_tarot_prompt(language, profile_data, card_data):
+    """Build the tarot prompt: static system + instructions + deck glossary, then the spread"""
+    system = f"{build_reading_system('tarot', language)}\n\nCard glossary:\n{get_tarot_glossary()}"
+    return build_prompt(
+        'tarot', system, USER_TEMPLATES['tarot'], profile_data,
+        cache_key=f'tarot-{language}', cards=build_tarot_cards_info(card_data)
+    ).report()
@@ -0,0 +1,140 @@
+"""
+Registry of per-language prompt texts.
+
+The texts live in data files under ``main/prompts/``:
+
+- ``index.json``: format version, default language and the ordered list of
+  supported languages (read at import; changing it needs a restart)
+- ``<code>.json``: one language's catalogs (``coffee``, ``questions``), each
+  with ``system`` and ``user`` texts
+
+A language file is read the first time that language is used and its texts
+are kept as plain strings. Files are re-read when their mtime changes
+(checked at most every PROMPTS_RELOAD_INTERVAL seconds), so prompt edits go
+live without restarting the workers. ``warmup()`` loads languages up front,
+e.g. before gunicorn forks its workers.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger('main')
+
+PROMPTS_DIR = Path(__file__).resolve().parent / 'prompts'
+
+# Data file format understood by this module
+FORMAT_VERSION = 1
+
+
+class LanguagePrompts:
+    """All catalogs of one language file"""
+
+    __slots__ = ('code', 'mtime', 'checked', 'texts')
+
+    def __init__(self, code, mtime, data):
+        self.code = code
+        self.mtime = mtime
+        self.checked = time.monotonic()
+        # Shared by every caller of PromptRegistry.get()
+        self.texts = {name: parts for name, parts in data.items() if name != 'version'}
+
+
+class PromptRegistry:
+    """Lazily loaded, hot-reloadable prompt catalogs"""
+
+    def __init__(self, directory=PROMPTS_DIR):
+        self.directory = Path(directory)
+        index = self._read(self.directory / 'index.json')
+        self.languages = tuple(index['languages'])
+        self.codes = frozenset(self.languages)
+        self.default_language = index['default_language']
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _read(path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported prompt file version {data.get('version')!r}")
+        return data
+
+    def _path(self, code):
+        return self.directory / f'{code}.json'
+
+    def _language(self, code):
+        loaded = self._loaded.get(code)
+        if loaded is not None and not self._is_stale(loaded):
+            return loaded
+        with self._lock:
+            loaded = self._loaded.get(code)
+            if loaded is None or self._is_stale(loaded):
+                path = self._path(code)
+                mtime = os.stat(path).st_mtime_ns
+                if loaded is not None and loaded.mtime == mtime:
+                    loaded.checked = time.monotonic()
+                    return loaded
+                if loaded is None:
+                    loaded = self._loaded[code] = LanguagePrompts(code, mtime, self._read(path))
+                    return loaded
+                logger.info("Reloading prompts for %s", code)
+                try:
+                    loaded = self._loaded[code] = LanguagePrompts(code, mtime, self._read(path))
+                except (OSError, ValueError) as e:
+                    # Half-written or invalid edit: keep serving the old texts
+                    logger.error("Failed to reload prompts for %s: %s", code, e)
+                    loaded.checked = time.monotonic()
+            return loaded
+
+    def _is_stale(self, loaded):
+        interval = getattr(settings, 'PROMPTS_RELOAD_INTERVAL', 5)
+        return bool(interval) and time.monotonic() - loaded.checked >= interval
+
+    def _catalog(self, language, catalog):
+        if language in self.codes:
+            parts = self._language(language)
+            if catalog in parts.texts:
+                return parts
+        return self._language(self.default_language)
+
+    def get(self, language, catalog):
+        """
+        Get a catalog's texts, falling back to the default language.
+
+        Args:
+            language: Language code
+            catalog: Catalog name ('coffee', 'questions')
+
+        Returns:
+            dict: {'system': str, 'user': str} (shared, do not modify)
+        """
+        return self._catalog(language, catalog).texts[catalog]
+
+    def loaded_languages(self):
+        """Codes of the languages currently in memory"""
+        return sorted(self._loaded)
+
+    def warmup(self, languages=None):
+        """
+        Load languages before they are first requested.
+
+        Args:
+            languages: Codes to load, '*' for all (default:
+                PROMPTS_WARMUP_LANGUAGES); the default language is always loaded
+        """
+        if languages is None:
+            languages = getattr(settings, 'PROMPTS_WARMUP_LANGUAGES', [])
+        if languages == '*' or '*' in languages:
+            languages = self.languages
+        for code in languages:
+            if code in self.codes:
+                self._language(code)
+        self._language(self.default_language)
+
+
+registry = PromptRegistry()
@@ -0,0 +1,500 @@
+"""
+Continuation questions ("what would you like to know next?") for readings.
+
+Two sources:
+- 'llm': a second, small model call (see main.llm QUESTIONS stage)
+- 'local': a rule-based generator with no model call. Topics (love, money,
+  career...) are detected by keyword in the reading text and turned into
+  questions from per-language templates.
+
+CONTINUATION_QUESTIONS_MODE selects the source per endpoint. The local
+generator is also the fallback whenever the model call fails or returns
+fewer than three usable questions.
+"""
+import logging
+import re
+from functools import lru_cache
+
+from django.conf import settings
+
+from .llm import QUESTIONS, chat_completion
+from .prompt_builder import build_questions_prompt
+
+logger = logging.getLogger('main')
+
+QUESTION_COUNT = 3
+MODE_LLM = 'llm'
+MODE_LOCAL = 'local'
+
+# Topics in default order (used for padding when the reading mentions few topics)
+TOPICS = ('love', 'money', 'career', 'health', 'family', 'travel', 'future')
+
+# Lower-case keywords (or word-start stems, except WHOLE_WORD_KEYWORDS) per
+# topic and language. English keywords are always checked as well, since
+# readings sometimes mix languages.
+TOPIC_KEYWORDS = {
+    'en': {
+        'love': ('love', 'romanc', 'relationship', 'partner', 'heart', 'marriage', 'wedding', 'crush', 'soulmate'),
+        'money': ('money', 'financ', 'wealth', 'income', 'debt', 'salary', 'invest', 'savings'),
+        'career': ('career', 'job', 'work', 'business', 'promotion', 'boss', 'colleague', 'project', 'study'),
+        'health': ('health', 'energy', 'body', 'illness', 'heal', 'stress', 'rest', 'sleep'),
+        'family': ('family', 'mother', 'father', 'child', 'sister', 'brother', 'home', 'parent'),
+        'travel': ('travel', 'journey', 'trip', 'abroad', 'move', 'road', 'migrat'),
+        'future': ('future', 'destiny', 'path', 'opportunit', 'change', 'new beginning'),
+    },
+    'fa': {
+        'love': ('عشق', 'عاشق', 'رابطه', 'ازدواج', 'همسر', 'محبت', 'نامزد'),
+        'money': ('پول', 'مالی', 'ثروت', 'درآمد', 'بدهی', 'سرمایه', 'حقوق'),
+        'career': ('شغل', 'کسب‌وکار', 'محل کار', 'حرفه', 'ترفیع', 'تجارت', 'تحصیل', 'درس'),
+        'health': ('سلامت', 'بیماری', 'انرژی', 'استرس', 'خواب', 'درمان'),
+        'family': ('خانواده', 'مادر', 'پدر', 'فرزند', 'خواهر', 'برادر', 'خانه'),
+        'travel': ('سفر', 'مهاجرت', 'جاده', 'خارج'),
+        'future': ('آینده', 'سرنوشت', 'فرصت', 'تغییر', 'مسیر'),
+    },
+    'ar': {
+        'love': ('حب', 'عشق', 'علاقة', 'زواج', 'شريك', 'قلب', 'خطوبة'),
+        'money': ('مال', 'مالي', 'ثروة', 'دخل', 'دين', 'رزق', 'راتب'),
+        'career': ('عمل', 'وظيفة', 'مهنة', 'ترقية', 'تجارة', 'دراسة'),
+        'health': ('صحة', 'مرض', 'طاقة', 'توتر', 'نوم', 'شفاء'),
+        'family': ('عائلة', 'أسرة', 'والد', 'طفل', 'أطفال', 'أخت', 'بيت'),
+        'travel': ('سفر', 'رحلة', 'هجرة', 'طريق'),
+        'future': ('مستقبل', 'قدر', 'فرصة', 'تغيير'),
+    },
+    'tr': {
+        'love': ('aşk', 'sevgi', 'ilişki', 'evlilik', 'partner', 'kalp', 'sevgili'),
+        'money': ('para', 'maddi', 'finans', 'servet', 'gelir', 'borç', 'maaş'),
+        'career': ('kariyer', 'iş', 'meslek', 'terfi', 'ticaret', 'okul', 'eğitim'),
+        'health': ('sağlık', 'hastalık', 'enerji', 'stres', 'uyku'),
+        'family': ('aile', 'anne', 'baba', 'çocuk', 'kardeş', 'yuva'),
+        'travel': ('seyahat', 'yolculuk', 'yol', 'gurbet', 'taşın'),
+        'future': ('gelecek', 'kader', 'fırsat', 'değişim'),
+    },
+    'es': {
+        'love': ('amor', 'romance', 'relación', 'pareja', 'corazón', 'matrimonio', 'boda'),
+        'money': ('dinero', 'financ', 'riqueza', 'ingreso', 'deuda', 'salario', 'inversión'),
+        'career': ('carrera', 'trabajo', 'empleo', 'negocio', 'ascenso', 'estudio'),
+        'health': ('salud', 'energía', 'enfermedad', 'estrés', 'descanso'),
+        'family': ('familia', 'madre', 'padre', 'hijo', 'hermano', 'hermana', 'hogar'),
+        'travel': ('viaje', 'camino', 'extranjero', 'mudanza'),
+        'future': ('futuro', 'destino', 'oportunidad', 'cambio'),
+    },
+    'fr': {
+        'love': ('amour', 'romance', 'relation', 'partenaire', 'cœur', 'mariage'),
+        'money': ('argent', 'financ', 'richesse', 'revenu', 'dette', 'salaire'),
+        'career': ('carrière', 'travail', 'emploi', 'affaires', 'promotion', 'études'),
+        'health': ('santé', 'énergie', 'maladie', 'stress', 'repos', 'sommeil'),
+        'family': ('famille', 'mère', 'père', 'enfant', 'frère', 'sœur', 'foyer'),
+        'travel': ('voyage', 'chemin', 'étranger', 'déménag'),
+        'future': ('avenir', 'futur', 'destin', 'opportunité', 'changement'),
+    },
+    'de': {
+        'love': ('liebe', 'romant', 'beziehung', 'partner', 'herz', 'ehe', 'hochzeit'),
+        'money': ('geld', 'finanz', 'reichtum', 'einkommen', 'schulden', 'gehalt'),
+        'career': ('karriere', 'arbeit', 'beruf', 'geschäft', 'beförderung', 'studium'),
+        'health': ('gesundheit', 'energie', 'krankheit', 'stress', 'schlaf'),
+        'family': ('familie', 'mutter', 'vater', 'kind', 'bruder', 'schwester', 'zuhause'),
+        'travel': ('reise', 'weg', 'ausland', 'umzug'),
+        'future': ('zukunft', 'schicksal', 'chance', 'veränderung'),
+    },
+    'it': {
+        'love': ('amore', 'romantic', 'relazione', 'partner', 'cuore', 'matrimonio'),
+        'money': ('soldi', 'denaro', 'finanz', 'ricchezza', 'reddito', 'debito', 'stipendio'),
+        'career': ('carriera', 'lavoro', 'impiego', 'affari', 'promozione', 'studio'),
+        'health': ('salute', 'energia', 'malattia', 'stress', 'riposo'),
+        'family': ('famiglia', 'madre', 'padre', 'figli', 'fratello', 'sorella', 'casa'),
+        'travel': ('viaggio', 'cammino', 'estero', 'trasferiment'),
+        'future': ('futuro', 'destino', 'opportunità', 'cambiamento'),
+    },
+    'pt': {
+        'love': ('amor', 'romance', 'relacionamento', 'parceiro', 'coração', 'casamento'),
+        'money': ('dinheiro', 'financ', 'riqueza', 'renda', 'dívida', 'salário'),
+        'career': ('carreira', 'trabalho', 'emprego', 'negócio', 'promoção', 'estudo'),
+        'health': ('saúde', 'energia', 'doença', 'estresse', 'descanso'),
+        'family': ('família', 'mãe', 'pai', 'filho', 'irmão', 'irmã', 'lar'),
+        'travel': ('viagem', 'caminho', 'exterior', 'mudança de casa'),
+        'future': ('futuro', 'destino', 'oportunidade', 'mudança'),
+    },
+    'ru': {
+        'love': ('любов', 'роман', 'отношени', 'партнер', 'сердц', 'брак', 'свадьб'),
+        'money': ('деньг', 'финанс', 'богатств', 'доход', 'долг', 'зарплат'),
+        'career': ('карьер', 'работ', 'професси', 'бизнес', 'повышени', 'учеб'),
+        'health': ('здоров', 'энерги', 'болезн', 'стресс', 'сон', 'отдых'),
+        'family': ('семь', 'мать', 'мам', 'отец', 'пап', 'ребен', 'дети', 'брат', 'сестр', 'дом'),
+        'travel': ('путешеств', 'поездк', 'дорог', 'заграниц', 'переезд'),
+        'future': ('будущ', 'судьб', 'возможност', 'перемен'),
+    },
+    'ur': {
+        'love': ('محبت', 'عشق', 'رشتہ', 'شادی', 'ساتھی'),
+        'money': ('پیسہ', 'پیسے', 'مالی', 'دولت', 'آمدنی', 'قرض', 'تنخواہ'),
+        'career': ('کیریئر', 'نوکری', 'کام', 'کاروبار', 'ترقی', 'تعلیم'),
+        'health': ('صحت', 'بیماری', 'توانائی', 'تناؤ', 'نیند'),
+        'family': ('خاندان', 'ماں', 'باپ', 'بچے', 'بہن', 'بھائی', 'گھر'),
+        'travel': ('سفر', 'بیرون', 'راستہ'),
+        'future': ('مستقبل', 'تقدیر', 'موقع', 'تبدیلی'),
+    },
+    'hi': {
+        'love': ('प्रेम', 'प्यार', 'रिश्त', 'विवाह', 'शादी', 'साथी', 'दिल'),
+        'money': ('पैस', 'धन', 'वित्त', 'आय', 'कर्ज', 'वेतन'),
+        'career': ('करियर', 'नौकरी', 'काम', 'व्यवसाय', 'पदोन्नति', 'पढ़ाई'),
+        'health': ('स्वास्थ्य', 'सेहत', 'बीमारी', 'ऊर्जा', 'तनाव', 'नींद'),
+        'family': ('परिवार', 'माँ', 'पिता', 'बच्च', 'बहन', 'भाई', 'घर'),
+        'travel': ('यात्रा', 'सफर', 'विदेश', 'रास्त'),
+        'future': ('भविष्य', 'भाग्य', 'अवसर', 'बदलाव'),
+    },
+    'nl': {
+        'love': ('liefde', 'romant', 'relatie', 'partner', 'hart', 'huwelijk'),
+        'money': ('geld', 'financ', 'rijkdom', 'inkomen', 'schuld', 'salaris'),
+        'career': ('carrière', 'werk', 'baan', 'zaken', 'promotie', 'studie'),
+        'health': ('gezondheid', 'energie', 'ziekte', 'stress', 'slaap'),
+        'family': ('familie', 'gezin', 'moeder', 'vader', 'kind', 'broer', 'zus', 'thuis'),
+        'travel': ('reis', 'weg', 'buitenland', 'verhuiz'),
+        'future': ('toekomst', 'lot', 'kans', 'verandering'),
+    },
+    'id': {
+        'love': ('cinta', 'asmara', 'hubungan', 'pasangan', 'hati', 'pernikahan'),
+        'money': ('uang', 'keuangan', 'kekayaan', 'pendapatan', 'utang', 'gaji', 'rezeki'),
+        'career': ('karier', 'pekerjaan', 'kerja', 'bisnis', 'promosi', 'kuliah'),
+        'health': ('kesehatan', 'sehat', 'energi', 'penyakit', 'stres', 'tidur'),
+        'family': ('keluarga', 'ibu', 'ayah', 'anak', 'saudara', 'rumah'),
+        'travel': ('perjalanan', 'bepergian', 'luar negeri', 'pindah'),
+        'future': ('masa depan', 'takdir', 'peluang', 'perubahan'),
+    },
+    'zh': {
+        'love': ('爱', '感情', '恋', '婚', '伴侣'),
+        'money': ('钱', '财', '收入', '债', '工资', '投资'),
+        'career': ('事业', '工作', '职业', '生意', '升职', '学业'),
+        'health': ('健康', '身体', '疾病', '能量', '压力', '睡眠'),
+        'family': ('家庭', '家人', '母亲', '父亲', '孩子', '兄弟', '姐妹'),
+        'travel': ('旅行', '旅程', '出国', '搬家'),
+        'future': ('未来', '命运', '机会', '变化'),
+    },
+    'ja': {
+        'love': ('恋', '愛', '関係', '結婚', 'パートナー'),
+        'money': ('お金', '金運', '財', '収入', '借金', '給料'),
+        'career': ('仕事', 'キャリア', '職', 'ビジネス', '昇進', '勉強'),
+        'health': ('健康', '体', '病気', 'エネルギー', 'ストレス', '睡眠'),
+        'family': ('家族', '母', '父', '子供', '兄弟', '姉妹', '家庭'),
+        'travel': ('旅', '旅行', '海外', '引っ越'),
+        'future': ('未来', '将来', '運命', 'チャンス', '変化'),
+    },
+}
+
+# One question per topic and language
+QUESTION_TEMPLATES = {
+    'en': {
+        'love': "Hey sweetie, wanna know the love secrets I saw in your reading?",
+        'money': "Tell me, you wanna know what your finances are saying?",
+        'career': "You wanna know how your career future is gonna be?",
+        'health': "Wanna know what your reading says about your health and energy?",
+        'family': "Shall I tell you what I see for your family?",
+        'travel': "Wanna know if there's a journey waiting for you?",
+        'future': "Wanna know what the coming months have in store for you?",
+    },
+    'fa': {
+        'love': "ببین عزیزم، می‌خوای رازهای عشقی که تو فالت دیدم رو برات بگم؟",
+        'money': "بگو ببینم، می‌خوای بدونی وضعیت مالی‌ت چی می‌گه؟",
+        'career': "داری می‌خوای بدونی آینده شغلی‌ت چطوری میشه؟",
+        'health': "می‌خوای بدونی فالت درباره سلامتی و انرژیت چی می‌گه؟",
+        'family': "بگم برات تو فالت برای خانواده‌ت چی دیدم؟",
+        'travel': "می‌خوای بدونی سفری تو راهت هست یا نه؟",
+        'future': "می‌خوای بدونی چند ماه آینده چی برات داره؟",
+    },
+    'ar': {
+        'love': "شوفي حبيبتي، بدك أعرفك أسرار الحب اللي شفتها في قراءتك؟",
+        'money': "قولي، بدك تعرف وضعك المالي إيش بقول؟",
+        'career': "بدك تعرف مستقبل شغلك إيش راح يكون؟",
+        'health': "بدك تعرف إيش بتقول قراءتك عن صحتك وطاقتك؟",
+        'family': "أقولك إيش شفت لعائلتك؟",
+        'travel': "بدك تعرف إذا في سفر بستناك؟",
+        'future': "بدك تعرف إيش مخبيلك الشهور الجاية؟",
+    },
+    'tr': {
+        'love': "Bak canım, falında gördüğüm aşk sırlarını söyleyeyim mi?",
+        'money': "Söyle bakalım, maddi durumunun ne dediğini öğrenmek ister misin?",
+        'career': "Kariyer geleceğinin nasıl olacağını öğrenmek ister misin?",
+        'health': "Falının sağlığın ve enerjin hakkında ne dediğini öğrenmek ister misin?",
+        'family': "Ailen için ne gördüğümü söyleyeyim mi?",
+        'travel': "Seni bekleyen bir yolculuk var mı, öğrenmek ister misin?",
+        'future': "Önümüzdeki aylar sana neler getirecek, öğrenmek ister misin?",
+    },
+    'es': {
+        'love': "¿Te gustaría saber más sobre el amor que vi en tu lectura?",
+        'money': "¿Qué te gustaría saber sobre tu situación financiera?",
+        'career': "¿Quieres saber cómo será tu futuro profesional?",
+        'health': "¿Quieres saber qué dice tu lectura sobre tu salud y tu energía?",
+        'family': "¿Te cuento lo que veo para tu familia?",
+        'travel': "¿Quieres saber si te espera un viaje?",
+        'future': "¿Quieres saber qué te deparan los próximos meses?",
+    },
+    'fr': {
+        'love': "Voudriez-vous en savoir plus sur l'amour que j'ai vu dans votre lecture ?",
+        'money': "Que voudriez-vous savoir sur votre situation financière ?",
+        'career': "Voulez-vous savoir comment sera votre avenir professionnel ?",
+        'health': "Voulez-vous savoir ce que votre lecture dit de votre santé et de votre énergie ?",
+        'family': "Voulez-vous que je vous dise ce que je vois pour votre famille ?",
+        'travel': "Voulez-vous savoir si un voyage vous attend ?",
+        'future': "Voulez-vous savoir ce que les prochains mois vous réservent ?",
+    },
+    'de': {
+        'love': "Möchten Sie mehr über die Liebe erfahren, die ich in Ihrer Deutung gesehen habe?",
+        'money': "Was möchten Sie über Ihre finanzielle Situation wissen?",
+        'career': "Möchten Sie wissen, wie Ihre berufliche Zukunft aussieht?",
+        'health': "Möchten Sie wissen, was Ihre Deutung über Ihre Gesundheit und Energie sagt?",
+        'family': "Soll ich Ihnen sagen, was ich für Ihre Familie sehe?",
+        'travel': "Möchten Sie wissen, ob eine Reise auf Sie wartet?",
+        'future': "Möchten Sie wissen, was die nächsten Monate für Sie bereithalten?",
+    },
+    'it': {
+        'love': "Vorresti saperne di più sull'amore che ho visto nella tua lettura?",
+        'money': "Cosa vorresti sapere sulla tua situazione finanziaria?",
+        'career': "Vuoi sapere come sarà il tuo futuro lavorativo?",
+        'health': "Vuoi sapere cosa dice la tua lettura sulla tua salute e la tua energia?",
+        'family': "Vuoi che ti dica cosa vedo per la tua famiglia?",
+        'travel': "Vuoi sapere se ti aspetta un viaggio?",
+        'future': "Vuoi sapere cosa ti riservano i prossimi mesi?",
+    },
+    'pt': {
+        'love': "Gostaria de saber mais sobre o amor que vi na sua leitura?",
+        'money': "O que você gostaria de saber sobre sua situação financeira?",
+        'career': "Quer saber como será seu futuro profissional?",
+        'health': "Quer saber o que sua leitura diz sobre sua saúde e energia?",
+        'family': "Quer que eu conte o que vejo para sua família?",
+        'travel': "Quer saber se há uma viagem esperando por você?",
+        'future': "Quer saber o que os próximos meses reservam para você?",
+    },
+    'ru': {
+        'love': "Хотели бы вы узнать больше о любви, которую я увидела в вашем гадании?",
+        'money': "Что вы хотели бы узнать о своем финансовом положении?",
+        'career': "Хотите узнать, какой будет ваша карьера?",
+        'health': "Хотите узнать, что гадание говорит о вашем здоровье и энергии?",
+        'family': "Рассказать, что я вижу для вашей семьи?",
+        'travel': "Хотите узнать, ждет ли вас путешествие?",
+        'future': "Хотите узнать, что принесут вам ближайшие месяцы?",
+    },
+    'ur': {
+        'love': "دیکھو پیاری، چاہو میں تمہیں محبت کے راز بتاؤں جو میں نے تمہاری فال میں دیکھے؟",
+        'money': "بتاؤ، چاہتے ہو جانیں تمہاری مالی صورتحال کیا کہہ رہی ہے؟",
+        'career': "چاہتے ہو جانیں تمہارے کیریئر کا مستقبل کیسا ہوگا؟",
+        'health': "چاہتے ہو جانیں تمہاری فال تمہاری صحت اور توانائی کے بارے میں کیا کہتی ہے؟",
+        'family': "بتاؤں میں نے تمہارے خاندان کے لیے کیا دیکھا؟",
+        'travel': "چاہتے ہو جانیں کوئی سفر تمہارا انتظار کر رہا ہے؟",
+        'future': "چاہتے ہو جانیں آنے والے مہینے تمہارے لیے کیا لائیں گے؟",
+    },
+    'hi': {
+        'love': "अरे प्यारी, क्या आप जानना चाहती हैं कि मैंने आपकी रीडिंग में प्रेम के रहस्य क्या देखे?",
+        'money': "बताइए, क्या आप जानना चाहती हैं कि आपकी आर्थिक स्थिति क्या कह रही है?",
+        'career': "क्या आप जानना चाहती हैं कि आपका करियर भविष्य कैसा होगा?",
+        'health': "क्या आप जानना चाहती हैं कि रीडिंग आपके स्वास्थ्य और ऊर्जा के बारे में क्या कहती है?",
+        'family': "क्या मैं बताऊँ कि मैंने आपके परिवार के लिए क्या देखा?",
+        'travel': "क्या आप जानना चाहती हैं कि कोई यात्रा आपका इंतज़ार कर रही है?",
+        'future': "क्या आप जानना चाहती हैं कि आने वाले महीने आपके लिए क्या लाएँगे?",
+    },
+    'nl': {
+        'love': "Wil je meer weten over de liefde die ik in je lezing zag?",
+        'money': "Wat wil je weten over je financiële situatie?",
+        'career': "Wil je weten hoe je carrière zich gaat ontwikkelen?",
+        'health': "Wil je weten wat je lezing zegt over je gezondheid en energie?",
+        'family': "Zal ik je vertellen wat ik voor je familie zie?",
+        'travel': "Wil je weten of er een reis op je wacht?",
+        'future': "Wil je weten wat de komende maanden voor je in petto hebben?",
+    },
+    'id': {
+        'love': "Mau tahu rahasia cinta yang kulihat dalam ramalanmu?",
+        'money': "Mau tahu apa kata ramalan tentang keuanganmu?",
+        'career': "Mau tahu bagaimana masa depan kariermu?",
+        'health': "Mau tahu apa kata ramalan tentang kesehatan dan energimu?",
+        'family': "Mau kuceritakan apa yang kulihat untuk keluargamu?",
+        'travel': "Mau tahu apakah ada perjalanan yang menantimu?",
+        'future': "Mau tahu apa yang menantimu dalam beberapa bulan ke depan?",
+    },
+    'zh': {
+        'love': "想知道我在你的占卜里看到的爱情秘密吗？",
+        'money': "想知道你的财运怎么样吗？",
+        'career': "想知道你的事业前景如何吗？",
+        'health': "想知道占卜对你的健康和精力说了什么吗？",
+        'family': "要我告诉你我为你的家人看到了什么吗？",
+        'travel': "想知道是否有一段旅程在等着你吗？",
+        'future': "想知道接下来几个月会给你带来什么吗？",
+    },
+    'ja': {
+        'love': "あなたの占いに見えた恋の秘密、知りたくない？",
+        'money': "あなたの金運が何を語っているか知りたい？",
+        'career': "あなたの仕事の未来がどうなるか知りたい？",
+        'health': "占いがあなたの健康とエネルギーについて何と言っているか知りたい？",
+        'family': "あなたの家族について見えたことを話そうか？",
+        'travel': "あなたを待っている旅があるか知りたい？",
+        'future': "これからの数ヶ月があなたに何をもたらすか知りたい？",
+    },
+}
+
+DEFAULT_TEMPLATE_LANGUAGE = 'en'
+
+# Leading numbering, bullets and markdown on model output lines
+_LIST_PREFIX = re.compile(r'^[\d\.\-\*\•\s]+')
+_MARKDOWN_PREFIX = re.compile(r'^[#\*\-]+\s*')
+_QUESTION_SPLIT = re.compile(r'[؟?]')
+
+# Minimum length of a usable question
+MIN_QUESTION_LENGTH = 10
+
+
+# Languages written without spaces: keywords match anywhere, not at word starts
+UNSEGMENTED_LANGUAGES = ('zh', 'ja')
+
+# Keywords matched as whole words only; as stems they would also match
+# 'restaurant', 'restore' or 'movement'
+WHOLE_WORD_KEYWORDS = frozenset({'rest', 'move'})
+
+
+def _alternation(keywords):
+    # Longest first so stems do not shadow longer keywords
+    return '|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+
+
+@lru_cache(maxsize=None)
+def _keyword_matcher(language):
+    """
+    Compile one regex per language over all topic keywords (plus English).
+
+    Returns:
+        tuple: (compiled regex, {keyword: topic})
+    """
+    topic_of = {}
+    anywhere = set()
+    for lang in (language, DEFAULT_TEMPLATE_LANGUAGE):
+        for topic, keywords in TOPIC_KEYWORDS.get(lang, {}).items():
+            for keyword in keywords:
+                topic_of.setdefault(keyword, topic)
+                if lang in UNSEGMENTED_LANGUAGES:
+                    anywhere.add(keyword)
+    whole = [k for k in topic_of if k in WHOLE_WORD_KEYWORDS and k not in anywhere]
+    parts = [r'\b(?:%s)' % _alternation(
+        k for k in topic_of if k not in anywhere and k not in WHOLE_WORD_KEYWORDS
+    )]
+    if whole:
+        parts.insert(0, r'\b(?:%s)\b' % _alternation(whole))
+    if anywhere:
+        parts.append(_alternation(anywhere))
+    return re.compile('|'.join(parts)), topic_of
+
+
+def extract_topics(text, language):
+    """
+    Rank the topics mentioned in a reading.
+
+    Args:
+        text: Reading text
+        language: Language code of the reading
+
+    Returns:
+        list: Topics ordered by number of keyword hits (ties keep TOPICS order)
+    """
+    if not text:
+        return []
+    regex, topic_of = _keyword_matcher(language)
+    counts = {}
+    for match in regex.finditer(text.lower()):
+        topic = topic_of[match.group(0)]
+        counts[topic] = counts.get(topic, 0) + 1
+    return sorted(counts, key=lambda topic: (-counts[topic], TOPICS.index(topic)))
+
+
+def generate_local_questions(text, language, count=QUESTION_COUNT):
+    """
+    Build continuation questions from the topics found in a reading.
+
+    No model call: runs in microseconds and never fails.
+
+    Args:
+        text: Reading text
+        language: Language code (languages without templates use English)
+        count: Number of questions
+
+    Returns:
+        list: ``count`` questions
+    """
+    templates = QUESTION_TEMPLATES.get(language) or QUESTION_TEMPLATES[DEFAULT_TEMPLATE_LANGUAGE]
+    topics = extract_topics(text, language)
+    for topic in TOPICS:
+        if topic not in topics:
+            topics.append(topic)
+    return [templates[topic] for topic in topics[:count]]
+
+
+def _clean_question(text):
+    # Remove leading numbers, bullets and markdown
+    cleaned = _LIST_PREFIX.sub('', text.strip()).strip()
+    return _MARKDOWN_PREFIX.sub('', cleaned).strip()
+
+
+def parse_questions(questions_text, language):
+    """
+    Extract questions from model output (one per line, numbering removed).
+
+    Returns:
+        list: Cleaned questions (may be fewer than QUESTION_COUNT)
+    """
+    questions = []
+    for line in questions_text.split('\n'):
+        cleaned = _clean_question(line)
+        if cleaned and len(cleaned) > MIN_QUESTION_LENGTH:
+            questions.append(cleaned)
+
+    # If we don't have enough lines, try to split by question marks
+    if len(questions) < QUESTION_COUNT:
+        mark = '؟' if language in ('fa', 'ar', 'ur') else '?'
+        parts = [
+            _clean_question(part)
+            for part in _QUESTION_SPLIT.split(questions_text.replace('\n', ' '))
+        ]
+        questions = [part + mark for part in parts if len(part) > MIN_QUESTION_LENGTH]
+    return questions[:QUESTION_COUNT]
+
+
+
+def get_questions_mode(endpoint):
+    """Get the configured question source ('llm' or 'local') for an endpoint"""
+    modes = getattr(settings, 'CONTINUATION_QUESTIONS_MODE', {})
+    return modes.get(endpoint, modes.get('default', MODE_LLM))
+
+
+def generate_continuation_questions(endpoint, language, reading, user=None, instructions=None):
+    """
+    Get three continuation questions for a reading.
+
+    Uses the endpoint's configured source. The local generator fills in when
+    the model call fails or returns fewer than three usable questions.
+
+    Args:
+        endpoint: Endpoint name (e.g. 'coffee', 'dream')
+        language: Language code
+        reading: The generated reading text
+        user: Authenticated user or None
+        instructions: Optional replacement for the language's question prompt
+
+    Returns:
+        list: Three questions
+    """
+    local = generate_local_questions(reading, language)
+    if get_questions_mode(endpoint) == MODE_LOCAL:
+        return local
+
+    try:
+        prompt = build_questions_prompt(endpoint, language, reading, instructions=instructions)
+        completion = chat_completion(
+            endpoint, prompt.messages(), stage=QUESTIONS,
+            user=user, language=language, prompt_cache_key=prompt.cache_key,
+        )
+        questions_text = completion.choices[0].message.content or ""
+        logger.debug("Raw questions text: %s", questions_text)
+        questions = parse_questions(questions_text, language)
+    except Exception as e:
+        logger.warning("Failed to generate continuation questions: %s", e)
+        return local
+
+    for question in local:
+        if len(questions) >= QUESTION_COUNT:
+            break
+        if question not in questions:
+            questions.append(question)
+    return questions
@@ -6,6 +6,7 @@ from urllib.parse import urlencode
 from django.urls import reverse
 from rest_framework import serializers
 from .models import File, FortuneProfile, TarotCard
+from .language_negotiation import get_request_language
 
 logger = logging.getLogger('main')
 
@@ -192,14 +193,7 @@ class TarotCardSerializer(serializers.ModelSerializer):
                 
                 # If not in query, try Accept-Language header
                 if not language_code:
-                    accept_language = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
-                    if accept_language:
-                        # Parse Accept-Language header (e.g., "en-US,en;q=0.9,fa;q=0.8")
-                        languages = [lang.split(';')[0].strip()[:2] for lang in accept_language.split(',')]
-                        for lang in languages:
-                            if lang in ['en', 'fa', 'ar', 'es', 'fr', 'de', 'it', 'ru', 'hi', 'zh']:
-                                language_code = lang
-                                break
+                    language_code = get_request_language(request)
                 # If still not found, try user preference
                 if not language_code and hasattr(request, 'user') and request.user.is_authenticated:
                     language_code = getattr(request.user, 'language', None)
@@ -274,12 +268,12 @@ class TarotCardSerializer(serializers.ModelSerializer):
                         return absolute_url
                     except Exception as e:
                         # Fallback to original image if building URL fails
-                        logger.warning(f"Failed to build optimized image URL: {e}")
+                        logger.warning("Failed to build optimized image URL: %s", e)
                         try:
                             absolute_url = request.build_absolute_uri(obj.image.url)
                             return absolute_url
                         except Exception as e2:
-                            logger.error(f"Failed to build absolute URI for original image: {e2}")
+                            logger.error("Failed to build absolute URI for original image: %s", e2)
                             return None
                 else:
                     # No request context, return relative URL to optimized endpoint
@@ -317,3 +311,56 @@ class TarotCardSerializer(serializers.ModelSerializer):
             # #endregion
             return None
 
+
+
+def serialize_tarot_cards(deck, cards, language, request=None, image_width=140, image_height=220):
+    """
+    Serialize deck CardRecords with the same fields as TarotCardSerializer.
+
+    The language is resolved to a name index once, and the absolute URL
+    prefix is built once, instead of per card.
+
+    Args:
+        deck: Deck the records belong to (see main.deck)
+        cards: CardRecords to serialize
+        language: Language code for ``name``
+        request: Request used to build absolute URLs (relative URLs without one)
+        image_width: Width passed to the optimized image endpoint
+        image_height: Height passed to the optimized image endpoint
+
+    Returns:
+        list: One dict per card
+    """
+    name_index = deck.language_index(language)
+    origin = request.build_absolute_uri('/')[:-1] if request is not None else ''
+    params = {}
+    if image_width:
+        params['width'] = image_width
+    if image_height:
+        params['height'] = image_height
+    query = f'?{urlencode(params)}' if params else ''
+
+    def absolute(url):
+        if request is None or not url.startswith('/') or url.startswith('//'):
+            return request.build_absolute_uri(url) if request is not None else url
+        return origin + url
+
+    return [
+        {
+            'id': card.id,
+            'name': card.names[name_index],
+            'name_en': card.name_en,
+            'suit': card.suit,
+            'number': card.number,
+            'image': absolute(card.image) if card.image else None,
+            'image_url': (
+                f'{origin}/api/v1/tarot/cards/{card.id}/image/{query}' if card.image else None
+            ),
+            'meaning': card.meaning,
+            'reversed_meaning': card.reversed_meaning,
+            'emoji': card.emoji,
+            'order': card.order,
+            'names_translations': card.names_translations,
+        }
+        for card in cards
+    ]
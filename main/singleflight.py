@@ -0,0 +1,144 @@
+"""
+Single-flight coalescing of identical model calls.
+
+When many clients ask for the same reading at once (a popular tarot spread,
+the same I Ching cast), only one upstream completion runs:
+
+- within a process, callers with the same key wait for the first caller
+- across workers, the first process to ``add`` a lock key in the shared cache
+  runs the call and stores the result for SINGLE_FLIGHT_RESULT_TTL seconds;
+  the other workers poll for it
+
+If the running call fails, in-process waiters get the same exception and
+other workers run the call themselves.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger('main')
+
+_MISSING = object()
+
+
+def make_key(endpoint, messages, **extra):
+    """
+    Build a canonical key for a model call.
+
+    Args:
+        endpoint: Endpoint name
+        messages: Chat messages sent to the model
+        **extra: Other inputs that change the result (e.g. response_format)
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    payload = json.dumps(
+        {'endpoint': endpoint, 'messages': messages, **extra},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run one call per key at a time and share its result"""
+
+    def __init__(self, prefix='singleflight'):
+        self.prefix = prefix
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def wait_timeout(self):
+        return getattr(settings, 'SINGLE_FLIGHT_TIMEOUT', 90)
+
+    @property
+    def result_ttl(self):
+        return getattr(settings, 'SINGLE_FLIGHT_RESULT_TTL', 10)
+
+    def do(self, key, fn):
+        """
+        Run ``fn`` unless an identical call is already in flight.
+
+        Args:
+            key: Canonical input key (see make_key)
+            fn: Callable producing a picklable result
+
+        Returns:
+            The result of ``fn``, possibly produced by another request
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(self.wait_timeout):
+                if call.error is not None:
+                    raise call.error
+                logger.info("Shared in-flight result for %s", key[:12])
+                return call.result
+            logger.warning("Timed out waiting for %s, calling upstream", key[:12])
+            return fn()
+
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_shared(self, key, fn):
+        result_key = f'{self.prefix}:{key}:result'
+        lock_key = f'{self.prefix}:{key}:lock'
+
+        result = cache.get(result_key, _MISSING)
+        if result is not _MISSING:
+            logger.info("Shared recent result for %s", key[:12])
+            return result
+
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, self.wait_timeout):
+            try:
+                result = fn()
+                cache.set(result_key, result, self.result_ttl)
+                return result
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        # Another worker is running the same call
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.05
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            result = cache.get(result_key, _MISSING)
+            if result is not _MISSING:
+                logger.info("Shared result from another worker for %s", key[:12])
+                return result
+            if not cache.has_key(lock_key):
+                # The other worker failed
+                break
+            delay = min(delay * 2, 0.5)
+        return fn()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,36 @@
+"""
+Process warmup for gunicorn's preload_app mode.
+
+With ``preload_app`` the master process imports the app once and forks the
+workers from it, so whatever the master has loaded is shared copy-on-write.
+``preload()`` (called from gunicorn.conf.py before the workers are forked)
+imports the dependencies that are otherwise deferred until first use, loads
+every prompt language and freezes the objects allocated so far so the
+garbage collector does not touch (and un-share) their pages.
+
+Nothing that holds a socket or file handle may be created here: database
+connections are closed, and OpenAI clients and cache connections are created
+lazily in each worker.
+"""
+import gc
+import logging
+import time
+
+from django.db import connections
+
+logger = logging.getLogger('main')
+
+
+def preload():
+    """Warm the master process before gunicorn forks its workers"""
+    start = time.perf_counter()
+    import openai  # noqa: F401
+    from PIL import Image  # noqa: F401
+
+    from .prompt_registry import registry
+    registry.warmup('*')
+
+    connections.close_all()
+    gc.collect()
+    gc.freeze()
+    logger.info("Preloaded app for forked workers in %.0f ms", (time.perf_counter() - start) * 1000)
@@ -0,0 +1,100 @@
+"""
+Storage layout for uploaded images.
+
+Uploads are spread over nested directories by date and content hash:
+
+    coffee/2026/10/ab/cd/abcd1234....jpg
+
+so no directory grows without bound, date ranges can be backed up or expired
+per directory, and file names no longer carry the client's original name.
+Equal content gets an equal base name; the storage adds a suffix to keep the
+second copy separate (rows never share a file, so deleting one row cannot
+remove another row's image).
+
+Which storage holds the files is configured with STORAGES in settings
+(local file system, or an S3-compatible service such as MinIO); code here and
+in the views only goes through the storage API.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+# Directory levels below the prefix down to the first hash level (YYYY/MM/ab):
+# the units maintenance jobs split their work into
+SHARD_DEPTH = 3
+# Hex digits of the content hash used in file names (128 bits)
+NAME_DIGEST_LENGTH = 32
+
+
+def content_digest(content):
+    """
+    SHA-256 hex digest of a file, read in chunks.
+
+    Args:
+        content: File-like object; its position is restored afterwards
+    """
+    digest = hashlib.sha256()
+    position = content.tell() if hasattr(content, 'tell') else None
+    content.seek(0)
+    for chunk in iter(lambda: content.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    if position is not None:
+        content.seek(position)
+    return digest.hexdigest()
+
+
+def shard_name(prefix, digest, extension, when):
+    """
+    Build a sharded storage name.
+
+    Args:
+        prefix: Top-level upload directory (e.g. 'coffee')
+        digest: Hex content hash (or any random hex string)
+        extension: File extension including the dot, e.g. '.jpg'
+        when: Date the file belongs to (upload date)
+
+    Returns:
+        str: e.g. 'coffee/2026/10/ab/cd/<digest>.jpg'
+    """
+    digest = digest[:NAME_DIGEST_LENGTH]
+    return posixpath.join(
+        prefix, f'{when:%Y}', f'{when:%m}', digest[:2], digest[2:4], f'{digest}{extension.lower()}'
+    )
+
+
+@deconstructible
+class ShardedUploadTo:
+    """
+    ``upload_to`` callable placing files with ``shard_name``.
+
+    Args:
+        prefix: Top-level upload directory
+        field_name: Name of the file field on the model (to hash its content)
+    """
+
+    def __init__(self, prefix, field_name='image'):
+        self.prefix = prefix
+        self.field_name = field_name
+        self.pattern = re.compile(
+            rf'^{re.escape(prefix)}/\d{{4}}/\d{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/'
+        )
+
+    def __call__(self, instance, filename):
+        extension = os.path.splitext(filename)[1]
+        field_file = getattr(instance, self.field_name, None)
+        content = getattr(field_file, '_file', None)
+        try:
+            digest = content_digest(content) if content is not None else uuid.uuid4().hex
+        except (AttributeError, OSError, ValueError):
+            digest = uuid.uuid4().hex
+        return shard_name(self.prefix, digest, extension, timezone.now())
+
+    def is_sharded(self, name):
+        """Whether a stored name already follows the sharded layout"""
+        return bool(self.pattern.match(name))
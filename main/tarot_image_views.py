@@ -1,96 +1,203 @@
 import logging
+import os
+import tempfile
 from io import BytesIO
+from django.conf import settings
 from django.http import HttpResponse, Http404
 from django.shortcuts import get_object_or_404
-from django.core.files.base import ContentFile
-from PIL import Image
 from . import models
+from .media_delivery import serve_file
 
 logger = logging.getLogger('main')
 
+# Resized card images are kept under MEDIA_ROOT/renditions/tarot/<card id>/
+RENDITIONS_DIR = os.path.join('renditions', 'tarot')
+
+# Requested sizes are clamped to this many pixels
+MAX_IMAGE_SIZE = 2000
+
+# Renditions kept per card at most; the least recently written go first
+MAX_RENDITIONS_PER_CARD = 8
+
+
+def image_cache_control():
+    """
+    Cache-Control for card images.
+
+    The image URL stays the same when a card's image is replaced, so clients
+    revalidate (ETag) after MEDIA_CACHE_MAX_AGE instead of keeping it for long.
+    """
+    return f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 86400)}, must-revalidate"
+
+
+def _size_param(request, name, default):
+    try:
+        value = int(request.GET.get(name) or default)
+    except (ValueError, TypeError):
+        return default  # Fallback to default
+    return min(max(value, 1), MAX_IMAGE_SIZE)
+
+
+def stored_sizes():
+    """
+    Sizes whose renditions are stored (TAROT_IMAGE_SIZES, e.g. '140x220').
+
+    Returns:
+        set: (width, height) tuples
+    """
+    sizes = set()
+    for value in getattr(settings, 'TAROT_IMAGE_SIZES', ['140x220']):
+        width, _, height = value.strip().lower().partition('x')
+        try:
+            sizes.add((int(width), int(height)))
+        except ValueError:
+            logger.warning("Ignoring invalid TAROT_IMAGE_SIZES entry: %s", value)
+    return sizes
+
+
+def render_card_image(source, target_width, target_height):
+    """
+    Resize a card image to fit within the target size.
+
+    Args:
+        source: Path or file object of the original image
+        target_width: Maximum width in pixels
+        target_height: Maximum height in pixels
+
+    Returns:
+        tuple: (image bytes, content type, file extension)
+    """
+    # Pillow is only needed here, so it is imported on first use
+    from PIL import Image
+
+    image = Image.open(source)
+    original_format = image.format or 'JPEG'
+
+    # Resize to fit within bounds while maintaining aspect ratio
+    original_width, original_height = image.size
+    ratio = min(target_width / original_width, target_height / original_height)
+    new_width = max(int(original_width * ratio), 1)
+    new_height = max(int(original_height * ratio), 1)
+
+    # Resize image with high-quality resampling
+    image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+    output = BytesIO()
+
+    # Preserve format, default to JPEG
+    if original_format == 'PNG':
+        image.save(output, format='PNG', optimize=True)
+        return output.getvalue(), 'image/png', '.png'
+
+    # Convert to RGB if necessary (for JPEG)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # Create white background
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    image.save(output, format='JPEG', quality=85, optimize=True)
+    return output.getvalue(), 'image/jpeg', '.jpg'
+
+
+def _rendition_path(card, source_path, target_width, target_height):
+    """
+    Path of the stored rendition, rendering it first if needed.
+
+    The name includes the original's mtime, so a new card image gets new
+    renditions; older renditions of the same size are removed.
+    """
+    directory = os.path.join(settings.MEDIA_ROOT, RENDITIONS_DIR, str(card.pk))
+    prefix = f'{target_width}x{target_height}-'
+    stem = f'{prefix}{os.stat(source_path).st_mtime_ns:x}'
+    for extension in ('.jpg', '.png'):
+        path = os.path.join(directory, stem + extension)
+        if os.path.exists(path):
+            return path
+
+    content, _, extension = render_card_image(source_path, target_width, target_height)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, stem + extension)
+    # Write under a temporary name so concurrent requests never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+    _prune_renditions(directory, prefix, stem)
+    return path
+
+
+def _prune_renditions(directory, prefix, stem):
+    """Remove stale renditions of this size and keep MAX_RENDITIONS_PER_CARD files"""
+    stale, current = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith(prefix) and not entry.name.startswith(stem):
+                stale.append(entry.path)
+            elif not entry.name.endswith('.tmp'):
+                try:
+                    current.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+    current.sort()
+    stale.extend(path for _, path in current[:max(len(current) - MAX_RENDITIONS_PER_CARD, 0)])
+    for path in stale:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _render_response(source, target_width, target_height):
+    """Resize in memory, for sizes that are not stored"""
+    content, content_type, _ = render_card_image(source, target_width, target_height)
+    response = HttpResponse(content, content_type=content_type)
+    response['Cache-Control'] = image_cache_control()
+    return response
+
 
 def get_tarot_card_image(request, card_id):
     """
     Serve tarot card image with optional resizing.
-    
+
     Query parameters:
     - width: Desired width in pixels (optional)
     - height: Desired height in pixels (optional)
     - If both are provided, image will be resized maintaining aspect ratio
     - If only one is provided, the other will be calculated to maintain aspect ratio
+
+    Sizes listed in TAROT_IMAGE_SIZES are rendered once and stored under
+    MEDIA_ROOT/renditions; they are then sent like any media file (see
+    main.media_delivery), so with MEDIA_DELIVERY = 'nginx' or 'sendfile' the
+    front-end server sends them. Other sizes are resized in memory on every
+    request and never written, so requests cannot fill the disk.
     """
+    card = get_object_or_404(models.TarotCard, pk=card_id)
+
+    if not card.image:
+        raise Http404("Card image not found")
+
+    # Default size: 140x220 (exact card frame size)
+    target_width = _size_param(request, 'width', 140)
+    target_height = _size_param(request, 'height', 220)
+
     try:
-        card = get_object_or_404(models.TarotCard, pk=card_id)
-        
-        if not card.image:
-            raise Http404("Card image not found")
-        
-        # Get original image
-        image = Image.open(card.image)
-        original_format = image.format or 'JPEG'
-        
-        # Parse size parameters from query string
-        # Default size: 140x220 (exact card frame size)
-        target_width = 140
-        target_height = 220
-        
-        width_param = request.GET.get('width')
-        height_param = request.GET.get('height')
-        
-        if width_param:
-            try:
-                target_width = int(width_param)
-            except (ValueError, TypeError):
-                target_width = 140  # Fallback to default
-        
-        if height_param:
-            try:
-                target_height = int(height_param)
-            except (ValueError, TypeError):
-                target_height = 220  # Fallback to default
-        
-        # Always resize to target dimensions (default 140x220)
-        # Calculate dimensions maintaining aspect ratio
-        original_width, original_height = image.size
-        
-        # Resize to fit within bounds while maintaining aspect ratio
-        ratio = min(target_width / original_width, target_height / original_height)
-        new_width = int(original_width * ratio)
-        new_height = int(original_height * ratio)
-        
-        # Resize image with high-quality resampling
-        image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # Convert to bytes
-        output = BytesIO()
-        
-        # Preserve format, default to JPEG
-        if original_format == 'PNG':
-            image.save(output, format='PNG', optimize=True)
-            content_type = 'image/png'
-        else:
-            # Convert to RGB if necessary (for JPEG)
-            if image.mode in ('RGBA', 'LA', 'P'):
-                # Create white background
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                if image.mode == 'P':
-                    image = image.convert('RGBA')
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            elif image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            image.save(output, format='JPEG', quality=85, optimize=True)
-            content_type = 'image/jpeg'
-        
-        output.seek(0)
-        
-        # Return response
-        response = HttpResponse(output.getvalue(), content_type=content_type)
-        response['Cache-Control'] = 'public, max-age=31536000'  # Cache for 1 year
-        return response
-        
+        try:
+            source_path = card.image.path
+        except NotImplementedError:
+            # Remote storage: render in memory
+            with card.image.open('rb') as source:
+                return _render_response(source, target_width, target_height)
+
+        if (target_width, target_height) not in stored_sizes():
+            return _render_response(source_path, target_width, target_height)
+        path = _rendition_path(card, source_path, target_width, target_height)
     except Exception as e:
-        logger.error(f"Error serving tarot card image: {str(e)}", exc_info=True)
+        logger.error("Error serving tarot card image: %s", e, exc_info=True)
         raise Http404("Error loading image")
-
+    return serve_file(request, path, cache_control=image_cache_control())
@@ -1,28 +1,30 @@
+import hashlib
 import logging
 import json
+from django.conf import settings
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny
-from decouple import config
-from openai import OpenAI
+from rest_framework.renderers import JSONRenderer
 from . import models
-from .serializers import TarotCardSerializer
-from .language_utils import get_user_language, get_language_prompts, SUPPORTED_LANGUAGES
+from .serializers import serialize_tarot_cards
+from .language_utils import get_user_language, SUPPORTED_LANGUAGE_CODES
+from .usage import has_budget
+from .db_routers import ReplicaReadMixin
+from .caching import hot_cache
+from .compression import CompressedPayload
+from .conditional import AUTH_VARY, conditional_response, make_etag, private_max_age, public_max_age
+from .deck import get_deck
+from .llm import chat_completion, is_configured
+from .prompt_builder import build_tarot_prompt
+from .singleflight import make_key, single_flight
 
 logger = logging.getLogger('main')
 
-# Initialize OpenAI client
-OPENAI_API_KEY = config('OPENAI_API_KEY', default=None)
-if OPENAI_API_KEY:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
-else:
-    logger.warning("OPENAI_API_KEY not set in environment variables")
-    openai_client = None
 
-
-class TarotCardsView(APIView):
+class TarotCardsView(ReplicaReadMixin, APIView):
     """
     API endpoint to get all Tarot cards with images.
     Returns list of all cards available in the system.
@@ -34,11 +36,13 @@ class TarotCardsView(APIView):
         try:
             # Get language from query parameter or user preference
             language = request.query_params.get('language')
+            vary = AUTH_VARY
             if not language:
                 user = request.user if request.user.is_authenticated else None
                 language = get_user_language(user, request)
+                vary += ('Accept-Language',)
             
-            cards = models.TarotCard.objects.all().order_by('order', 'suit', 'number')
+            deck = get_deck()
             
             # Get image size parameters from query (for mobile optimization)
             # Default: 140x220 (exact size for card frame)
@@ -65,23 +69,59 @@ class TarotCardsView(APIView):
             if parsed_height is None:
                 parsed_height = 220  # Exact card height
             
-            # Pass language and image size to serializer context
-            serializer = TarotCardSerializer(
-                cards, 
-                many=True, 
-                context={
-                    'request': request, 
-                    'language': language,
-                    'image_width': parsed_width,
-                    'image_height': parsed_height,
-                }
+            # The serialized deck only depends on the deck version, language,
+            # image size and host (absolute image URLs), so it is shared
+            # across workers
+            variant = (
+                f'{deck.version}:{language}:{parsed_width}x{parsed_height}:'
+                f'{request.build_absolute_uri("/")}'
+            )
+            cache_key = f'tarot_cards:{hashlib.sha1(variant.encode()).hexdigest()}'
+
+            renderer = request.accepted_renderer
+            if renderer.format != 'json':
+                # Browsable API: rendered from the cached JSON
+                renderer = next(
+                    (cls() for cls in self.renderer_classes if cls.format == 'json'), JSONRenderer()
+                )
+
+            def render():
+                cards_data = serialize_tarot_cards(
+                    deck, deck.cards, language, request, parsed_width, parsed_height
+                )
+                content_type = renderer.media_type
+                if renderer.charset:
+                    content_type += f'; charset={renderer.charset}'
+                return CompressedPayload(
+                    renderer.render({'cards': cards_data}, renderer.media_type, self.get_renderer_context()),
+                    content_type,
+                )
+
+            def build():
+                # Rendered and compressed once per variant, not per request
+                payload = hot_cache.get_or_set(
+                    f'{cache_key}:{type(renderer).__name__}',
+                    render,
+                    timeout=settings.TAROT_CARDS_CACHE_TIMEOUT,
+                )
+                if renderer is not request.accepted_renderer:
+                    return Response(json.loads(payload.content), status=status.HTTP_200_OK)
+                return payload.response(request)
+
+            # The variant identifies the payload, so clients revalidate
+            # without the deck being serialized (or even read from the cache)
+            max_age = settings.TAROT_CARDS_MAX_AGE
+            return conditional_response(
+                request,
+                build,
+                etag=make_etag(variant, request.accepted_renderer.format),
+                cache_control=(
+                    private_max_age(max_age) if request.user.is_authenticated else public_max_age(max_age)
+                ),
+                vary=vary,
             )
-            
-            return Response({
-                'cards': serializer.data
-            }, status=status.HTTP_200_OK)
         except Exception as e:
-            logger.error(f"Error fetching Tarot cards: {str(e)}", exc_info=True)
+            logger.error("Error fetching Tarot cards: %s", e, exc_info=True)
             return Response(
                 {'error': 'Failed to fetch Tarot cards.'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -113,7 +153,7 @@ class TarotReadingView(APIView):
                 try:
                     card_ids = json.loads(card_ids_raw)
                 except (json.JSONDecodeError, ValueError) as e:
-                    logger.warning(f"Failed to parse card_ids JSON: {e}")
+                    logger.warning("Failed to parse card_ids JSON: %s", e)
                     raise ValidationError("Field 'card_ids' must be a valid JSON array")
             elif isinstance(card_ids_raw, list):
                 card_ids = card_ids_raw
@@ -181,124 +221,67 @@ class TarotReadingView(APIView):
                     raise ValidationError("Profile 'name' is required")
             
             # Get language
+            user = request.user if request.user.is_authenticated else None
             request_language = request.data.get('language')
-            if request_language and request_language in SUPPORTED_LANGUAGES:
+            if request_language and request_language in SUPPORTED_LANGUAGE_CODES:
                 user_language = request_language
             else:
-                user = request.user if request.user.is_authenticated else None
                 user_language = get_user_language(user, request)
             
-            # Get cards from database
-            cards = models.TarotCard.objects.filter(id__in=card_ids)
-            if cards.count() != len(card_ids):
+            # Look cards up in the in-memory deck, keeping the caller's order
+            # so is_reversed[i] pairs with card_ids[i]
+            try:
+                card_ids = [int(card_id) for card_id in card_ids]
+                deck = get_deck()
+                cards = deck.resolve(card_ids)
+            except (KeyError, TypeError, ValueError):
+                raise ValidationError("Some card IDs are invalid")
+            if len(set(card_ids)) != len(card_ids):
                 raise ValidationError("Some card IDs are invalid")
             
-            cards_list = list(cards)
             card_data = []
-            for i, card in enumerate(cards_list):
+            for i, card in enumerate(cards):
                 card_data.append({
                     'id': card.id,
                     'name': card.name,
-                    'suit': card.get_suit_display(),
+                    'suit': card.suit_display,
                     'meaning': card.meaning or '',
                     'reversed_meaning': card.reversed_meaning or '',
                     'is_reversed': is_reversed[i] if i < len(is_reversed) else False,
                 })
             
             # Validate OpenAI API Key
-            if not OPENAI_API_KEY or not openai_client:
+            if not is_configured():
                 logger.error("OpenAI API Key is not configured")
                 return Response(
                     {'error': 'OpenAI API Key is not configured.'},
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
             
-            prompts = get_language_prompts(user_language)
-            
-            # Build profile information (use None values as empty strings)
-            profile_info = f"""
-Name: {profile_data.get('name', '')}
-Age: {profile_data.get('age', '') if profile_data.get('age') is not None else ''}
-Gender: {profile_data.get('gender', '') if profile_data.get('gender') else ''}
-Job Status: {profile_data.get('job_status', '') if profile_data.get('job_status') else ''}
-Relationship Status: {profile_data.get('relationship_status', '') if profile_data.get('relationship_status') else ''}
-"""
-            if profile_data.get('city'):
-                profile_info += f"City: {profile_data['city']}\n"
-            if profile_data.get('country'):
-                profile_info += f"Country: {profile_data['country']}\n"
-            if profile_data.get('notes'):
-                profile_info += f"Notes: {profile_data['notes']}\n"
+            # Check the user's daily token budget before calling the model
+            if not has_budget(user):
+                logger.warning("Daily token budget exhausted for user: %s", user)
+                return Response(
+                    {'error': 'Daily token budget exhausted. Please try again tomorrow.'},
+                    status=status.HTTP_429_TOO_MANY_REQUESTS
+                )
             
-            # Build cards information for prompt
-            cards_info = "\n".join([
-                f"Card {i+1}: {card['name']} ({card['suit']}) - "
-                f"Position: {'Reversed' if card['is_reversed'] else 'Upright'} - "
-                f"Base Meaning: {card['reversed_meaning'] if card['is_reversed'] else card['meaning']}"
-                for i, card in enumerate(card_data)
-            ])
+            # Build prompt: instructions and the deck glossary form a static
+            # (cacheable) prefix; the user message only holds profile and spread
+            prompt = build_tarot_prompt(user_language, profile_data, card_data)
             
-            # Generate complete reading in one request with JSON response
+            # Generate complete reading in one request with JSON response.
+            # Identical concurrent spreads share one completion.
             try:
-                complete_prompt = f"""You are a professional Tarot card reader. Based on the following information, provide a complete Tarot reading with individual card interpretations and an overall reading.
-
-Profile Information:
-{profile_info}
-
-Cards Drawn:
-{cards_info}
-
-Please provide a complete Tarot reading in JSON format with the following structure:
-{{
-  "individual_interpretations": [
-    {{
-      "card_id": {card_data[0]['id']},
-      "card_name": "{card_data[0]['name']}",
-      "is_reversed": {str(card_data[0]['is_reversed']).lower()},
-      "interpretation": "Detailed personalized interpretation for this card considering the querent's profile, card position, and life situation. Write in {user_language} language. Be warm, empathetic, and provide actionable insights."
-    }},
-    ... (one object for each card)
-  ],
-  "overall_reading": "A comprehensive overall reading that synthesizes all cards together, considers the querent's profile, provides guidance on how cards relate to each other, offers actionable insights, and addresses the overall message. Write in {user_language} language. Be warm, empathetic, and provide a complete narrative."
-}}
-
-Requirements:
-1. For each card, provide a detailed, personalized interpretation considering:
-   - The querent's profile (age, gender, job status, relationship status)
-   - The card's position (upright or reversed)
-   - How this card relates to their current life situation
-   - Specific guidance and insights
-
-2. For the overall reading:
-   - Synthesize all cards together to tell a cohesive story
-   - Consider the querent's profile and life situation
-   - Provide guidance on how the cards relate to each other
-   - Offer actionable insights and advice
-   - Address the overall message the cards are conveying
-
-3. Write everything in {user_language} language
-4. Be warm, empathetic, and provide actionable insights
-5. Return ONLY valid JSON, no additional text before or after
-
-Return the JSON response now:"""
-                
-                completion = openai_client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": prompts.get('system', 'You are a professional Tarot card reader. You always respond with valid JSON format.'),
-                        },
-                        {
-                            "role": "user",
-                            "content": complete_prompt,
-                        },
-                    ],
-                    response_format={"type": "json_object"},
+                response_content = single_flight.do(
+                    make_key('tarot', prompt.messages()),
+                    lambda: chat_completion(
+                        'tarot', prompt.messages(), user=user, language=user_language,
+                        prompt_cache_key=prompt.cache_key,
+                        response_format={"type": "json_object"},
+                    ).choices[0].message.content or "{}",
                 )
                 
-                response_content = completion.choices[0].message.content or "{}"
-                
                 # Parse JSON response
                 try:
                     reading_data = json.loads(response_content)
@@ -337,8 +320,8 @@ Return the JSON response now:"""
                     overall_reading = reading_data.get('overall_reading', 'Unable to generate overall reading at this time.')
                     
                 except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse JSON response from GPT: {str(e)}")
-                    logger.error(f"Response content: {response_content[:500]}")
+                    logger.error("Failed to parse JSON response from GPT: %s", e)
+                    logger.error("Response content: %s", response_content[:500])
                     # Fallback: use card meanings
                     individual_interpretations = []
                     for card in card_data:
@@ -351,7 +334,7 @@ Return the JSON response now:"""
                     overall_reading = "Unable to generate overall reading at this time."
                     
             except Exception as e:
-                logger.error(f"Error generating complete reading: {str(e)}", exc_info=True)
+                logger.error("Error generating complete reading: %s", e, exc_info=True)
                 # Fallback: use card meanings
                 individual_interpretations = []
                 for card in card_data:
@@ -387,32 +370,25 @@ Return the JSON response now:"""
             if parsed_height is None:
                 parsed_height = 220  # Exact card height
             
-            # Serialize cards with images (pass language and image size to serializer)
-            card_serializer = TarotCardSerializer(
-                cards, 
-                many=True, 
-                context={
-                    'request': request, 
-                    'language': user_language,
-                    'image_width': parsed_width,
-                    'image_height': parsed_height,
-                }
+            # Serialize cards with images (localized names and sized image URLs)
+            cards_data = serialize_tarot_cards(
+                deck, cards, user_language, request, parsed_width, parsed_height
             )
             
             return Response({
-                'cards': card_serializer.data,
+                'cards': cards_data,
                 'individual_interpretations': individual_interpretations,
                 'overall_reading': overall_reading,
             }, status=status.HTTP_200_OK)
             
         except ValidationError as e:
-            logger.warning(f"Validation error: {str(e)}")
+            logger.warning("Validation error: %s", e)
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
         except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+            logger.error("Unexpected error: %s", e, exc_info=True)
             return Response(
                 {'error': 'An unexpected error occurred. Please try again later.'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
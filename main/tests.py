@@ -1,13 +1,33 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.core.files.uploadedfile import SimpleUploadedFile
 from .models import File
+import logging
 import os
+import tempfile
 from django.conf import settings
 
 
+class TempMediaRootMixin:
+    """MEDIA_ROOT in a temporary directory per test (``self.media_root``)"""
+
+    # Further settings overridden together with MEDIA_ROOT
+    media_settings = {}
+
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.media_root = os.path.join(tmp_dir.name, 'media')
+        os.makedirs(self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root, **self.media_settings)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
 class FileModelTest(TestCase):
     """Test cases for File model"""
 
@@ -21,8 +41,8 @@ class FileModelTest(TestCase):
         )
         file_obj = File.objects.create(image=image)
         self.assertIsNotNone(file_obj.id)
-        # Django adds a random suffix to prevent filename collisions
-        self.assertTrue(file_obj.image.name.startswith("coffee/test_image"))
+        # Stored under coffee/<year>/<month>/<hash shards>/ by content hash
+        self.assertRegex(file_obj.image.name, r"^coffee/\d{4}/\d{2}/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}")
         self.assertTrue(file_obj.image.name.endswith(".jpg"))
         self.assertIsNotNone(file_obj.created_at)
         self.assertIsNotNone(file_obj.updated_at)
@@ -170,3 +190,1508 @@ class FileSerializerTest(TestCase):
         serializer = self.serializer_class(data={'image': invalid_file})
         self.assertFalse(serializer.is_valid())
         self.assertIn('image', serializer.errors)
+
+
+class TokenUsageLedgerTest(TestCase):
+    """Test cases for buffered token usage accounting"""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from django.core.cache import cache
+        from .usage import UsageLedger
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='ledger', password='x')
+        self.ledger = UsageLedger(background=False)
+
+    def test_flush_writes_rows_and_daily_aggregate(self):
+        """Buffered entries are written in one flush and folded per day"""
+        from .models import TokenUsage, DailyTokenUsage
+        for _ in range(3):
+            self.ledger.record('coffee', 'gpt-4o-mini', 100, 50, user=self.user, language='fa')
+        self.ledger.record('coffee', 'gpt-4o-mini', 10, 5, user=self.user, language='fa', stage='questions')
+        self.assertEqual(TokenUsage.objects.count(), 0)
+        
+        self.assertEqual(self.ledger.flush(), 4)
+        self.assertEqual(TokenUsage.objects.count(), 4)
+        daily = DailyTokenUsage.objects.get(stage='reading')
+        self.assertEqual(daily.requests, 3)
+        self.assertEqual(daily.prompt_tokens, 300)
+        self.assertEqual(daily.completion_tokens, 150)
+        
+        # A second flush increments the existing aggregate row
+        self.ledger.record('coffee', 'gpt-4o-mini', 1, 1, user=self.user, language='fa')
+        self.ledger.flush()
+        daily.refresh_from_db()
+        self.assertEqual(daily.requests, 4)
+
+    def test_cached_tokens_recorded(self):
+        """Cached prompt tokens reported by the API are stored with the usage"""
+        from types import SimpleNamespace
+        from .models import DailyTokenUsage
+        from .usage import record_completion, ledger
+        completion = SimpleNamespace(model='gpt-4o-mini', usage=SimpleNamespace(
+            prompt_tokens=2000, completion_tokens=300,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=1536),
+        ))
+        ledger.background = False
+        try:
+            record_completion(completion, 'tarot', user=self.user, language='en')
+            ledger.flush()
+        finally:
+            ledger.background = True
+        daily = DailyTokenUsage.objects.get(endpoint='tarot')
+        self.assertEqual(daily.cached_tokens, 1536)
+        self.assertAlmostEqual(daily.cache_hit_ratio, 0.768)
+
+    def test_budget_check(self):
+        """has_budget compares the cached daily counter with the user budget"""
+        from .usage import has_budget, ledger
+        self.user.daily_token_budget = 200
+        self.assertTrue(has_budget(self.user))
+        ledger.background = False
+        try:
+            ledger.record('tarot', 'gpt-4o-mini', 150, 60, user=self.user)
+            self.assertFalse(has_budget(self.user))
+        finally:
+            ledger.background = True
+            ledger.flush()
+
+
+class TokenUsageFlushFailureTest(TransactionTestCase):
+    """Flushes that the database rejects (foreign keys are checked at commit)"""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from django.core.cache import cache
+        from .usage import UsageLedger
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='ledger', password='x')
+        self.ledger = UsageLedger(background=False, max_buffer=5, max_retries=2)
+
+    def test_deleted_user_does_not_block_the_ledger(self):
+        """A batch with a deleted user is written entry by entry, the usage kept without a user"""
+        from django.contrib.auth import get_user_model
+        from .models import DailyTokenUsage, TokenUsage
+        other = get_user_model().objects.create_user(username='other', password='x')
+        self.ledger.record('coffee', 'gpt-4o-mini', 100, 50, user=self.user)
+        self.ledger.record('tarot', 'gpt-4o-mini', 10, 5, user=other)
+        get_user_model().objects.filter(pk=self.user.pk).delete()
+
+        with self.assertLogs('main', 'WARNING'):
+            self.assertEqual(self.ledger.flush(), 2)
+        self.assertEqual(self.ledger.pending(), 0)
+        self.assertEqual(TokenUsage.objects.filter(user=other).count(), 1)
+        self.assertEqual(TokenUsage.objects.filter(user=None, prompt_tokens=100).count(), 1)
+        self.assertEqual(DailyTokenUsage.objects.get(endpoint='coffee').user_id, None)
+
+        self.ledger.record('tarot', 'gpt-4o-mini', 1, 1, user=other)
+        self.assertEqual(self.ledger.flush(), 1)
+        self.assertEqual(TokenUsage.objects.count(), 3)
+
+    def test_retries_and_buffer_are_bounded(self):
+        from unittest.mock import patch
+        from django.db import OperationalError
+        for _ in range(3):
+            self.ledger.record('coffee', 'gpt-4o-mini', 1, 1, user=self.user)
+        with patch('main.usage._write_entries', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('main', 'ERROR') as logs:
+            self.assertEqual(self.ledger.flush(), 0)
+            self.assertEqual(self.ledger.pending(), 3)
+            self.assertEqual(self.ledger.flush(), 0)
+        self.assertEqual(self.ledger.pending(), 0)
+        self.assertTrue(any('Dropped 3 token usage entries' in line for line in logs.output))
+
+        with self.assertLogs('main', 'ERROR'):
+            for _ in range(7):
+                self.ledger.record('coffee', 'gpt-4o-mini', 1, 1, user=self.user)
+        self.assertEqual(self.ledger.pending(), 5)
+        self.assertEqual(self.ledger.flush(), 5)
+
+
+class DailyTokenUsageAnonymousTest(TestCase):
+    """Anonymous aggregates: one row per group, deleted users folded in"""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from django.core.cache import cache
+        from .usage import UsageLedger
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='ledger', password='x')
+        self.ledger = UsageLedger(background=False)
+
+    def test_one_anonymous_row_per_group(self):
+        from django.db import IntegrityError, transaction
+        from django.utils import timezone
+        from .models import DailyTokenUsage
+        lookup = {'day': timezone.localdate(), 'endpoint': 'coffee', 'stage': 'reading',
+                  'language': 'fa', 'model': 'gpt-4o-mini'}
+        DailyTokenUsage.objects.create(user=None, **lookup)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DailyTokenUsage.objects.create(user=None, **lookup)
+
+        # The flush's create-or-increment finds the existing row
+        self.ledger.record('coffee', 'gpt-4o-mini', 10, 5, language='fa')
+        self.ledger.flush()
+        self.assertEqual(DailyTokenUsage.objects.get(user=None, **lookup).requests, 1)
+
+    def test_deleting_a_user_keeps_the_aggregates(self):
+        """Like TokenUsage, the user's daily usage is kept without a user"""
+        from django.db.models import Sum
+        from .models import DailyTokenUsage, TokenUsage
+        self.ledger.record('coffee', 'gpt-4o-mini', 100, 50, language='fa')
+        self.ledger.record('coffee', 'gpt-4o-mini', 10, 5, user=self.user, language='fa')
+        self.ledger.record('tarot', 'gpt-4o-mini', 20, 10, user=self.user, language='fa')
+        self.ledger.flush()
+
+        self.user.delete()
+        self.assertEqual(TokenUsage.objects.filter(user=None).count(), 3)
+        self.assertEqual(DailyTokenUsage.objects.filter(user=None).count(), 2)
+        coffee = DailyTokenUsage.objects.get(endpoint='coffee')
+        self.assertEqual((coffee.requests, coffee.prompt_tokens), (2, 110))
+        self.assertEqual(
+            DailyTokenUsage.objects.aggregate(total=Sum('prompt_tokens'))['total'],
+            TokenUsage.objects.aggregate(total=Sum('prompt_tokens'))['total'],
+        )
+
+
+class PromptBuilderTest(TestCase):
+    """Test cases for compact prompt building and token budgets"""
+
+    def test_profile_info_skips_empty_fields(self):
+        """Empty and missing profile fields are not emitted"""
+        from .prompt_builder import build_profile_info
+        info = build_profile_info({
+            'name': 'Sara', 'age': 0, 'gender': '', 'job_status': None, 'city': 'Tehran',
+        })
+        self.assertEqual(info, "Name: Sara\nAge: 0\nCity: Tehran")
+        self.assertNotIn('Gender', info)
+
+    def test_dream_text_trimmed_to_budget(self):
+        """Free text is trimmed so the prompt fits the endpoint budget"""
+        from .prompt_builder import build_reading_prompt
+        with override_settings(PROMPT_TOKEN_BUDGETS={'dream': 200}):
+            prompt = build_reading_prompt(
+                'dream', 'en', {'name': 'Ali', 'notes': 'note ' * 200},
+                trimmable=('dream_text',), dream_text='I was flying over the sea. ' * 200
+            )
+        self.assertLessEqual(prompt.variable_tokens, 200)
+        self.assertEqual(prompt.trimmed, ('notes', 'dream_text'))
+        self.assertIn('Write in English', prompt.system)
+
+    def test_static_prefix_is_stable(self):
+        """The system prefix only depends on endpoint and language"""
+        from .prompt_builder import build_reading_prompt
+        first = build_reading_prompt('iching', 'fa', {'name': 'Ali'}, hexagram='Line 1: yin')
+        second = build_reading_prompt(
+            'iching', 'fa', {'name': 'Sara', 'notes': 'new job'}, hexagram='Line 1: yang'
+        )
+        self.assertEqual(first.system, second.system)
+        self.assertEqual(first.cache_key, 'iching-fa')
+        self.assertNotIn('Ali', first.system)
+        self.assertIn('Line 1: yin', first.user)
+
+    def test_tarot_glossary_in_prefix(self):
+        """Card meanings live in the cached glossary, the spread in the user message"""
+        from .models import TarotCard
+        from .prompt_builder import build_tarot_prompt
+        card = TarotCard.objects.create(
+            name='The Star', suit='major', number=17,
+            meaning='hope and renewal', reversed_meaning='despair'
+        )
+        spread = [{'id': card.id, 'name': card.name, 'suit': 'Major Arcana', 'is_reversed': True,
+                   'meaning': card.meaning, 'reversed_meaning': card.reversed_meaning}]
+        prompt = build_tarot_prompt('en', {'name': 'Ali'}, spread)
+        self.assertIn('hope and renewal', prompt.system)
+        self.assertNotIn('hope and renewal', prompt.user)
+        self.assertIn(f'1. [id {card.id}] The Star, reversed', prompt.user)
+
+        TarotCard.objects.create(name='The Moon', suit='major', number=18, meaning='illusion')
+        self.assertIn('illusion', build_tarot_prompt('en', {'name': 'Ali'}, spread).system)
+
+
+class ModelRouterTest(TestCase):
+    """Test cases for per-endpoint/stage model routing"""
+
+    ROUTING = {
+        'LLM_STAGE_DEFAULTS': {
+            'reading': {'model': 'big', 'max_tokens': 1000, 'downgrade_model': 'small'},
+            'questions': {'model': 'tiny', 'max_tokens': 100, 'base_url': 'http://localhost:11434/v1'},
+        },
+        'LLM_ROUTES': {'tarot': {'reading': {'max_tokens': 3000}}},
+        'LLM_DOWNGRADE_IN_FLIGHT': 2,
+        'LLM_DOWNGRADE_BUDGET_RATIO': 0.5,
+    }
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_route_resolution(self):
+        """Endpoint overrides are applied on top of the stage defaults"""
+        from .llm import get_route
+        with override_settings(**self.ROUTING):
+            tarot = get_route('tarot')
+            questions = get_route('tarot', 'questions')
+        self.assertEqual((tarot['model'], tarot['max_tokens']), ('big', 3000))
+        self.assertEqual((questions['model'], questions['max_tokens']), ('tiny', 100))
+        self.assertEqual(questions['base_url'], 'http://localhost:11434/v1')
+
+    def test_downgrade_under_load_and_budget(self):
+        """The cheaper model is used when busy or close to the user's budget"""
+        from django.contrib.auth import get_user_model
+        from . import llm
+        from .usage import ledger
+        user = get_user_model().objects.create_user(username='router', password='x')
+        user.daily_token_budget = 1000
+        with override_settings(**self.ROUTING):
+            route = llm.get_route('horoscope')
+            self.assertEqual(llm.select_model(route, user), ('big', ''))
+            with llm._track_in_flight(), llm._track_in_flight():
+                self.assertEqual(llm.select_model(route, user), ('small', 'load'))
+            ledger.background = False
+            try:
+                ledger.record('horoscope', 'big', 400, 200, user=user)
+                self.assertEqual(llm.select_model(route, user), ('small', 'budget'))
+            finally:
+                ledger.background = True
+                ledger.flush()
+
+    def test_chat_completion_applies_route(self):
+        """chat_completion sends the routed model and max_tokens"""
+        from types import SimpleNamespace
+        from unittest import mock
+        from . import llm
+        create = mock.Mock(return_value=SimpleNamespace(model='tiny', usage=None))
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        with override_settings(**self.ROUTING), \
+                mock.patch.object(llm, 'get_client', return_value=client) as get_client:
+            llm.chat_completion('coffee', [], stage=llm.QUESTIONS, prompt_cache_key='k')
+        get_client.assert_called_once_with('http://localhost:11434/v1', '')
+        kwargs = create.call_args.kwargs
+        self.assertEqual((kwargs['model'], kwargs['max_tokens']), ('tiny', 100))
+        self.assertNotIn('prompt_cache_key', kwargs)
+
+
+class QuestionGeneratorTest(TestCase):
+    """Test cases for the local continuation-question generator"""
+
+    def test_topics_ranked_by_keyword_hits(self):
+        """Topics mentioned most in the reading come first"""
+        from .question_generator import extract_topics
+        text = "A trip abroad is near. Money flows in, money from a new job, and more money."
+        self.assertEqual(extract_topics(text, 'en'), ['money', 'travel', 'career'])
+        self.assertEqual(extract_topics('در فنجان شما عشق و سفر دیده می‌شود، عشق واقعی', 'fa')[0], 'love')
+
+    def test_common_words_do_not_count_as_topics(self):
+        """'fortune' is not money; 'rest' and 'move' only count as whole words"""
+        from .question_generator import extract_topics
+        self.assertEqual(
+            extract_topics('The Wheel of Fortune brings good fortune to your career and work promotion.', 'en'),
+            ['career'],
+        )
+        self.assertEqual(extract_topics('Restore the movement; dinner at a restaurant.', 'en'), [])
+        self.assertEqual(extract_topics('You need rest before the move.', 'en'), ['health', 'travel'])
+        self.assertEqual(extract_topics('Good fortune: پول زیادی در راه است', 'fa'), ['money'])
+
+    def test_local_questions_padded_and_localized(self):
+        """Three questions in the reading's language, English for other languages"""
+        from .question_generator import QUESTION_TEMPLATES, generate_local_questions
+        questions = generate_local_questions('Deine Gesundheit braucht Ruhe.', 'de')
+        self.assertEqual(len(questions), 3)
+        self.assertEqual(questions[0], QUESTION_TEMPLATES['de']['health'])
+        self.assertEqual(generate_local_questions('', 'sw'), [
+            QUESTION_TEMPLATES['en']['love'], QUESTION_TEMPLATES['en']['money'],
+            QUESTION_TEMPLATES['en']['career'],
+        ])
+
+    def test_local_mode_skips_model_call(self):
+        """In local mode no model call is made"""
+        from unittest import mock
+        from .question_generator import generate_continuation_questions
+        with override_settings(CONTINUATION_QUESTIONS_MODE={'coffee': 'local'}), \
+                mock.patch('main.question_generator.chat_completion') as chat_completion:
+            questions = generate_continuation_questions('coffee', 'en', 'Your love life blooms.')
+        chat_completion.assert_not_called()
+        self.assertEqual(len(questions), 3)
+
+    def test_model_failure_falls_back_to_local(self):
+        """A failed or short model answer is completed by the local generator"""
+        from types import SimpleNamespace
+        from unittest import mock
+        from .question_generator import generate_continuation_questions, generate_local_questions
+        reading = 'Work and career are in focus.'
+        with override_settings(CONTINUATION_QUESTIONS_MODE={'default': 'llm'}):
+            with mock.patch('main.question_generator.chat_completion', side_effect=RuntimeError('timeout')):
+                self.assertEqual(
+                    generate_continuation_questions('dream', 'en', reading),
+                    generate_local_questions(reading, 'en'),
+                )
+            answer = SimpleNamespace(choices=[SimpleNamespace(
+                message=SimpleNamespace(content='1. Wanna hear what your dream hides?')
+            )])
+            with mock.patch('main.question_generator.chat_completion', return_value=answer):
+                questions = generate_continuation_questions('dream', 'en', reading)
+        self.assertEqual(questions[0], 'Wanna hear what your dream hides?')
+        self.assertEqual(len(questions), 3)
+
+
+class SQLiteBenchmarkTest(TestCase):
+    """Test case for the SQLite concurrency benchmark"""
+
+    def test_production_profile_has_no_lock_errors(self):
+        """Concurrent writers with the production profile never hit 'database is locked'"""
+        from .management.commands.sqlite_benchmark import production_profile, run_profile
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stats = run_profile(f'{tmp_dir}/bench.sqlite3', production_profile(), 4, 25)
+        self.assertEqual(stats['errors'], 0)
+        self.assertEqual(stats['committed'], 100)
+
+
+class DatabaseRouterTest(TestCase):
+    """Test cases for primary/replica database routing"""
+
+    def test_reads_use_replica_only_when_opted_in(self):
+        """Only reads inside replica_reads() go to a replica; writes stay on the primary"""
+        from .db_routers import PrimaryReplicaRouter, replica_reads
+        from .models import TarotCard
+        router = PrimaryReplicaRouter()
+        with override_settings(DATABASE_REPLICAS=['replica_0']):
+            self.assertEqual(router.db_for_read(TarotCard), 'default')
+            with replica_reads():
+                self.assertEqual(router.db_for_read(TarotCard), 'replica_0')
+                self.assertEqual(router.db_for_write(TarotCard), 'default')
+            self.assertEqual(router.db_for_read(TarotCard), 'default')
+        with replica_reads():
+            # No replicas configured
+            self.assertEqual(router.db_for_read(TarotCard), 'default')
+        self.assertFalse(router.allow_migrate('replica_0', 'main'))
+
+    def test_mixin_only_routes_safe_methods(self):
+        """ReplicaReadMixin enables replica reads for GET but not for writes"""
+        from rest_framework.response import Response
+        from rest_framework.test import APIRequestFactory
+        from rest_framework.views import APIView
+        from .db_routers import ReplicaReadMixin, _replica_reads
+
+        class ProbeView(ReplicaReadMixin, APIView):
+            permission_classes = []
+
+            def get(self, request):
+                return Response({'replica': _replica_reads.get()})
+
+            def post(self, request):
+                return Response({'replica': _replica_reads.get()})
+
+        factory = APIRequestFactory()
+        self.assertTrue(ProbeView.as_view()(factory.get('/')).data['replica'])
+        self.assertFalse(ProbeView.as_view()(factory.post('/')).data['replica'])
+
+
+class QueryPlanTest(TestCase):
+    """Test that the hot lookups are served by their indexes"""
+
+    def assertUsesIndex(self, queryset, index_name):
+        from django.db import connection
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest(f'No plan check for {connection.vendor}')
+        if connection.vendor == 'postgresql':
+            # Test tables are tiny, so PostgreSQL would otherwise prefer a seq scan
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_cleanup_cutoff_uses_index(self):
+        """cleanup_old_files: created_at__lt=cutoff"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import File
+        cutoff = timezone.now() - timedelta(days=1)
+        self.assertUsesIndex(File.objects.filter(created_at__lt=cutoff), 'main_file_created_at_idx')
+
+    def test_profile_list_uses_index(self):
+        """Profile list: filter(user=...) with the default -created_at ordering"""
+        from .models import CustomUser, FortuneProfile
+        user = CustomUser.objects.create_user(username='planner', password='x')
+        self.assertUsesIndex(FortuneProfile.objects.filter(user=user), 'main_profile_user_created_idx')
+
+    def test_user_list_uses_index(self):
+        """User list: default -date_joined ordering"""
+        from .models import CustomUser
+        self.assertUsesIndex(CustomUser.objects.all(), 'main_user_date_joined_idx')
+
+    def test_deck_fetch_uses_index(self):
+        """Deck fetch and glossary: ordered by order, suit, number"""
+        from .models import TarotCard
+        self.assertUsesIndex(
+            TarotCard.objects.all().order_by('order', 'suit', 'number'), 'main_tarot_deck_order_idx'
+        )
+        self.assertUsesIndex(
+            TarotCard.objects.order_by('order', 'suit', 'number', 'id'), 'main_tarot_deck_order_idx'
+        )
+
+
+class SharedCacheTest(TestCase):
+    """Test cases for the shared cache backend and the two-level cache"""
+
+    def _sqlite_cache(self, tmp_dir):
+        from .cache_backends import SQLiteCache
+        return SQLiteCache(f'{tmp_dir}/cache.sqlite3', {})
+
+    def test_sqlite_cache_operations(self):
+        """add only sets missing keys, incr is atomic across connections, values round-trip"""
+        import threading
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = self._sqlite_cache(tmp_dir)
+            self.assertTrue(cache.add('counter', 0, 60))
+            self.assertFalse(cache.add('counter', 5, 60))
+
+            def bump():
+                for _ in range(50):
+                    cache.incr('counter')
+
+            threads = [threading.Thread(target=bump) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(cache.get('counter'), 200)
+
+            cache.set('payload', {'cards': [1, 2]}, 60)
+            self.assertEqual(cache.get('payload'), {'cards': [1, 2]})
+            with self.assertRaises(ValueError):
+                cache.incr('payload')
+            with self.assertRaises(ValueError):
+                cache.incr('missing')
+
+            cache.set('gone', 1, 0)
+            self.assertIsNone(cache.get('gone'))
+            self.assertTrue(cache.add('gone', 2, 60))
+            self.assertEqual(cache.get('gone'), 2)
+
+    def test_tiered_cache_computes_once(self):
+        """Concurrent misses on one key run the computation once"""
+        import threading
+        import time
+        from .caching import TieredCache
+        tiered = TieredCache(l1_timeout=60)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'deck'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(tiered.get_or_set('test:deck', compute, 60)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['deck'] * 8)
+        self.assertEqual(len(calls), 1)
+        tiered.l1.clear()
+        self.assertEqual(tiered.get('test:deck'), 'deck')  # served from L2
+        tiered.delete('test:deck')
+
+    def test_rate_limit_counts_atomically(self):
+        """The rate limiter allows exactly RATE_LIMIT_PER_MINUTE requests per window"""
+        from django.core.cache import cache
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .middleware import RateLimitMiddleware
+        with override_settings(RATE_LIMIT_PER_MINUTE=3):
+            middleware = RateLimitMiddleware(lambda request: HttpResponse('ok'))
+        request = RequestFactory().get('/api/v1/tarot/cards/', REMOTE_ADDR='203.0.113.7')
+        codes = [middleware(request).status_code for _ in range(4)]
+        cache.delete('rate_limit_203.0.113.7')
+        self.assertEqual(codes, [200, 200, 200, 429])
+
+
+class SingleFlightTest(TestCase):
+    """Test cases for coalescing identical concurrent model calls"""
+
+    def test_concurrent_calls_share_one_result(self):
+        """Identical calls in flight together run the function once"""
+        import threading
+        import time
+        from django.core.cache import cache
+        from .singleflight import SingleFlight, make_key
+        flight = SingleFlight(prefix='test-sf')
+        key = make_key('tarot', [{'role': 'user', 'content': 'The Fool'}])
+        calls = []
+
+        def reading():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'shared reading'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do(key, reading))) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        cache.delete(f'test-sf:{key}:result')
+        self.assertEqual(results, ['shared reading'] * 6)
+        self.assertEqual(len(calls), 1)
+
+    def test_waits_for_other_worker(self):
+        """A call already running in another worker is not repeated"""
+        import threading
+        from django.core.cache import cache
+        from .singleflight import SingleFlight
+        flight = SingleFlight(prefix='test-sf')
+        cache.add('test-sf:abc:lock', 'other-worker', 30)
+
+        def other_worker_finishes():
+            cache.set('test-sf:abc:result', 'from other worker', 10)
+            cache.delete('test-sf:abc:lock')
+
+        timer = threading.Timer(0.1, other_worker_finishes)
+        timer.start()
+        result = flight.do('abc', lambda: self.fail('upstream called twice'))
+        timer.join()
+        cache.delete('test-sf:abc:result')
+        self.assertEqual(result, 'from other worker')
+
+    def test_errors_reach_waiters(self):
+        """Waiters get the leader's exception instead of a result"""
+        from .singleflight import SingleFlight
+
+        def failing():
+            raise RuntimeError('upstream down')
+
+        with self.assertRaises(RuntimeError):
+            SingleFlight(prefix='test-sf').do('err', failing)
+
+
+class DeckIndexTest(TestCase):
+    """Test cases for the in-memory tarot deck index"""
+
+    def setUp(self):
+        from .deck import invalidate
+        from .models import TarotCard
+        invalidate()
+        self.cards = [
+            TarotCard.objects.create(name=name, suit='major', number=number, order=number,
+                                     meaning=f'{name} upright', reversed_meaning=f'{name} reversed')
+            for number, name in enumerate(['The Fool', 'The Magician', 'The High Priestess'])
+        ]
+
+    def tearDown(self):
+        from .deck import invalidate
+        invalidate()
+
+    def test_deck_loaded_once_and_refreshed_on_change(self):
+        """The deck is queried once, and saving a card reloads it"""
+        from .deck import get_deck
+        deck = get_deck()
+        with self.assertNumQueries(0):
+            self.assertIs(get_deck(), deck)
+        fool = self.cards[0]
+        self.assertEqual(
+            [card.id for card in deck.resolve([self.cards[2].id, fool.id])],
+            [self.cards[2].id, fool.id],
+        )
+        with self.assertRaises(KeyError):
+            deck.resolve([fool.id, 999999])
+
+        fool.name = 'The Jester'
+        fool.save()
+        self.assertIsNot(get_deck(), deck)
+        self.assertEqual(get_deck().by_id[fool.id].name, 'The Jester')
+
+    def test_reading_keeps_card_order_without_deck_queries(self):
+        """A tarot reading pairs is_reversed with the requested order and does not query the deck"""
+        from unittest.mock import MagicMock, patch
+        from rest_framework.test import APIClient
+        from .deck import get_deck
+        get_deck()
+        completion = MagicMock()
+        completion.choices[0].message.content = '{"overall_reading": "ok"}'
+        ids = [self.cards[2].id, self.cards[0].id]
+        with patch('main.tarot_views.is_configured', return_value=True), \
+                patch('main.tarot_views.chat_completion', return_value=completion), \
+                self.assertNumQueries(0):
+            response = APIClient().post('/api/v1/tarot/reading/', {
+                'card_ids': ids, 'is_reversed': [True, False],
+                'profile': {'name': 'Ali'}, 'language': 'en',
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        interpretations = response.data['individual_interpretations']
+        self.assertEqual([item['card_id'] for item in interpretations], ids)
+        self.assertEqual(interpretations[0]['interpretation'], 'The High Priestess reversed')
+        self.assertEqual([card['id'] for card in response.data['cards']], ids)
+
+    def test_records_serialize_like_the_model_serializer(self):
+        """serialize_tarot_cards matches TarotCardSerializer field for field"""
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from .deck import get_deck
+        from .serializers import TarotCardSerializer, serialize_tarot_cards
+        fool = self.cards[0]
+        fool.name_en = 'The Fool'
+        fool.names_translations = {'fa': 'احمق', 'xx': 'Fou'}
+        fool.image = 'tarotcards/fool.jpg'
+        fool.save()
+        request = Request(APIRequestFactory().get('/api/v1/tarot/cards/'))
+        deck = get_deck()
+        for language in ('fa', 'xx', 'de', 'unknown'):
+            expected = TarotCardSerializer(
+                self.cards, many=True,
+                context={'request': request, 'language': language, 'image_width': 140, 'image_height': 220},
+            ).data
+            records = deck.resolve([card.id for card in self.cards])
+            actual = serialize_tarot_cards(deck, records, language, request, 140, 220)
+            self.assertEqual(actual, [dict(item) for item in expected])
+
+
+class LanguageNegotiationTest(TestCase):
+    """Test cases for Accept-Language negotiation"""
+
+    def test_q_values_and_region_fallback(self):
+        """Tags are ranked by q-value, regions fall back to their language"""
+        from .language_negotiation import negotiate_language, parse_accept_language
+        self.assertEqual(
+            parse_accept_language('fr;q=0.5, pt-BR, en;q=0.8, de;q=0'),
+            ('pt-br', 'en', 'fr'),
+        )
+        self.assertEqual(negotiate_language('fr;q=0.5, pt-BR, en;q=0.8'), 'pt')
+        self.assertEqual(negotiate_language('xx-YY, fa;q=0.1'), 'fa')
+        self.assertEqual(negotiate_language('fil, nb-NO;q=0.9'), 'no')
+        self.assertEqual(negotiate_language('fa;q=0, *'), None)
+        self.assertEqual(negotiate_language('en;q=abc, ko;q=0.3'), 'ko')
+
+    def test_parser_is_memoized(self):
+        """Repeated headers are parsed once"""
+        from .language_negotiation import negotiate_language
+        header = 'tr-TR,tr;q=0.9,en;q=0.5'
+        negotiate_language(header)
+        hits = negotiate_language.cache_info().hits
+        self.assertEqual(negotiate_language(header), 'tr')
+        self.assertEqual(negotiate_language.cache_info().hits, hits + 1)
+
+    def test_middleware_resolves_once_per_request(self):
+        """The middleware attaches the negotiated language used by get_user_language"""
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .language_negotiation import LanguageNegotiationMiddleware
+        from .language_utils import get_user_language
+        seen = {}
+
+        def view(request):
+            seen['language'] = request.accepted_language
+            seen['user_language'] = get_user_language(None, request)
+            return HttpResponse()
+
+        request = RequestFactory().get('/', HTTP_ACCEPT_LANGUAGE='de-AT;q=0.7, ja;q=0.9')
+        LanguageNegotiationMiddleware(view)(request)
+        self.assertEqual(seen, {'language': 'ja', 'user_language': 'ja'})
+        LanguageNegotiationMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(seen, {'language': None, 'user_language': 'en'})
+
+
+class PromptRegistryTest(TestCase):
+    """Test cases for the file-backed prompt registry"""
+
+    def _registry(self, tmp_dir):
+        import json
+        from pathlib import Path
+        from .prompt_registry import PromptRegistry
+        directory = Path(tmp_dir)
+        (directory / 'index.json').write_text(json.dumps(
+            {'version': 1, 'default_language': 'en', 'languages': ['en', 'fa']}
+        ))
+        for code in ('en', 'fa'):
+            (directory / f'{code}.json').write_text(json.dumps({
+                'version': 1,
+                'coffee': {'system': f'{code} system', 'user': f'{code} read'},
+            }))
+        return PromptRegistry(directory)
+
+    def test_languages_load_lazily_with_fallback(self):
+        """Only requested languages are loaded; unknown ones use the default"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            registry = self._registry(tmp_dir)
+            self.assertEqual(registry.loaded_languages(), [])
+            self.assertEqual(registry.get('fa', 'coffee')['system'], 'fa system')
+            self.assertEqual(registry.loaded_languages(), ['fa'])
+            self.assertEqual(registry.get('xx', 'coffee')['system'], 'en system')
+            self.assertEqual(registry.get('fa', 'coffee')['user'], 'fa read')
+            self.assertIn('fa', registry.codes)
+
+    def test_changed_files_are_reloaded(self):
+        """Editing a language file takes effect without a restart"""
+        import json
+        import os
+        with tempfile.TemporaryDirectory() as tmp_dir, override_settings(PROMPTS_RELOAD_INTERVAL=0):
+            registry = self._registry(tmp_dir)
+            self.assertEqual(registry.get('en', 'coffee')['system'], 'en system')
+            path = f'{tmp_dir}/en.json'
+            with open(path, 'w') as f:
+                json.dump({'version': 1, 'coffee': {'system': 'new system', 'user': 'u'}}, f)
+            os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+            self.assertEqual(registry.get('en', 'coffee')['system'], 'en system')
+            with override_settings(PROMPTS_RELOAD_INTERVAL=1e-9):
+                self.assertEqual(registry.get('en', 'coffee')['system'], 'new system')
+
+    def test_shipped_prompt_files(self):
+        """Every supported language has a coffee catalog; questions fall back to English"""
+        from .language_utils import SUPPORTED_LANGUAGES, get_continuation_question_prompt, get_language_prompts
+        from .prompt_registry import registry
+        self.assertEqual(len(SUPPORTED_LANGUAGES), 53)
+        registry.warmup('*')
+        for code in SUPPORTED_LANGUAGES:
+            self.assertTrue(get_language_prompts(code)['system'])
+        self.assertEqual(get_continuation_question_prompt('sw'), get_continuation_question_prompt('en'))
+        self.assertNotEqual(get_continuation_question_prompt('fa'), get_continuation_question_prompt('en'))
+
+
+class StartupBenchmarkTest(TestCase):
+    """Tests for worker boot cost"""
+
+    def test_heavy_imports_are_deferred(self):
+        """Booting the app and serving a request does not import the SDKs"""
+        from .management.commands.startup_benchmark import DEFERRED_MODULES, profile_startup
+        stats = profile_startup()
+        self.assertEqual(stats['status'], 400)
+        self.assertIn('django', stats['modules'])
+        for name in DEFERRED_MODULES:
+            self.assertNotIn(name, stats['modules'])
+
+
+class LoggingPipelineTest(TestCase):
+    """Tests for the queued logging handlers"""
+
+    def _record(self, name='main', level=logging.INFO, msg='hello %s', args=('world',), exc_info=None):
+        return logging.LogRecord(name, level, __file__, 1, msg, args, exc_info)
+
+    def test_json_formatter(self):
+        """Records become one JSON object per line, with the traceback"""
+        import json
+        import sys
+        from .logging_pipeline import JSONFormatter
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = self._record(level=logging.ERROR, exc_info=sys.exc_info())
+        line = JSONFormatter().format(record)
+        self.assertNotIn('\n', line)
+        entry = json.loads(line)
+        self.assertEqual(entry['message'], 'hello world')
+        self.assertEqual(entry['level'], 'ERROR')
+        self.assertEqual(entry['logger'], 'main')
+        self.assertIn('ValueError: boom', entry['exc_info'])
+
+    def test_sampling_filter(self):
+        """Low-level records are sampled per logger prefix, warnings always pass"""
+        from .logging_pipeline import SamplingFilter
+        sampling = SamplingFilter({'main': 0, 'main.usage': 1})
+        self.assertFalse(sampling.filter(self._record('main')))
+        self.assertFalse(sampling.filter(self._record('main.views')))
+        self.assertTrue(sampling.filter(self._record('main.usage.flush')))
+        self.assertTrue(sampling.filter(self._record('django')))
+        self.assertTrue(sampling.filter(self._record('main', logging.WARNING)))
+
+    def test_queued_handler_writes_and_rotates(self):
+        """Records are written by the listener thread and the file rotates by size"""
+        import json
+        import os
+        from .logging_pipeline import JSONFormatter, QueueListenerHandler
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'app.log')
+            handler = QueueListenerHandler({
+                'class': 'main.logging_pipeline.SharedRotatingFileHandler',
+                'filename': path,
+                'maxBytes': 1000,
+                'backupCount': 2,
+            })
+            handler.setFormatter(JSONFormatter())
+            try:
+                names = ['first']
+                prepared = handler.prepare(self._record(msg='names: %s', args=(names,)))
+                names.append('changed later')
+                self.assertEqual(prepared.getMessage(), "names: ['first']")
+                for i in range(20):
+                    handler.handle(self._record(msg='line %d', args=(i,)))
+                handler.flush()
+            finally:
+                handler.close()
+            self.assertTrue(os.path.exists(path + '.1'))
+            self.assertFalse(os.path.exists(path + '.3'))
+            with open(path) as f:
+                last = [json.loads(line)['message'] for line in f][-1]
+            self.assertEqual(last, 'line 19')
+
+    def test_rotation_by_another_process(self):
+        """A handler whose file was rotated elsewhere reopens it instead of rotating again"""
+        import os
+        from .logging_pipeline import SharedRotatingFileHandler
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'app.log')
+            first = SharedRotatingFileHandler(path, maxBytes=10 ** 6, backupCount=3)
+            second = SharedRotatingFileHandler(path, maxBytes=10 ** 6, backupCount=3)
+            try:
+                first.emit(self._record(msg='before', args=()))
+                first.doRollover()
+                second.doRollover()
+                second.emit(self._record(msg='after', args=()))
+            finally:
+                first.close()
+                second.close()
+            self.assertFalse(os.path.exists(path + '.2'))
+            with open(path + '.1') as f:
+                self.assertEqual(f.read(), 'before\n')
+            with open(path) as f:
+                self.assertEqual(f.read(), 'after\n')
+
+
+class CleanupOldFilesTest(TestCase):
+    """Tests for the batched cleanup_old_files command"""
+
+    def _files(self, old=3, new=1):
+        from datetime import timedelta
+        from django.utils import timezone
+        files = [
+            File.objects.create(image=SimpleUploadedFile(f'cleanup{i}.jpg', b'x', content_type='image/jpeg'))
+            for i in range(old + new)
+        ]
+        File.objects.filter(pk__in=[f.pk for f in files[:old]]).update(
+            created_at=timezone.now() - timedelta(days=40)
+        )
+        return files[:old], files[old:]
+
+    def _run(self, tmp_dir, *args):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command(
+            'cleanup_old_files', '--batch-size', '2',
+            '--checkpoint', os.path.join(tmp_dir, 'checkpoint.json'), *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_deletes_old_rows_and_files_in_batches(self):
+        """Old rows and their files are deleted, newer ones are kept"""
+        old, new = self._files()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = self._run(tmp_dir)
+            self.assertFalse(os.path.exists(os.path.join(tmp_dir, 'checkpoint.json')))
+        self.assertIn('Successfully deleted 3 file(s). Errors: 0', output)
+        self.assertEqual(list(File.objects.values_list('pk', flat=True)), [new[0].pk])
+        for file_obj in old:
+            self.assertFalse(os.path.exists(file_obj.image.path))
+        self.assertTrue(os.path.exists(new[0].image.path))
+        new[0].image.delete()
+
+    def test_dry_run_deletes_nothing(self):
+        old, new = self._files()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = self._run(tmp_dir, '--dry-run')
+        self.assertIn('Found 3 file(s) older than 30 days.', output)
+        self.assertEqual(File.objects.count(), 4)
+        for file_obj in old + new:
+            file_obj.image.delete()
+
+    def test_resumes_from_checkpoint(self):
+        """An interrupted run continues after the last finished batch, with its cutoff"""
+        import json
+        from django.utils import timezone
+        old, new = self._files()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, 'checkpoint.json'), 'w') as f:
+                json.dump({
+                    'cutoff': timezone.now().isoformat(), 'last_pk': old[0].pk,
+                    'deleted': 10, 'errors': 0, 'seconds': 1.0,
+                }, f)
+            output = self._run(tmp_dir, '--days', '90')
+        self.assertIn('Resuming interrupted run', output)
+        self.assertIn('Successfully deleted 13 file(s).', output)
+        self.assertEqual(set(File.objects.values_list('pk', flat=True)), {old[0].pk})
+        old[0].image.delete()
+
+    def test_rows_are_kept_when_file_delete_fails(self):
+        from unittest import mock
+        from django.utils import timezone
+        from .media_maintenance import OldFileCleanup
+        old, new = self._files(old=2, new=0)
+        storage = File._meta.get_field('image').storage
+        real_delete = storage.delete
+
+        def delete(name):
+            if name == old[0].image.name:
+                raise PermissionError('read-only')
+            real_delete(name)
+
+        with mock.patch.object(storage, 'delete', side_effect=delete):
+            result = OldFileCleanup(timezone.now(), batch_size=10, workers=2).run()
+        self.assertEqual((result['deleted'], result['errors']), (1, 1))
+        self.assertEqual(list(File.objects.values_list('pk', flat=True)), [old[0].pk])
+        old[0].image.delete()
+
+
+class ReconcileMediaTest(TempMediaRootMixin, TestCase):
+    """Tests for the reconcile_media command"""
+
+    def setUp(self):
+        super().setUp()
+        self.quarantine = os.path.join(self.tmp_dir, 'quarantine')
+
+    def _write(self, name, age=7200):
+        import time
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'image')
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def _run(self, *args):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('reconcile_media', '--workers', '1', '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def _setup_files(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        self._write('coffee/kept.jpg')
+        self._write('coffee/ab/kept.jpg')
+        File.objects.create(image='coffee/kept.jpg')
+        File.objects.create(image='coffee/ab/kept.jpg')
+        missing = File.objects.create(image='coffee/missing.jpg')
+        File.objects.filter(pk=missing.pk).update(created_at=timezone.now() - timedelta(hours=2))
+        return {
+            'orphan': self._write('coffee/orphan.jpg'),
+            'nested': self._write('coffee/ab/cd/orphan.jpg'),
+            'recent': self._write('coffee/uploading.jpg', age=0),
+        }
+
+    def test_report_only(self):
+        paths = self._setup_files()
+        output = self._run()
+        self.assertIn('Found 2 orphaned file(s)', output)
+        self.assertIn('out of 5 scanned', output)
+        self.assertIn('Found 1 record(s) without a file', output)
+        for path in paths.values():
+            self.assertTrue(os.path.exists(path))
+        self.assertEqual(File.objects.count(), 3)
+
+    def test_delete_orphans_and_missing_rows(self):
+        """Orphans are deleted, recent files and referenced files are kept"""
+        paths = self._setup_files()
+        output = self._run('--delete', '--delete-missing-rows')
+        self.assertIn('Deleted 2 orphaned file(s)', output)
+        self.assertFalse(os.path.exists(paths['orphan']))
+        self.assertFalse(os.path.exists(paths['nested']))
+        self.assertTrue(os.path.exists(paths['recent']))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, 'coffee/kept.jpg')))
+        self.assertFalse(File.objects.filter(image='coffee/missing.jpg').exists())
+        self.assertEqual(File.objects.count(), 2)
+
+    def test_quarantine(self):
+        paths = self._setup_files()
+        self._run('--quarantine', self.quarantine)
+        self.assertFalse(os.path.exists(paths['nested']))
+        self.assertTrue(os.path.exists(os.path.join(self.quarantine, 'coffee/ab/cd/orphan.jpg')))
+        self.assertTrue(os.path.exists(os.path.join(self.quarantine, 'coffee/orphan.jpg')))
+
+    def test_shards_split_at_hash_level(self):
+        """The sharded layout is scanned per YYYY/MM/ab directory, not per year"""
+        from .media_maintenance import MediaReconciler
+        self._write('coffee/legacy.jpg')
+        for name in ('2026/09/ab/cd/a.jpg', '2026/10/ab/cd/b.jpg', '2026/10/ef/01/c.jpg'):
+            self._write(f'coffee/{name}')
+        shards = MediaReconciler(self.media_root).shards()
+        self.assertEqual(
+            sorted(directory for directory, recursive in shards if recursive),
+            ['coffee/2026/09/ab', 'coffee/2026/10/ab', 'coffee/2026/10/ef'],
+        )
+        self.assertIn(('coffee', False), shards)
+        self.assertIn('Found 4 orphaned file(s)', self._run())
+
+
+class ShardedStorageTest(TempMediaRootMixin, TestCase):
+    """Tests for the sharded upload layout and the shard_media command"""
+
+    def test_upload_name_from_date_and_content_hash(self):
+        """Equal content gets the same shard, but never the same file"""
+        import hashlib
+        from django.utils import timezone
+        digest = hashlib.sha256(b'same image').hexdigest()
+        first = File.objects.create(image=SimpleUploadedFile('IMG_1.JPG', b'same image', content_type='image/jpeg'))
+        second = File.objects.create(image=SimpleUploadedFile('IMG_2.jpg', b'same image', content_type='image/jpeg'))
+        now = timezone.now()
+        prefix = f'coffee/{now:%Y}/{now:%m}/{digest[:2]}/{digest[2:4]}/{digest[:32]}'
+        self.assertEqual(first.image.name, f'{prefix}.jpg')
+        self.assertTrue(second.image.name.startswith(prefix))
+        self.assertNotEqual(first.image.name, second.image.name)
+        with first.image.open('rb') as f:
+            self.assertEqual(f.read(), b'same image')
+
+    def test_shard_media_moves_flat_files(self):
+        import hashlib
+        from datetime import datetime, timezone as dt_timezone
+        from io import StringIO
+        from django.core.management import call_command
+        os.makedirs(os.path.join(self.media_root, 'coffee'))
+        with open(os.path.join(self.media_root, 'coffee/IMG_20250208_004903.jpg'), 'wb') as f:
+            f.write(b'old upload')
+        flat = File.objects.create(image='coffee/IMG_20250208_004903.jpg')
+        missing = File.objects.create(image='coffee/gone.jpg')
+        File.objects.filter(pk=flat.pk).update(created_at=datetime(2025, 2, 8, tzinfo=dt_timezone.utc))
+
+        out = StringIO()
+        call_command('shard_media', '--batch-size', '1', '--workers', '1', stdout=out)
+        self.assertIn('Moved 1 file(s). Missing: 1, errors: 0', out.getvalue())
+
+        flat.refresh_from_db()
+        digest = hashlib.sha256(b'old upload').hexdigest()
+        self.assertEqual(flat.image.name, f'coffee/2025/02/{digest[:2]}/{digest[2:4]}/{digest[:32]}.jpg')
+        with flat.image.open('rb') as f:
+            self.assertEqual(f.read(), b'old upload')
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'coffee/IMG_20250208_004903.jpg')))
+        missing.refresh_from_db()
+        self.assertEqual(missing.image.name, 'coffee/gone.jpg')
+
+        out = StringIO()
+        call_command('shard_media', '--dry-run', stdout=out)
+        self.assertIn('1 file(s) to move.', out.getvalue())
+
+
+class UploadWriterTest(TempMediaRootMixin, TestCase):
+    """Tests for background upload writes"""
+
+    def _png(self, name='cup.png'):
+        from io import BytesIO
+        from PIL import Image
+        buffer = BytesIO()
+        Image.new('RGB', (4, 4), 'brown').save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_store_writes_in_background(self):
+        from .uploads import UploadWriter
+        for workers in (2, 0):
+            upload = UploadWriter(workers=workers, max_pending=4).store(self._png())
+            file_obj = upload.result(timeout=5)
+            self.assertEqual(upload.content_type, 'image/png')
+            self.assertTrue(file_obj.image.name.endswith('.png'))
+            with file_obj.image.open('rb') as f:
+                self.assertEqual(f.read(), upload.content)
+            self.assertEqual(File.objects.get(pk=file_obj.pk).image.name, file_obj.image.name)
+
+    def test_renamed_write_updates_row(self):
+        """If the planned name was taken meanwhile, the row follows the stored name"""
+        from unittest import mock
+        from .uploads import UploadWriter
+        with mock.patch.object(UploadWriter, '_write', return_value='coffee/other.png'):
+            upload = UploadWriter(workers=1, max_pending=1).store(self._png())
+            upload.result(timeout=5)
+        self.assertEqual(File.objects.get(pk=upload.file_obj.pk).image.name, 'coffee/other.png')
+
+    def test_failed_write_is_discarded(self):
+        from unittest import mock
+        from .uploads import UploadWriter, discard_uploads
+        with mock.patch.object(UploadWriter, '_write', side_effect=OSError('disk full')):
+            upload = UploadWriter(workers=1, max_pending=1).store(self._png())
+            with self.assertRaises(OSError):
+                upload.result(timeout=5)
+        discard_uploads([upload])
+        self.assertFalse(File.objects.exists())
+
+    def test_coffee_reading_cleans_up_on_model_error(self):
+        """A failed model call removes the stored uploads, as before"""
+        from unittest import mock
+        with mock.patch('main.views.is_configured', return_value=True), \
+                mock.patch('main.views.has_budget', return_value=True), \
+                mock.patch('main.views.chat_completion', side_effect=RuntimeError('upstream down')):
+            response = APIClient().post('/api/v1/coffee-reading/', {'images': [self._png(), self._png('b.png')]})
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(File.objects.exists())
+        stored = [name for _, _, names in os.walk(self.media_root) for name in names]
+        self.assertEqual(stored, [])
+
+
+class ImageDeliveryTest(TempMediaRootMixin, TestCase):
+    """Tests for inline (data URL) and URL image delivery"""
+
+    def _jpeg(self, size):
+        from io import BytesIO
+        from PIL import Image
+        buffer = BytesIO()
+        Image.new('RGB', size, 'brown').save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def test_prepare_image(self):
+        """Large images are downscaled, small ones pass through untouched"""
+        from io import BytesIO
+        from PIL import Image
+        from .vision import prepare_image
+        small = self._jpeg((200, 100))
+        self.assertEqual(prepare_image(small, 'image/jpeg', max_size=512), (small, 'image/jpeg'))
+        content, content_type = prepare_image(self._jpeg((2000, 1000)), 'image/jpeg', max_size=512)
+        self.assertEqual(content_type, 'image/jpeg')
+        self.assertEqual(Image.open(BytesIO(content)).size, (512, 256))
+        self.assertEqual(prepare_image(b'not an image', 'image/png', max_size=512), (b'not an image', 'image/png'))
+
+    def _post(self, mode):
+        from unittest import mock
+        completion = mock.Mock()
+        completion.choices = [mock.Mock(message=mock.Mock(content='A reading'))]
+        image = SimpleUploadedFile('cup.jpg', self._jpeg((1600, 1200)), content_type='image/jpeg')
+        with override_settings(COFFEE_IMAGE_DELIVERY=mode, COFFEE_IMAGE_MAX_SIZE=800), \
+                mock.patch('main.views.is_configured', return_value=True), \
+                mock.patch('main.views.has_budget', return_value=True), \
+                mock.patch('main.views.generate_continuation_questions', return_value=[]), \
+                mock.patch('main.views.chat_completion', return_value=completion) as chat_completion:
+            response = APIClient().post('/api/v1/coffee-reading/', {'images': image})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['content'], 'A reading')
+        messages = chat_completion.call_args[0][1]
+        return messages[1]['content'][0]['image_url']['url']
+
+    def test_inline_delivery(self):
+        """The model gets a resized data URL, and the upload is still stored"""
+        import base64
+        from io import BytesIO
+        from PIL import Image
+        url = self._post('inline')
+        self.assertTrue(url.startswith('data:image/jpeg;base64,'))
+        image = Image.open(BytesIO(base64.b64decode(url.split(',', 1)[1])))
+        self.assertEqual(image.size, (800, 600))
+        file_obj = File.objects.get()
+        self.assertTrue(file_obj.image.storage.exists(file_obj.image.name))
+
+    def test_url_delivery(self):
+        url = self._post('url')
+        file_obj = File.objects.get()
+        self.assertEqual(url, f'http://testserver{file_obj.image.url}')
+
+
+class MediaDeliveryTest(TempMediaRootMixin, TestCase):
+    """Tests for media responses: conditional requests, ranges, front-end offload"""
+
+    media_settings = {'MEDIA_DELIVERY': 'django'}
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'coffee'))
+        with open(os.path.join(self.media_root, 'coffee/cup.jpg'), 'wb') as f:
+            f.write(b'0123456789')
+        self.url = '/media/coffee/cup.jpg'
+
+    def test_full_response_and_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age=', response['Cache-Control'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+        # A range of another version of the file is ignored
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_front_end_offload(self):
+        with override_settings(MEDIA_DELIVERY='nginx', MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/coffee/cup.jpg')
+        self.assertEqual(response.content, b'')
+        with override_settings(MEDIA_DELIVERY='sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, 'coffee/cup.jpg'))
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get('/media/coffee/nope.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/coffee/').status_code, 404)
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+
+    def test_tarot_card_image_rendition(self):
+        """Listed sizes are rendered once and served as files; other sizes are never stored"""
+        from io import BytesIO
+        from unittest.mock import patch
+        from django.core.cache import cache
+        from PIL import Image
+        from .models import TarotCard
+        buffer = BytesIO()
+        Image.new('RGB', (700, 1100), 'navy').save(buffer, 'JPEG')
+        card = TarotCard.objects.create(
+            name='The Star', suit='major', number=17, meaning='hope',
+            image=SimpleUploadedFile('star.jpg', buffer.getvalue(), content_type='image/jpeg'),
+        )
+        directory = os.path.join(self.media_root, 'renditions', 'tarot', str(card.id))
+        base = f'/api/v1/tarot/cards/{card.id}/image/'
+        with override_settings(TAROT_IMAGE_SIZES=['70x110', '140x220'], MEDIA_CACHE_MAX_AGE=3600):
+            url = f'{base}?width=70&height=110'
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Cache-Control'], 'public, max-age=3600, must-revalidate')
+            image = Image.open(BytesIO(b''.join(response.streaming_content)))
+            self.assertEqual(image.size, (70, 110))
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+            # Unlisted sizes are resized in memory and leave nothing on disk
+            for width in range(50, 55):
+                cache.delete('rate_limit_127.0.0.1')  # RATE_LIMIT_PER_MINUTE
+                response = self.client.get(f'{base}?width={width}&height=300')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(Image.open(BytesIO(response.content)).size[0], width)
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+            # Renditions per card are capped
+            with patch('main.tarot_image_views.MAX_RENDITIONS_PER_CARD', 1):
+                self.client.get(f'{base}?width=140&height=220')
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+
+class ConditionalGetTest(TestCase):
+    """Test cases for ETag / 304 responses on read endpoints"""
+
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from rest_framework.test import APIClient
+        from .deck import invalidate
+        from .models import TarotCard
+        invalidate()
+        self.addCleanup(invalidate)
+        self.card = TarotCard.objects.create(name='The Fool', suit='major', number=0, meaning='start')
+        self.user = get_user_model().objects.create_user(username='reader', password='x')
+        self.client = APIClient()
+
+    def get(self, url, **headers):
+        from django.core.cache import cache
+        # More requests than RATE_LIMIT_PER_MINUTE allows
+        cache.delete('rate_limit_127.0.0.1')
+        return self.client.get(url, **headers)
+
+    def assertRevalidates(self, url, **headers):
+        response = self.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.get(url, HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('Cache-Control', response)
+        self.assertIn('Authorization', response['Vary'])
+        return etag
+
+    def test_tarot_cards(self):
+        """The deck is not serialized for a 304, and a card change changes the ETag"""
+        from unittest.mock import patch
+        url = '/api/v1/tarot/cards/?language=fa'
+        etag = self.assertRevalidates(url)
+        response = self.get(url)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+        self.assertNotIn('Accept-Language', response['Vary'])
+        with patch('main.tarot_views.serialize_tarot_cards') as serialize, \
+                patch('main.tarot_views.hot_cache') as cache:
+            self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        serialize.assert_not_called()
+        cache.get_or_set.assert_not_called()
+        self.assertNotEqual(self.get('/api/v1/tarot/cards/?language=en')['ETag'], etag)
+
+        self.card.meaning = 'new beginnings'
+        self.card.save()
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertIn('Accept-Language', self.get('/api/v1/tarot/cards/')['Vary'])
+
+    def test_profiles_list(self):
+        from .models import FortuneProfile
+        self.client.force_authenticate(self.user)
+        profile = FortuneProfile.objects.create(user=self.user, name='Me')
+        etag = self.assertRevalidates('/api/v1/profiles/')
+        response = self.get('/api/v1/profiles/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        with self.assertNumQueries(1):
+            self.get('/api/v1/profiles/', HTTP_IF_NONE_MATCH=etag)
+
+        FortuneProfile.objects.create(user=self.user, name='Friend')
+        self.assertEqual(self.get('/api/v1/profiles/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        etag = self.get('/api/v1/profiles/')['ETag']
+        profile.delete()
+        self.assertEqual(self.get('/api/v1/profiles/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_current_user_and_user_detail(self):
+        self.client.force_authenticate(self.user)
+        etag = self.assertRevalidates('/api/v1/auth/me/')
+        response = self.get('/api/v1/auth/me/')
+        self.assertEqual(
+            self.get('/api/v1/auth/me/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+            304,
+        )
+        self.user.city = 'Tehran'
+        self.user.save()
+        self.assertEqual(self.get('/api/v1/auth/me/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        detail_etag = self.assertRevalidates('/api/v1/users/reader/')
+        self.assertNotEqual(detail_etag, self.get('/api/v1/auth/me/')['ETag'])
+        self.assertEqual(self.get('/api/v1/users/nobody/').status_code, 404)
+
+
+class CompressionTest(TestCase):
+    """Test cases for brotli/gzip response compression"""
+
+    def test_choose_encoding(self):
+        from unittest.mock import patch
+        from . import compression
+        from .compression import choose_encoding
+        self.assertIsNone(choose_encoding(''))
+        self.assertIsNone(choose_encoding('identity'))
+        self.assertEqual(choose_encoding('gzip, deflate'), 'gzip')
+        self.assertIsNone(choose_encoding('gzip;q=0'))
+        self.assertEqual(choose_encoding('*'), compression.available_encodings()[0])
+        with patch.object(compression, 'brotli', None):
+            self.assertEqual(choose_encoding('gzip, br'), 'gzip')
+            self.assertIsNone(choose_encoding('br'))
+        if compression.brotli is not None:
+            self.assertEqual(choose_encoding('gzip, deflate, br'), 'br')
+            self.assertEqual(choose_encoding('br;q=0.5, gzip'), 'gzip')
+
+    def test_middleware(self):
+        import gzip
+        from django.http import HttpResponse, JsonResponse
+        from django.test import RequestFactory
+        from .compression import CompressionMiddleware
+        data = {'reading': 'فال قهوه ' * 200}
+        request = RequestFactory().get('/api/v1/horoscope', HTTP_ACCEPT_ENCODING='gzip')
+
+        def respond(response):
+            return CompressionMiddleware(lambda request: response)(request)
+
+        plain = JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+        body = plain.content
+        plain['ETag'] = '"abc"'
+        response = respond(plain)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), body)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        # Below the threshold, not compressible, or already encoded
+        response = respond(JsonResponse({'ok': True}))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        with override_settings(COMPRESSION_MIN_SIZE=len(body) + 1):
+            self.assertFalse(respond(HttpResponse(body, content_type='application/json')).has_header('Content-Encoding'))
+        self.assertFalse(respond(HttpResponse(b'x' * 5000, content_type='image/jpeg')).has_header('Content-Encoding'))
+        encoded = HttpResponse(b'x' * 5000, content_type='application/json')
+        encoded['Content-Encoding'] = 'br'
+        self.assertEqual(respond(encoded).content, b'x' * 5000)
+
+    def test_tarot_deck_compressed_once(self):
+        """The cached deck holds its compressed encodings; requests only pick one"""
+        import gzip
+        import json
+        from unittest.mock import patch
+        from rest_framework.test import APIClient
+        from . import compression
+        from .deck import invalidate
+        from .models import TarotCard
+        invalidate()
+        self.addCleanup(invalidate)
+        for number in range(22):
+            TarotCard.objects.create(name=f'Card {number}', suit='major', number=number, order=number,
+                                     meaning='معنی ' * 50, names_translations={'fa': f'کارت {number}'})
+        client = APIClient()
+        url = '/api/v1/tarot/cards/?language=fa'
+        response = client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/'))
+        cards = json.loads(gzip.decompress(response.content))['cards']
+        self.assertEqual(len(cards), 22)
+        self.assertEqual(cards[0]['name'], 'کارت 0')
+
+        with patch.object(compression, 'compress') as compress:
+            response = client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(json.loads(gzip.decompress(response.content))['cards'], cards)
+            response = client.get(url)
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertEqual(json.loads(response.content)['cards'], cards)
+        compress.assert_not_called()
+        self.assertEqual(
+            client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304
+        )
+
+
+class JSONRendererTest(TestCase):
+    """Test cases for the orjson renderer and parser"""
+
+    def test_same_output_as_drf(self):
+        import datetime
+        import uuid
+        from decimal import Decimal
+        from django.utils.translation import gettext_lazy
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import ORJSONRenderer
+        data = {
+            'reading': 'فال شما خوب است\u2028',
+            'when': datetime.datetime(2024, 3, 20, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+            'day': datetime.date(2024, 3, 20),
+            'price': Decimal('1.50'),
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'label': gettext_lazy('Active'),
+            1: ['隐者', None, True, 2.5],
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        self.assertEqual(
+            ORJSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+            JSONRenderer().render({'a': 1}, 'application/json; indent=2'),
+        )
+
+    def test_big_integers_and_small_floats(self):
+        """Integers orjson rejects go through DRF; floats keep their value"""
+        import json
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import ORJSONRenderer
+        data = {'big': 2 ** 64, 'small': 1e-7}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(json.loads(ORJSONRenderer().render({'small': 1e-7})), {'small': 1e-7})
+
+    def test_parser(self):
+        from io import BytesIO
+        from rest_framework.exceptions import ParseError
+        from .renderers import ORJSONParser
+        body = '{"language": "fa", "question": "آینده من؟"}'
+        self.assertEqual(
+            ORJSONParser().parse(BytesIO(body.encode())),
+            {'language': 'fa', 'question': 'آینده من؟'},
+        )
+        self.assertEqual(
+            ORJSONParser().parse(BytesIO(body.encode('utf-16')), parser_context={'encoding': 'utf-16'})['question'],
+            'آینده من؟',
+        )
+        for invalid in (b'', b'{"a": ', b'{"a": NaN}'):
+            with self.assertRaises(ParseError):
+                ORJSONParser().parse(BytesIO(invalid))
+
+    def test_benchmark_payloads_render_identically(self):
+        from .management.commands.json_benchmark import run_benchmark, sample_deck, sample_payloads
+        deck, source = sample_deck()
+        self.assertEqual((len(deck), source), (78, 'synthetic'))
+        rows = run_benchmark(sample_payloads(deck), iterations=1)
+        sizes = {(row['payload'], row['renderer']): row['bytes'] for row in rows}
+        for payload in {row['payload'] for row in rows}:
+            self.assertEqual(sizes[payload, 'orjson'], sizes[payload, 'drf'])
+            self.assertLess(sizes[payload, 'drf'], sizes[payload, 'json ascii'])
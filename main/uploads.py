@@ -0,0 +1,178 @@
+"""
+Background persistence of uploaded images.
+
+``upload_writer.store()`` reads an upload into memory, creates its File row
+and hands the write to storage to a small thread pool, returning a
+``PendingUpload`` right away. The request keeps working from the in-memory
+bytes (building the prompt, calling the model) while the file is written,
+and calls ``PendingUpload.result()`` when it needs the stored file.
+
+- Only storage I/O runs on the writer threads; every database write stays on
+  the request thread.
+- The pool is bounded: with UPLOAD_WRITER_QUEUE_SIZE writes in flight, new
+  uploads are written on the request thread instead of queuing without
+  limit. UPLOAD_WRITER_WORKERS = 0 always writes on the request thread.
+- A failed write surfaces from ``result()``; ``discard_uploads`` waits for
+  every write and then deletes rows and files, as ``discard_files`` does.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .media_maintenance import discard_files
+from .models import File
+
+logger = logging.getLogger('main')
+
+
+class PendingUpload:
+    """
+    An upload whose file may still be being written.
+
+    Attributes:
+        file_obj: File row (created before the write finishes)
+        content: Uploaded bytes
+        content_type: Content type sent by the client
+    """
+
+    __slots__ = ('file_obj', 'content', 'content_type', '_future', '_checked')
+
+    def __init__(self, file_obj, content, content_type, future):
+        self.file_obj = file_obj
+        self.content = content
+        self.content_type = content_type
+        self._future = future
+        self._checked = False
+
+    def done(self):
+        return self._future.done()
+
+    def result(self, timeout=None):
+        """
+        Wait for the write.
+
+        Returns:
+            File: The row, pointing at the stored file
+
+        Raises:
+            Exception: Whatever the storage raised
+        """
+        saved_name = self._future.result(timeout)
+        if not self._checked:
+            self._checked = True
+            if saved_name != self.file_obj.image.name:
+                # A concurrent upload took the planned name first
+                File.objects.filter(pk=self.file_obj.pk).update(image=saved_name)
+                self.file_obj.image.name = saved_name
+        return self.file_obj
+
+
+class UploadWriter:
+    """
+    Bounded thread pool writing uploads to the File storage.
+
+    Args:
+        workers: Writer threads (0 = write on the calling thread)
+        max_pending: Writes in flight before callers write themselves
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        self._workers = workers
+        self._max_pending = max_pending
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def workers(self):
+        if self._workers is not None:
+            return self._workers
+        return getattr(settings, 'UPLOAD_WRITER_WORKERS', 4)
+
+    @property
+    def max_pending(self):
+        if self._max_pending is not None:
+            return self._max_pending
+        return getattr(settings, 'UPLOAD_WRITER_QUEUE_SIZE', 32)
+
+    def _get_executor(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Threads do not survive a fork: start a pool per worker process
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='upload-writer'
+                    )
+                    self._slots = threading.BoundedSemaphore(self.max_pending)
+                    self._pid = os.getpid()
+        return self._executor
+
+    @staticmethod
+    def _write(name, content):
+        field = File._meta.get_field('image')
+        return field.storage.save(name, ContentFile(content), max_length=field.max_length)
+
+    def _write_released(self, name, content):
+        try:
+            return self._write(name, content)
+        finally:
+            self._slots.release()
+
+    def store(self, uploaded_file, user=None):
+        """
+        Create the File row for an upload and start writing its file.
+
+        Args:
+            uploaded_file: Validated upload
+            user: Owner, or None
+
+        Returns:
+            PendingUpload
+        """
+        content = b''.join(uploaded_file.chunks())
+        field = File._meta.get_field('image')
+        file_obj = File(user=user)
+        # The name comes from upload_to, which hashes the content
+        file_obj.image = ContentFile(content, name=uploaded_file.name)
+        name = field.generate_filename(file_obj, uploaded_file.name)
+        name = field.storage.get_available_name(name, max_length=field.max_length)
+        file_obj.image = name
+        file_obj.save()
+
+        future = None
+        if self.workers > 0:
+            executor = self._get_executor()
+            if self._slots.acquire(blocking=False):
+                try:
+                    future = executor.submit(self._write_released, name, content)
+                except RuntimeError:
+                    # Interpreter shutting down
+                    self._slots.release()
+        if future is None:
+            future = Future()
+            try:
+                future.set_result(self._write(name, content))
+            except Exception as e:
+                future.set_exception(e)
+        return PendingUpload(file_obj, content, getattr(uploaded_file, 'content_type', None), future)
+
+
+def discard_uploads(uploads):
+    """
+    Undo uploads of a failed request: wait for their writes, then delete the
+    rows and whatever was stored.
+    """
+    for upload in uploads:
+        try:
+            upload.result()
+        except Exception as e:
+            logger.warning("Upload of file %s failed: %s", upload.file_obj.pk, e)
+    discard_files([upload.file_obj for upload in uploads])
+
+
+upload_writer = UploadWriter()
@@ -0,0 +1,397 @@
+"""
+Token usage accounting for OpenAI calls.
+
+Views hand every completion to ``record_completion``. Entries are buffered in
+memory and written by a background thread in batches (one bulk INSERT into
+TokenUsage plus one UPDATE per DailyTokenUsage group), so no request pays
+for its own ledger write.
+
+Per-user daily budgets are checked with ``has_budget`` which only reads a
+cached counter, so the check is O(1) before calling the model.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Sum
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+logger = logging.getLogger('main')
+
+# Seconds a per-user daily counter lives in the cache (a bit more than a day)
+BUDGET_COUNTER_TIMEOUT = 60 * 60 * 26
+
+
+def _budget_cache_key(user_id, day):
+    return f'token_usage_{user_id}_{day.isoformat()}'
+
+
+class UsageLedger:
+    """
+    In-memory buffer of usage entries that is flushed to the database in batches.
+
+    A flush happens every ``flush_interval`` seconds, or as soon as the buffer
+    holds ``flush_size`` entries. Flushing runs on a daemon thread; call
+    ``flush()`` directly to write synchronously (tests, management commands).
+
+    A batch the database rejects (e.g. its user was deleted meanwhile) is
+    written entry by entry, so one bad entry cannot block the rest. Entries
+    that fail for other reasons (database down) are retried ``max_retries``
+    times, and the buffer keeps at most ``max_buffer`` entries; everything
+    dropped is logged.
+    """
+
+    def __init__(self, flush_size=None, flush_interval=None, background=True,
+                 max_buffer=None, max_retries=None):
+        self.flush_size = flush_size or getattr(settings, 'USAGE_FLUSH_SIZE', 50)
+        self.flush_interval = flush_interval or getattr(settings, 'USAGE_FLUSH_INTERVAL', 10)
+        self.max_buffer = max_buffer or getattr(settings, 'USAGE_BUFFER_MAX', 10000)
+        self.max_retries = max_retries or getattr(settings, 'USAGE_FLUSH_MAX_RETRIES', 5)
+        self.background = background
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._buffer = []
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def record(self, endpoint, model, prompt_tokens, completion_tokens,
+               user=None, language='', stage='reading', cached_tokens=0):
+        """
+        Buffer one usage entry and bump the user's cached daily counter.
+
+        Args:
+            endpoint: Endpoint name (e.g. 'coffee', 'tarot')
+            model: Model name reported by the API
+            prompt_tokens: Input tokens billed
+            completion_tokens: Output tokens billed
+            user: Authenticated user or None
+            language: Language code of the reading
+            stage: 'reading' or 'questions'
+            cached_tokens: Input tokens served from the provider's prompt cache
+        """
+        user_id = user.pk if user is not None and user.is_authenticated else None
+        entry = {
+            'user_id': user_id,
+            'endpoint': endpoint,
+            'stage': stage,
+            'language': language or '',
+            'model': model or '',
+            'prompt_tokens': prompt_tokens or 0,
+            'completion_tokens': completion_tokens or 0,
+            'cached_tokens': cached_tokens or 0,
+            'created_at': timezone.now(),
+            'attempts': 0,
+        }
+
+        with self._lock:
+            self._buffer.append(entry)
+            dropped = self._trim()
+            should_wake = len(self._buffer) >= self.flush_size
+        _log_dropped(dropped, 'the buffer is full')
+
+        if user_id is not None:
+            _add_to_budget_counter(user_id, entry['prompt_tokens'] + entry['completion_tokens'])
+
+        if self.background:
+            self._ensure_thread()
+            if should_wake:
+                self._wakeup.set()
+
+    def pending(self):
+        """Number of entries waiting to be flushed"""
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self):
+        """
+        Write all buffered entries to the database.
+
+        Returns:
+            int: Number of entries written
+        """
+        with self._flush_lock:
+            with self._lock:
+                entries, self._buffer = self._buffer, []
+            if not entries:
+                return 0
+            try:
+                _write_entries(entries)
+            except IntegrityError as e:
+                logger.warning("Token usage batch rejected, writing entries one by one: %s", e)
+                return self._write_each(entries)
+            except Exception as e:
+                logger.error("Failed to flush token usage: %s", e, exc_info=True)
+                self._requeue(entries)
+                return 0
+            return len(entries)
+
+    def _write_each(self, entries):
+        written = 0
+        for i, entry in enumerate(entries):
+            try:
+                try:
+                    _write_entries([entry])
+                except IntegrityError:
+                    if entry['user_id'] is None:
+                        raise
+                    # Most likely the user was deleted: keep the usage, unattributed
+                    logger.warning(
+                        "Token usage of missing user %s recorded without a user", entry['user_id']
+                    )
+                    _write_entries([{**entry, 'user_id': None}])
+            except IntegrityError as e:
+                _log_dropped([entry], e)
+                continue
+            except Exception as e:
+                logger.error("Failed to flush token usage: %s", e, exc_info=True)
+                self._requeue(entries[i:])
+                break
+            written += 1
+        return written
+
+    def _requeue(self, entries):
+        """Put entries back for the next flush, dropping those out of retries"""
+        retry, expired = [], []
+        for entry in entries:
+            entry['attempts'] += 1
+            (retry if entry['attempts'] < self.max_retries else expired).append(entry)
+        _log_dropped(expired, f'{self.max_retries} failed flushes')
+        with self._lock:
+            self._buffer[:0] = retry
+            dropped = self._trim()
+        _log_dropped(dropped, 'the buffer is full')
+
+    def _trim(self):
+        # Caller holds self._lock; the oldest entries go first
+        excess = len(self._buffer) - self.max_buffer
+        if excess <= 0:
+            return []
+        dropped = self._buffer[:excess]
+        del self._buffer[:excess]
+        return dropped
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='usage-ledger-flusher', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+
+def _log_dropped(entries, reason):
+    if entries:
+        logger.error(
+            "Dropped %d token usage entries (%s): %s",
+            len(entries), reason,
+            [
+                (entry['user_id'], entry['endpoint'], entry['prompt_tokens'] + entry['completion_tokens'])
+                for entry in entries
+            ],
+        )
+
+
+def _write_entries(entries):
+    """Insert raw entries and fold them into the daily aggregate table"""
+    from .models import DailyTokenUsage, TokenUsage
+
+    groups = defaultdict(lambda: [0, 0, 0, 0])
+    for entry in entries:
+        key = (
+            timezone.localdate(entry['created_at']),
+            entry['user_id'],
+            entry['endpoint'],
+            entry['stage'],
+            entry['language'],
+            entry['model'],
+        )
+        totals = groups[key]
+        totals[0] += 1
+        totals[1] += entry['prompt_tokens']
+        totals[2] += entry['completion_tokens']
+        totals[3] += entry['cached_tokens']
+
+    with transaction.atomic():
+        TokenUsage.objects.bulk_create([
+            TokenUsage(**{field: value for field, value in entry.items() if field != 'attempts'})
+            for entry in entries
+        ])
+
+        for (day, user_id, endpoint, stage, language, model), totals in groups.items():
+            lookup = {
+                'day': day,
+                'user_id': user_id,
+                'endpoint': endpoint,
+                'stage': stage,
+                'language': language,
+                'model': model,
+            }
+            increments = {
+                'requests': F('requests') + totals[0],
+                'prompt_tokens': F('prompt_tokens') + totals[1],
+                'completion_tokens': F('completion_tokens') + totals[2],
+                'cached_tokens': F('cached_tokens') + totals[3],
+            }
+            if DailyTokenUsage.objects.filter(**lookup).update(**increments):
+                continue
+            try:
+                with transaction.atomic():
+                    DailyTokenUsage.objects.create(
+                        requests=totals[0],
+                        prompt_tokens=totals[1],
+                        completion_tokens=totals[2],
+                        cached_tokens=totals[3],
+                        **lookup,
+                    )
+            except IntegrityError:
+                # Another worker created the row first
+                DailyTokenUsage.objects.filter(**lookup).update(**increments)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def _fold_daily_usage_of_deleted_user(sender, instance, **kwargs):
+    """
+    Move a deleted user's aggregates into the anonymous rows.
+
+    DailyTokenUsage.user is SET_NULL, like TokenUsage.user; groups that
+    already have an anonymous row are added to it here, since two anonymous
+    rows for one group violate unique_daily_token_usage_anonymous.
+    """
+    from .models import DailyTokenUsage
+
+    for row in DailyTokenUsage.objects.filter(user_id=instance.pk):
+        updated = DailyTokenUsage.objects.filter(
+            user__isnull=True,
+            day=row.day,
+            endpoint=row.endpoint,
+            stage=row.stage,
+            language=row.language,
+            model=row.model,
+        ).update(
+            requests=F('requests') + row.requests,
+            prompt_tokens=F('prompt_tokens') + row.prompt_tokens,
+            completion_tokens=F('completion_tokens') + row.completion_tokens,
+            cached_tokens=F('cached_tokens') + row.cached_tokens,
+        )
+        if updated:
+            row.delete()
+
+
+def _add_to_budget_counter(user_id, tokens):
+    key = _budget_cache_key(user_id, timezone.localdate())
+    try:
+        cache.incr(key, tokens)
+    except ValueError:
+        # No counter yet: get_tokens_used_today() rebuilds it from the
+        # database and the buffer (which already holds this entry)
+        pass
+
+
+def get_daily_budget(user):
+    """
+    Get the daily token budget for a user.
+
+    Returns:
+        int: Budget in tokens, 0 means unlimited
+    """
+    budget = getattr(user, 'daily_token_budget', None)
+    if budget is None:
+        budget = getattr(settings, 'DEFAULT_DAILY_TOKEN_BUDGET', 0)
+    return budget or 0
+
+
+def get_tokens_used_today(user):
+    """
+    Get the number of tokens a user has consumed today.
+
+    Reads the cached counter; on a cache miss the counter is rebuilt once from
+    DailyTokenUsage plus anything still waiting in the buffer.
+    """
+    day = timezone.localdate()
+    key = _budget_cache_key(user.pk, day)
+    used = cache.get(key)
+    if used is not None:
+        return used
+
+    from .models import DailyTokenUsage
+    totals = DailyTokenUsage.objects.filter(user_id=user.pk, day=day).aggregate(
+        prompt=Sum('prompt_tokens'), completion=Sum('completion_tokens')
+    )
+    used = (totals['prompt'] or 0) + (totals['completion'] or 0)
+    with ledger._lock:
+        used += sum(
+            entry['prompt_tokens'] + entry['completion_tokens']
+            for entry in ledger._buffer
+            if entry['user_id'] == user.pk
+        )
+    cache.add(key, used, BUDGET_COUNTER_TIMEOUT)
+    return used
+
+
+def has_budget(user):
+    """
+    Check whether a user may make another model call today.
+
+    Anonymous users are not tracked per user and always pass (they are
+    limited by RateLimitMiddleware instead).
+    """
+    if user is None or not user.is_authenticated:
+        return True
+    budget = get_daily_budget(user)
+    if not budget:
+        return True
+    return get_tokens_used_today(user) < budget
+
+
+def record_completion(completion, endpoint, user=None, language='', stage='reading'):
+    """
+    Record the ``usage`` block of an OpenAI chat completion.
+
+    Cached input tokens (``usage.prompt_tokens_details.cached_tokens``) are
+    logged and stored so prompt-cache hit rates can be tracked per endpoint.
+
+    Never raises: accounting problems must not break a reading.
+    """
+    try:
+        usage = getattr(completion, 'usage', None)
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+        logger.info(
+            "Prompt cache for %s/%s (%s): %d of %d input tokens cached",
+            endpoint, stage, language, cached_tokens, prompt_tokens,
+        )
+        ledger.record(
+            endpoint=endpoint,
+            stage=stage,
+            model=getattr(completion, 'model', '') or '',
+            prompt_tokens=prompt_tokens,
+            completion_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+            cached_tokens=cached_tokens,
+            user=user,
+            language=language,
+        )
+    except Exception as e:
+        logger.warning("Failed to record token usage: %s", e)
+
+
+ledger = UsageLedger()
+atexit.register(ledger.flush)
@@ -10,11 +10,18 @@ from .user_serializers import (
     UserProfileUpdateSerializer,
     PasswordChangeSerializer
 )
+from .conditional import AUTH_VARY, PRIVATE_REVALIDATE, conditional_response, make_etag
+from .db_routers import read_from_replica
 
 logger = logging.getLogger('main')
 User = get_user_model()
 
 
+def user_etag(user, *parts):
+    """ETag of a serialized user: updated_at covers saved fields, age changes by date"""
+    return make_etag('user', user.pk, user.updated_at, user.age, *parts)
+
+
 class UserRegistrationView(generics.CreateAPIView):
     """
     API endpoint for user registration
@@ -27,7 +34,7 @@ class UserRegistrationView(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
-        logger.info(f"New user registered: {user.username}")
+        logger.info("New user registered: %s", user.username)
         
         return Response(
             {
@@ -69,6 +76,18 @@ class UserDetailView(generics.RetrieveAPIView):
         context['public_profile'] = True
         return context
 
+    def retrieve(self, request, *args, **kwargs):
+        user = self.get_object()
+        return conditional_response(
+            request,
+            lambda: Response(self.get_serializer(user).data),
+            # The avatar URL is absolute, so the host is part of the payload
+            etag=user_etag(user, 'public', request.build_absolute_uri('/')),
+            last_modified=user.updated_at,
+            cache_control=PRIVATE_REVALIDATE,
+            vary=AUTH_VARY,
+        )
+
 
 class PasswordChangeView(APIView):
     """
@@ -86,7 +105,7 @@ class PasswordChangeView(APIView):
             user = request.user
             user.set_password(serializer.validated_data['new_password'])
             user.save()
-            logger.info(f"Password changed for user: {user.username}")
+            logger.info("Password changed for user: %s", user.username)
             
             return Response(
                 {'message': 'رمز عبور با موفقیت تغییر یافت.'},
@@ -96,12 +115,19 @@ class PasswordChangeView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@read_from_replica
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def current_user_view(request):
     """
     API endpoint to get current authenticated user info
     """
-    serializer = UserSerializer(request.user)
-    return Response(serializer.data)
+    return conditional_response(
+        request,
+        lambda: Response(UserSerializer(request.user).data),
+        etag=user_etag(request.user, 'self'),
+        last_modified=request.user.updated_at,
+        cache_control=PRIVATE_REVALIDATE,
+        vary=AUTH_VARY,
+    )
 
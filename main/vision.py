@@ -0,0 +1,89 @@
+"""
+Image delivery to the vision model.
+
+COFFEE_IMAGE_DELIVERY selects how uploads reach the model:
+
+- 'inline': the image is sent in the request as a base64 data URL, built
+  from the uploaded bytes in memory. The model call does not wait for the
+  file to be stored, and no public media URL is needed (works with a
+  localhost MEDIA_ROOT_URL).
+- 'url': the model gets the file's absolute URL and fetches it from this
+  server, so the file must be stored and publicly reachable first.
+
+Inline images are downscaled to COFFEE_IMAGE_MAX_SIZE pixels on the longest
+side (the model works at about that resolution anyway) and re-encoded as
+JPEG, which keeps request bodies small. Images already small enough are
+sent as uploaded.
+"""
+import base64
+import logging
+from io import BytesIO
+
+from django.conf import settings
+
+logger = logging.getLogger('main')
+
+INLINE = 'inline'
+URL = 'url'
+
+# Formats the model accepts as-is
+PASSTHROUGH_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif')
+
+
+def get_delivery_mode():
+    """Configured image delivery: 'inline' or 'url'"""
+    mode = getattr(settings, 'COFFEE_IMAGE_DELIVERY', INLINE)
+    return mode if mode in (INLINE, URL) else INLINE
+
+
+def prepare_image(content, content_type, max_size=None, quality=None):
+    """
+    Downscale an uploaded image for the model.
+
+    Args:
+        content: Uploaded bytes
+        content_type: Content type sent by the client
+        max_size: Longest side in pixels (default COFFEE_IMAGE_MAX_SIZE, 0 = keep)
+        quality: JPEG quality of resized images (default COFFEE_IMAGE_QUALITY)
+
+    Returns:
+        tuple: (bytes, content type)
+    """
+    if max_size is None:
+        max_size = getattr(settings, 'COFFEE_IMAGE_MAX_SIZE', 1024)
+    if quality is None:
+        quality = getattr(settings, 'COFFEE_IMAGE_QUALITY', 85)
+    content_type = content_type if content_type in PASSTHROUGH_TYPES else 'image/jpeg'
+    if not max_size:
+        return content, content_type
+
+    from PIL import Image, ImageOps
+    try:
+        with Image.open(BytesIO(content)) as image:
+            orientation = image.getexif().get(0x0112, 1)
+            if max(image.size) <= max_size and orientation == 1:
+                return content, content_type
+            # JPEG: decode at a reduced scale, much faster than a full decode
+            image.draft('RGB', (max_size, max_size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_size, max_size), Image.LANCZOS)
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            buffer = BytesIO()
+            image.save(buffer, 'JPEG', quality=quality)
+    except Exception as e:
+        # Let the model try the original
+        logger.warning("Could not resize image, sending it as uploaded: %s", e)
+        return content, content_type
+    return buffer.getvalue(), 'image/jpeg'
+
+
+def inline_image_url(content, content_type):
+    """
+    Build a data URL for an uploaded image.
+
+    Returns:
+        str: 'data:<type>;base64,...'
+    """
+    content, content_type = prepare_image(content, content_type)
+    return f"data:{content_type};base64,{base64.b64encode(content).decode('ascii')}"